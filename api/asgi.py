@@ -0,0 +1,177 @@
+"""
+ASGI entry point - the IVR app for self-hosted nodes (uvicorn, hypercorn).
+
+    pip install -r requirements-asgi.txt
+    uvicorn api.asgi:app --host 0.0.0.0 --port 8000 --workers 2
+
+The Plivo webhooks are served natively by AsyncIVRService, so a worker
+keeps answering calls while others wait on Redis or Postgres instead of
+holding a thread each. Every other route is the Flask app from
+api/index.py, mounted through a2wsgi (it runs in a thread pool), so the
+two entry points expose the same API and the same webhook contract.
+
+Native endpoints:
+  POST /api/answer              - Plivo incoming call webhook
+  POST /api/handle-input        - Plivo digit input webhook
+  POST /api/hangup              - Plivo call hangup webhook
+  GET  /api/health/live         - Liveness check (no backend calls)
+"""
+
+import logging
+from contextlib import asynccontextmanager
+from urllib.parse import parse_qs
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Mount, Route
+
+from api.index import app as flask_app
+from services import metrics
+from services.plivo_service import plivo_service
+
+logger = logging.getLogger(__name__)
+
+INVALID_CALL_XML = plivo_service.generate_hangup_xml("Invalid call parameters")
+ANSWER_ERROR_XML = plivo_service.generate_hangup_xml("An error occurred. Please try again later.")
+INVALID_INPUT_PARAMS_XML = plivo_service.generate_speak_only_xml("Invalid input parameters")
+INPUT_ERROR_XML = plivo_service.generate_speak_only_xml("An error occurred processing your input.")
+
+
+def _xml(body):
+    return Response(body, media_type="application/xml")
+
+
+async def _form(request):
+    """Plivo posts application/x-www-form-urlencoded; first value of each field."""
+    fields = parse_qs((await request.body()).decode("utf-8"), keep_blank_values=True)
+    return {name: values[0] for name, values in fields.items()}
+
+
+def _timed(route):
+    """Add the route histogram and Server-Timing header, as api/index.py does for Flask."""
+    def decorate(endpoint):
+        if not metrics.ENABLED:
+            return endpoint
+
+        async def timed_endpoint(request):
+            token = metrics.start_request()
+            response = await endpoint(request)
+            response.headers["Server-Timing"] = metrics.finish_request(
+                token, request.method, route, response.status_code
+            )
+            return response
+        return timed_endpoint
+    return decorate
+
+
+# ===== PLIVO WEBHOOKS =====
+
+@_timed("/api/answer")
+async def answer(request):
+    """Plivo calls this on incoming call."""
+    try:
+        form = await _form(request)
+        call_uuid = form.get('CallUUID')
+        from_number = form.get('From')
+        to_number = form.get('To')
+
+        logger.info(f"ANSWER: CallUUID={call_uuid}, From={from_number}, To={to_number}")
+
+        if not call_uuid or not from_number or not to_number:
+            return _xml(INVALID_CALL_XML)
+
+        from services.admission import check_admission_async
+        shed_xml = await check_admission_async(call_uuid, from_number)
+        if shed_xml is not None:
+            return _xml(shed_xml)
+
+        from services.async_ivr_service import get_async_ivr_service
+        ivr = get_async_ivr_service()
+        return _xml(await ivr.handle_incoming_call(call_uuid, from_number, to_number))
+
+    except Exception as e:
+        logger.error(f"Answer error: {e}", exc_info=True)
+        return _xml(ANSWER_ERROR_XML)
+
+
+@_timed("/api/handle-input")
+async def handle_input(request):
+    """Plivo calls this when user presses a digit."""
+    try:
+        form = await _form(request)
+        call_uuid = form.get('CallUUID')
+        digits = form.get('Digits')
+
+        logger.info(f"INPUT: CallUUID={call_uuid}, Digits={digits}")
+
+        if not call_uuid or not digits:
+            return _xml(INVALID_INPUT_PARAMS_XML)
+
+        from services.async_ivr_service import get_async_ivr_service
+        ivr = get_async_ivr_service()
+        return _xml(await ivr.handle_digit_input(call_uuid, digits))
+
+    except Exception as e:
+        logger.error(f"Handle-input error: {e}", exc_info=True)
+        return _xml(INPUT_ERROR_XML)
+
+
+@_timed("/api/hangup")
+async def hangup(request):
+    """Plivo calls this when the call ends."""
+    try:
+        form = await _form(request)
+        call_uuid = form.get('CallUUID')
+        hangup_cause = form.get('HangupCause')
+        duration = form.get('Duration', 0)
+
+        logger.info(f"HANGUP: CallUUID={call_uuid}, Cause={hangup_cause}, Duration={duration}s")
+
+        if not call_uuid:
+            return Response('', status_code=400)
+
+        try:
+            duration = int(duration)
+        except (ValueError, TypeError):
+            duration = 0
+
+        from services.async_ivr_service import get_async_ivr_service
+        ivr = get_async_ivr_service()
+        await ivr.handle_hangup(call_uuid, hangup_cause, duration)
+
+        return Response('', status_code=200)
+
+    except Exception as e:
+        logger.error(f"Hangup error: {e}", exc_info=True)
+        return Response('', status_code=200)
+
+
+@_timed("/api/health/live")
+async def health_live(request):
+    """Liveness check - no backend calls."""
+    from datetime import datetime
+    return JSONResponse({"status": "alive", "timestamp": datetime.utcnow().isoformat()})
+
+
+# ===== APP =====
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    from services.async_session_store import close_async_session_store
+    from models.database import dispose_async_engine
+    await close_async_session_store()
+    await dispose_async_engine()
+
+
+app = Starlette(
+    routes=[
+        Route('/api/answer', answer, methods=['POST']),
+        Route('/api/handle-input', handle_input, methods=['POST']),
+        Route('/api/hangup', hangup, methods=['POST']),
+        Route('/api/health/live', health_live, methods=['GET']),
+        Mount('/', app=WSGIMiddleware(flask_app)),
+    ],
+    lifespan=lifespan,
+)
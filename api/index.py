@@ -5,7 +5,10 @@ All routes are served through this single Flask app.
 Vercel routes requests here via vercel.json rewrites.
 
 Endpoints:
-  GET  /api/health              - Health check (Redis + Postgres)
+  GET  /api/health              - Readiness check (Redis + Postgres, cached)
+  GET  /api/health/live         - Liveness check (no backend calls)
+  GET  /api/metrics             - Route latency + dependency timings (Prometheus text)
+  GET  /api/warmup              - Build DB engine, Redis client and menu cache (scheduled ping)
   POST /api/webhook-test        - Echo POST data (for testing)
   POST /api/start-session       - Create Redis session
   GET  /api/get-session         - Get session by caller_id
@@ -13,8 +16,15 @@ Endpoints:
   GET  /api/setup-db            - Create database tables (run once)
   POST /api/seed-menus          - Seed default IVR menus (run once)
   POST /api/log-call            - Insert a call record
-  GET  /api/call-logs           - Return all call logs as JSON
-  GET  /api/call-history/<phone>- Return logs for a specific phone number
+  POST /api/log-call/bulk       - Load call records from a JSON array or NDJSON
+  GET  /api/call-logs           - Page through call logs (cursor + filters)
+  GET  /api/call-logs/export    - Stream matching call logs as CSV or NDJSON
+  GET  /api/call-history/<phone>- Caller summary + paged logs for a phone number
+  GET  /api/analytics/funnel    - Menu funnel counts from the daily rollup
+  GET  /api/stats               - Per-minute/hour call metrics from the rollup
+  POST /api/flush-call-logs     - Write queued call records to Postgres (cron)
+  POST /api/maintenance/partitions - Create upcoming call_logs partitions (cron)
+  GET  /api/admission           - Admission control limits, calls in progress, shed counts
   POST /api/answer              - Plivo incoming call webhook
   POST /api/handle-input        - Plivo digit input webhook
   POST /api/hangup              - Plivo call hangup webhook
@@ -29,7 +39,7 @@ from datetime import datetime
 # Add project root to path so imports work
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from flask import Flask, request, Response, jsonify
+from flask import Flask, request, Response, jsonify, g
 
 app = Flask(__name__)
 
@@ -37,46 +47,115 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+# ===== REQUEST METRICS =====
+# Per-route latency histograms and a Server-Timing header with the time
+# spent in Redis, Postgres and XML rendering (see services/metrics.py)
+
+from services import metrics
+
+if metrics.ENABLED:
+    @app.before_request
+    def _start_request_timer():
+        g.metrics_token = metrics.start_request()
+
+    @app.after_request
+    def _finish_request_timer(response):
+        token = g.pop("metrics_token", None)
+        if token is not None:
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            response.headers["Server-Timing"] = metrics.finish_request(
+                token, request.method, route, response.status_code
+            )
+        return response
+
+
 # =============================================
 # PROJECT 1: Basic Flask on Vercel
 # =============================================
 
 @app.route('/api/health', methods=['GET'])
+@app.route('/api/health/ready', methods=['GET'])
 def health():
-    """Health check - tests Redis and Postgres connectivity."""
-    result = {
-        "status": "healthy",
-        "redis": "ok",
-        "postgres": "ok",
-        "timestamp": datetime.utcnow().isoformat(),
-    }
+    """
+    Readiness check - probes Redis and Postgres concurrently, with a timeout
+    and latency for each. Results are cached for HEALTH_CACHE_TTL seconds.
+    """
+    from services.health import check_readiness
+    result = check_readiness()
 
-    # Test Redis
-    try:
-        from services.redis_service import get_redis_service
-        redis_svc = get_redis_service()
-        if not redis_svc.ping():
-            result["redis"] = "error"
-            result["status"] = "unhealthy"
-    except Exception as e:
-        result["redis"] = f"error: {str(e)}"
-        result["status"] = "unhealthy"
+    # Connection acquire timings for this instance (compare DB_POOL_MODE settings)
+    from models.database import get_pool_stats
+    result["postgres_pool"] = get_pool_stats()
 
-    # Test Postgres
-    try:
+    status_code = 200 if result["status"] == "healthy" else 503
+    return jsonify(result), status_code
+
+
+@app.route('/api/health/live', methods=['GET'])
+def health_live():
+    """Liveness check - the process is serving requests. Never touches Redis or Postgres."""
+    return jsonify({"status": "alive", "timestamp": datetime.utcnow().isoformat()})
+
+
+@app.route('/api/warmup', methods=['GET', 'POST'])
+def warmup():
+    """
+    Build everything the call path needs before a call arrives: the
+    Postgres engine (and a pooled connection), the session store client,
+    the menu cache with its pre-rendered XML, and the IVR service. Point a
+    scheduled ping here so /api/answer never runs on a cold instance.
+    """
+    import time
+
+    def connect_postgres():
         from models.database import get_engine
         from sqlalchemy import text
-        engine = get_engine()
-        with engine.connect() as conn:
+        with get_engine().connect() as conn:
             conn.execute(text("SELECT 1"))
-    except Exception as e:
-        result["postgres"] = f"error: {str(e)}"
-        result["status"] = "unhealthy"
 
-    status_code = 200 if result["status"] == "healthy" else 503
+    def connect_session_store():
+        from services.session_store import get_session_store
+        if not get_session_store().ping():
+            raise RuntimeError("ping failed")
+
+    def load_menus():
+        from services.menu_cache import get_menu_cache
+        return len(get_menu_cache().all())
+
+    def build_ivr_service():
+        from services.ivr_service import get_ivr_service
+        get_ivr_service()
+
+    steps = [
+        ("postgres", connect_postgres),
+        ("session_store", connect_session_store),
+        ("menus", load_menus),
+        ("ivr_service", build_ivr_service),
+    ]
+    result = {"status": "warm", "ms": {}, "errors": {}}
+    for name, step in steps:
+        started = time.perf_counter()
+        try:
+            value = step()
+            if value is not None:
+                result[name] = value
+        except Exception as e:
+            logger.error(f"warmup {name} error: {e}")
+            result["errors"][name] = str(e)
+            result["status"] = "partial"
+        result["ms"][name] = round((time.perf_counter() - started) * 1000, 2)
+
+    status_code = 200 if result["status"] == "warm" else 503
     return jsonify(result), status_code
 
 
+@app.route('/api/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Per-route latency histograms and per-dependency timings (Prometheus text format)."""
+    from services.metrics import render_prometheus
+    return Response(render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+
 @app.route('/api/webhook-test', methods=['POST'])
 def webhook_test():
     """Echo back POST data - for testing webhooks."""
@@ -110,8 +189,9 @@ def start_session():
     if not caller_id:
         return jsonify({"error": "caller_id query parameter required"}), 400
 
-    from services.redis_service import get_redis_service
-    redis_svc = get_redis_service()
+    from services.session_store import get_session_store
+    from config import get_config
+    config = get_config()
 
     # Use caller_id as a simple session key
     session_data = {
@@ -119,14 +199,7 @@ def start_session():
         "started_at": datetime.utcnow().isoformat(),
         "caller_id": caller_id,
     }
-
-    import json as json_mod
-    from services.redis_service import _get_redis
-    client = _get_redis()
-    from config import get_config
-    config = get_config()
-    session_key = f"session:{caller_id}"
-    client.setex(session_key, config.SESSION_TTL, json_mod.dumps(session_data))
+    get_session_store().set_json(f"session:{caller_id}", session_data, config.SESSION_TTL)
 
     return jsonify({
         "message": "Session created",
@@ -142,16 +215,12 @@ def get_session_endpoint():
     if not caller_id:
         return jsonify({"error": "caller_id query parameter required"}), 400
 
-    import json as json_mod
-    from services.redis_service import _get_redis
-    client = _get_redis()
-    session_key = f"session:{caller_id}"
-    session_json = client.get(session_key)
+    from services.session_store import get_session_store
+    session_data = get_session_store().get_json(f"session:{caller_id}")
 
-    if session_json is None:
+    if session_data is None:
         return jsonify({"error": "Session not found or expired"}), 404
 
-    session_data = json_mod.loads(session_json) if isinstance(session_json, str) else session_json
     return jsonify({"session": session_data})
 
 
@@ -163,23 +232,21 @@ def update_session():
     if not caller_id or not step:
         return jsonify({"error": "caller_id and step query parameters required"}), 400
 
-    import json as json_mod
-    from services.redis_service import _get_redis
-    client = _get_redis()
+    from services.session_store import get_session_store
     from config import get_config
     config = get_config()
+    store = get_session_store()
 
     session_key = f"session:{caller_id}"
-    session_json = client.get(session_key)
+    session_data = store.get_json(session_key)
 
-    if session_json is None:
+    if session_data is None:
         return jsonify({"error": "Session not found or expired"}), 404
 
-    session_data = json_mod.loads(session_json) if isinstance(session_json, str) else session_json
     session_data["step"] = step
     session_data["updated_at"] = datetime.utcnow().isoformat()
 
-    client.setex(session_key, config.SESSION_TTL, json_mod.dumps(session_data))
+    store.set_json(session_key, session_data, config.SESSION_TTL)
 
     return jsonify({"message": "Session updated", "session": session_data})
 
@@ -222,6 +289,7 @@ def seed_menus():
                 title='Main Menu',
                 message='Welcome to Acme Corp. Press 1 for Sales, Press 2 for Support, or Press 3 to hear your phone number.',
                 digit_actions={'1': 'sales_transfer', '2': 'support_transfer', '3': 'phone_readback'},
+                invalid_input_menu_id='invalid_input',
                 action_type='menu',
             ))
 
@@ -261,11 +329,16 @@ def seed_menus():
                 title='Invalid Input',
                 message='Invalid input. Press 1 for Sales, Press 2 for Support, or Press 3 to hear your phone number.',
                 digit_actions={'1': 'sales_transfer', '2': 'support_transfer', '3': 'phone_readback'},
+                invalid_input_menu_id='invalid_input',
                 action_type='menu',
             ))
 
             db.commit()
 
+            # Tell every warm instance to reload its menu cache
+            from services.menu_cache import get_menu_cache
+            get_menu_cache().bump_version()
+
             menus = db.query(MenuConfiguration).all()
             return jsonify({
                 "message": f"Seeded {len(menus)} menus successfully",
@@ -313,20 +386,69 @@ def log_call():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/api/log-call/bulk', methods=['POST'])
+def log_call_bulk():
+    """
+    Load many call records at once (carrier CDR exports, backfills).
+
+    The body is a JSON array of records or NDJSON (one record per line,
+    Content-Type application/x-ndjson), which is read as a stream. Rows that
+    fail validation are reported by line and skipped; call_uuids already
+    stored are skipped as duplicates. ?finalize=true also updates
+    caller_history and the analytics rollups.
+    """
+    try:
+        from services.call_log_ingest import ingest_call_logs, parse_ndjson
+
+        finalize = request.args.get('finalize', 'false').lower() == 'true'
+        if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+            records = parse_ndjson(request.stream)
+        else:
+            data = request.get_json(silent=True)
+            if not isinstance(data, list):
+                return jsonify({"error": "Expected a JSON array of call records or an NDJSON body"}), 400
+            records = enumerate(data, 1)
+
+        summary = ingest_call_logs(records, finalize=finalize)
+        logger.info(
+            f"Bulk ingest: {summary['inserted']} inserted, {summary['duplicates']} duplicates, "
+            f"{summary['failed']} failed"
+        )
+        return jsonify(summary)
+
+    except Exception as e:
+        logger.error(f"log-call/bulk error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route('/api/call-logs', methods=['GET'])
 def call_logs():
-    """Return all call logs as JSON."""
+    """
+    Return call logs newest first, one page at a time.
+
+    Query params: limit, cursor (next_cursor from the previous page),
+    call_status, hangup_cause, to_number, since, until (ISO timestamps).
+    """
     try:
         from models.database import get_session as db_session
-        from models.call_log import CallLog
+        from services.call_log_query import QueryError, parse_filters, parse_limit, page_call_logs
+
+        try:
+            filters = parse_filters(request.args)
+            limit = parse_limit(request.args)
+        except QueryError as e:
+            return jsonify({"error": str(e)}), 400
 
         db = db_session()
         try:
-            logs = db.query(CallLog).order_by(CallLog.start_time.desc()).limit(100).all()
+            logs, next_cursor = page_call_logs(db, filters, request.args.get('cursor'), limit)
             return jsonify({
                 "count": len(logs),
                 "logs": [log.to_dict() for log in logs],
+                "next_cursor": next_cursor,
             })
+        except QueryError as e:
+            return jsonify({"error": str(e)}), 400
         finally:
             db.close()
 
@@ -335,25 +457,81 @@ def call_logs():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/api/call-logs/export', methods=['GET'])
+def call_logs_export():
+    """
+    Stream every matching call log, oldest first, as CSV (default) or NDJSON.
+
+    Query params: format (csv|ndjson) and the /api/call-logs filters
+    (call_status, hangup_cause, to_number, since, until).
+    """
+    try:
+        from services.call_log_export import FORMATS, stream_call_logs
+        from services.call_log_query import QueryError, parse_filters
+
+        fmt = request.args.get('format', 'csv')
+        if fmt not in FORMATS:
+            return jsonify({"error": f"format must be one of: {', '.join(FORMATS)}"}), 400
+        try:
+            filters = parse_filters(request.args)
+        except QueryError as e:
+            return jsonify({"error": str(e)}), 400
+
+        filename = f"call_logs_{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}.{fmt}"
+        # The WSGI server calls export.close() when it is done with the body,
+        # which returns the connection even if streaming never started
+        export = stream_call_logs(filters, fmt)
+        try:
+            return Response(
+                export,
+                mimetype=FORMATS[fmt],
+                headers={
+                    "Content-Disposition": f'attachment; filename="{filename}"',
+                    "Cache-Control": "no-store",
+                },
+            )
+        except Exception:
+            export.close()
+            raise
+
+    except Exception as e:
+        logger.error(f"call-logs/export error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route('/api/call-history/<phone>', methods=['GET'])
 def call_history(phone):
-    """Return call logs for a specific phone number."""
+    """
+    Return a caller's summary and their call logs, newest first, one page
+    at a time (?limit=, ?cursor= from next_cursor).
+    """
     try:
         from models.database import get_session as db_session
-        from models.call_log import CallLog
+        from models.caller_history import CallerHistory
+        from services.call_log_query import QueryError, parse_limit, page_call_logs
 
         # Handle URL-encoded + sign
         if not phone.startswith('+'):
             phone = f"+{phone}"
 
+        try:
+            limit = parse_limit(request.args)
+        except QueryError as e:
+            return jsonify({"error": str(e)}), 400
+
         db = db_session()
         try:
-            logs = db.query(CallLog).filter_by(from_number=phone).order_by(CallLog.start_time.desc()).all()
+            logs, next_cursor = page_call_logs(db, {"from_number": phone}, request.args.get('cursor'), limit)
+            caller = db.query(CallerHistory).filter_by(phone_number=phone).first()
             return jsonify({
                 "phone": phone,
+                "summary": caller.to_dict() if caller else None,
                 "count": len(logs),
                 "logs": [log.to_dict() for log in logs],
+                "next_cursor": next_cursor,
             })
+        except QueryError as e:
+            return jsonify({"error": str(e)}), 400
         finally:
             db.close()
 
@@ -362,6 +540,154 @@ def call_history(phone):
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/api/analytics/funnel', methods=['GET'])
+def analytics_funnel():
+    """
+    Menu funnel from the pre-aggregated menu_funnel_daily rollup.
+
+    Query params: since, until (YYYY-MM-DD, inclusive; default the last
+    `days` days, 7 unless given), menu_id.
+    """
+    try:
+        from datetime import date
+        from models.database import get_session as db_session
+        from services.call_rollups import default_day_range, read_funnel
+
+        try:
+            days = int(request.args.get('days', 7))
+            if days <= 0:
+                raise ValueError
+        except ValueError:
+            return jsonify({"error": "days must be a positive integer"}), 400
+
+        try:
+            since, until = default_day_range(days)
+            if request.args.get('since'):
+                since = date.fromisoformat(request.args['since'])
+            if request.args.get('until'):
+                until = date.fromisoformat(request.args['until'])
+        except ValueError:
+            return jsonify({"error": "since and until must be dates (YYYY-MM-DD)"}), 400
+
+        db = db_session()
+        try:
+            menus = read_funnel(db, since, until, request.args.get('menu_id'))
+            return jsonify({
+                "since": since.isoformat(),
+                "until": until.isoformat(),
+                "menus": menus,
+            })
+        finally:
+            db.close()
+
+    except Exception as e:
+        logger.error(f"analytics-funnel error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/stats', methods=['GET'])
+def stats():
+    """
+    Call metrics from the per-minute/per-hour rollup: calls and average
+    duration per bucket, duration percentiles, hangup cause and to_number mix.
+
+    Query params: granularity (minute|hour, default minute), since, until
+    (ISO timestamps; default the last 60 minutes or 24 hours).
+    """
+    try:
+        from datetime import timedelta
+        from config import get_config
+        from models.database import get_session as db_session
+        from services.call_rollups import STATS_GRANULARITIES, cached, read_stats, truncate_time
+
+        granularity = request.args.get('granularity', 'minute')
+        if granularity not in STATS_GRANULARITIES:
+            return jsonify({"error": "granularity must be minute or hour"}), 400
+
+        try:
+            until = datetime.fromisoformat(request.args['until']) if request.args.get('until') else None
+            since = datetime.fromisoformat(request.args['since']) if request.args.get('since') else None
+        except ValueError:
+            return jsonify({"error": "since and until must be ISO 8601 timestamps"}), 400
+
+        # Default window ends after the current bucket, so it stays cacheable within a bucket
+        step = STATS_GRANULARITIES[granularity]
+        until = until or truncate_time(datetime.utcnow(), granularity) + step
+        since = since or until - step * (60 if granularity == 'minute' else 24)
+
+        def load():
+            db = db_session()
+            try:
+                return read_stats(db, granularity, since, until)
+            finally:
+                db.close()
+
+        ttl = get_config().STATS_CACHE_TTL
+        response = jsonify(cached((granularity, since, until), ttl, load))
+        response.headers['Cache-Control'] = f"max-age={int(ttl)}"
+        return response
+
+    except Exception as e:
+        logger.error(f"stats error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/flush-call-logs', methods=['GET', 'POST'])
+def flush_call_logs_endpoint():
+    """Insert queued call records into Postgres (CALL_LOG_WRITE_BEHIND). Meant for a cron."""
+    try:
+        from services.call_log_writer import flush_call_logs
+        from services.session_store import get_session_store
+
+        max_batches = request.args.get('max_batches', type=int)
+        stats = flush_call_logs(max_batches=max_batches)
+        stats["queue"] = get_session_store().call_queue_lengths()
+        return jsonify(stats)
+
+    except Exception as e:
+        logger.error(f"flush-call-logs error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/maintenance/partitions', methods=['GET', 'POST'])
+def maintenance_partitions():
+    """
+    Create upcoming call_logs month partitions and list the attached ones.
+    Meant for a daily/monthly cron. Archival writes files, so it runs from
+    scripts/manage_partitions.py instead.
+    """
+    try:
+        from config import get_config
+        from models.database import get_engine
+        from services import partitions
+
+        engine = get_engine()
+        with engine.connect() as conn:
+            if not partitions.is_partitioned(conn, refresh=True):
+                return jsonify({"partitioned": False, "created": [], "partitions": []})
+
+        created = partitions.ensure_partitions(engine, get_config().CALL_LOG_PARTITION_MONTHS_AHEAD)
+        with engine.connect() as conn:
+            names = [name for name, _ in partitions.list_partitions(conn)]
+        return jsonify({"partitioned": True, "created": created, "partitions": names})
+
+    except Exception as e:
+        logger.error(f"maintenance-partitions error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/api/admission', methods=['GET'])
+def admission_endpoint():
+    """Admission control settings, calls in progress and calls shed (across instances)."""
+    try:
+        from services.admission import admission_status
+        return jsonify(admission_status())
+
+    except Exception as e:
+        logger.error(f"admission error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
 # =============================================
 # PROJECT 4: Full IVR Webhooks
 # =============================================
@@ -377,9 +703,15 @@ def answer():
         logger.info(f"ANSWER: CallUUID={call_uuid}, From={from_number}, To={to_number}")
 
         if not call_uuid or not from_number or not to_number:
-            error_xml = '<Response><Speak>Invalid call parameters</Speak><Hangup /></Response>'
+            error_xml = '<Response><Speak>Invalid call parameters</Speak><Hangup/></Response>'
             return Response(error_xml, mimetype='application/xml')
 
+        # Robocall floods: shed over-limit calls before any session or menu work
+        from services.admission import check_admission
+        shed_xml = check_admission(call_uuid, from_number)
+        if shed_xml is not None:
+            return Response(shed_xml, mimetype='application/xml')
+
         from services.ivr_service import get_ivr_service
         ivr = get_ivr_service()
         xml_response = ivr.handle_incoming_call(call_uuid, from_number, to_number)
@@ -388,7 +720,7 @@ def answer():
 
     except Exception as e:
         logger.error(f"Answer error: {e}", exc_info=True)
-        error_xml = '<Response><Speak>An error occurred. Please try again later.</Speak><Hangup /></Response>'
+        error_xml = '<Response><Speak>An error occurred. Please try again later.</Speak><Hangup/></Response>'
         return Response(error_xml, mimetype='application/xml')
 
 
@@ -458,7 +790,10 @@ def index():
         "app": "IVR System on Vercel",
         "status": "running",
         "endpoints": {
-            "GET /api/health": "Health check (Redis + Postgres)",
+            "GET /api/health": "Readiness check (Redis + Postgres, cached; also /api/health/ready)",
+            "GET /api/health/live": "Liveness check (no backend calls)",
+            "GET /api/metrics": "Route latency histograms and Redis/Postgres/XML timings (Prometheus)",
+            "GET /api/warmup": "Pre-build DB engine, Redis client and menu cache",
             "POST /api/webhook-test": "Echo POST data",
             "POST /api/start-session": "Create Redis session (?caller_id=...)",
             "GET /api/get-session": "Get session (?caller_id=...)",
@@ -466,8 +801,15 @@ def index():
             "GET /api/setup-db": "Create database tables (run once)",
             "POST /api/seed-menus": "Seed IVR menus (run once)",
             "POST /api/log-call": "Insert call record",
-            "GET /api/call-logs": "List all call logs",
-            "GET /api/call-history/<phone>": "Call logs for phone number",
+            "POST /api/log-call/bulk": "Load call records from a JSON array or NDJSON (?finalize)",
+            "GET /api/call-logs": "Page through call logs (?limit, cursor, call_status, hangup_cause, to_number, since, until)",
+            "GET /api/call-logs/export": "Stream call logs as CSV/NDJSON (?format, call_status, hangup_cause, to_number, since, until)",
+            "GET /api/call-history/<phone>": "Caller summary + paged call logs (?limit, cursor)",
+            "GET /api/analytics/funnel": "Menu funnel counts (?since, until, days, menu_id)",
+            "GET /api/stats": "Call metrics per minute/hour (?granularity, since, until)",
+            "POST /api/flush-call-logs": "Write queued call records to Postgres (cron)",
+            "POST /api/maintenance/partitions": "Create upcoming call_logs partitions (cron)",
+            "GET /api/admission": "Admission control limits, calls in progress and shed counts",
             "POST /api/answer": "Plivo incoming call webhook",
             "POST /api/handle-input": "Plivo digit input webhook",
             "POST /api/hangup": "Plivo call hangup webhook",
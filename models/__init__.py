@@ -1,9 +1,11 @@
-from models.database import Base, get_engine, get_session, init_db
+from models.database import Base, get_engine, get_session, get_pool_stats, init_db
 from models.call_log import CallLog
 from models.caller_history import CallerHistory
 from models.menu_config import MenuConfiguration
+from models.menu_funnel import MenuFunnelDaily
+from models.call_stats import CallStatsBucket
 
 __all__ = [
-    'Base', 'get_engine', 'get_session', 'init_db',
-    'CallLog', 'CallerHistory', 'MenuConfiguration',
+    'Base', 'get_engine', 'get_session', 'get_pool_stats', 'init_db',
+    'CallLog', 'CallerHistory', 'MenuConfiguration', 'MenuFunnelDaily', 'CallStatsBucket',
 ]
@@ -1,12 +1,23 @@
 """CallLog model - stores information about each completed call."""
 
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, Text, JSON
+from sqlalchemy import Column, Integer, String, DateTime, Text, JSON, Index, text
 from models.database import Base
 
 
 class CallLog(Base):
     __tablename__ = "call_logs"
+    __table_args__ = (
+        # Keyset pagination for /api/call-logs walks (start_time, id); each
+        # filter gets its own index with the sort key behind it so a filtered
+        # page is still a single index range scan.
+        Index("ix_call_logs_start_time_id", "start_time", "id"),
+        Index("ix_call_logs_status_start_time", "call_status", "start_time", "id"),
+        Index("ix_call_logs_hangup_cause_start_time", "hangup_cause", "start_time", "id"),
+        Index("ix_call_logs_to_number_start_time", "to_number", "start_time", "id"),
+        # /api/call-history/<phone>: one caller's calls, newest first
+        Index("ix_call_logs_from_number_start_time", "from_number", text("start_time DESC"), text("id DESC")),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     call_uuid = Column(String(255), unique=True, nullable=False, index=True)
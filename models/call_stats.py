@@ -0,0 +1,33 @@
+"""CallStatsBucket model - per-minute and per-hour call metrics."""
+
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, DateTime, UniqueConstraint
+from models.database import Base
+
+
+class CallStatsBucket(Base):
+    """
+    Call counters for one time bucket and one dimension value, updated as calls are finalized.
+
+    granularity: 'minute' or 'hour' (bucket_start is truncated to it)
+    dimension:   'all' (dimension_value ''), 'hangup_cause', 'to_number', or
+                 'duration_le' (dimension_value is the histogram bucket's upper
+                 bound in seconds, or 'inf'; used for duration percentiles)
+    """
+
+    __tablename__ = "call_stats_buckets"
+    __table_args__ = (
+        UniqueConstraint(
+            "granularity", "bucket_start", "dimension", "dimension_value",
+            name="uq_call_stats_buckets_key",
+        ),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    granularity = Column(String(10), nullable=False)
+    bucket_start = Column(DateTime, nullable=False)
+    dimension = Column(String(20), nullable=False)
+    dimension_value = Column(String(100), nullable=False, default='')
+    calls = Column(Integer, nullable=False, default=0)
+    total_duration = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -1,47 +1,270 @@
 """
 Database connection for Vercel Postgres (Neon).
 
-Key difference from local: Uses NullPool since serverless functions
-don't maintain persistent connection pools between invocations.
+The pooling strategy is picked with DB_POOL_MODE:
+- null: NullPool, a fresh connection per session. Serverless functions
+  don't keep pools between invocations, so this is the default.
+- queue: a small QueuePool with pre-ping and recycle, for warm instances
+  and standalone servers that handle many requests per process.
+- pgbouncer: NullPool against a transaction pooler (e.g. Neon's -pooler
+  host). Server-side prepared statements are turned off because a
+  transaction pooler can hand each statement to a different backend.
+
+get_pool_stats() reports two different costs per process: connect time
+(opening a new connection) and checkout wait (everything connect() on the
+pool takes: waiting for a free connection in a full QueuePool, pre-ping,
+and opening a new connection when needed). With
+METRICS_ENABLED, every statement and new connection is also timed as a
+"postgres" / "postgres_connect" call for services/metrics.py.
+
+get_async_engine() is the asyncio counterpart used by the ASGI app
+(api/asgi.py): the same database through asyncpg (aiosqlite for SQLite),
+with the same pool mode.
 """
 
-from sqlalchemy import create_engine
+import threading
+import time
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy.pool import NullPool
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
 from config import get_config
 
 Base = declarative_base()
 
-# Cache engine per process (Vercel may reuse the process for warm starts)
+POOL_MODES = ("null", "queue", "pgbouncer")
+
+# Cache engine and session factory per process (Vercel may reuse the process for warm starts)
 _engine = None
+_session_factory = None
+_async_engine = None
+
+_stats_lock = threading.Lock()
+_stats = {
+    "connects": 0,
+    "connect_ms_total": 0.0,
+    "connect_ms_max": 0.0,
+    "last_connect_ms": None,
+    "checkouts": 0,
+    "checkout_waits": 0,
+    "checkout_wait_ms_total": 0.0,
+    "checkout_wait_ms_max": 0.0,
+}
+
+
+class _TimedCheckout:
+    """Pool mixin: time each connect(), from asking the pool to holding a connection."""
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            with _stats_lock:
+                _stats["checkout_waits"] += 1
+                _stats["checkout_wait_ms_total"] += elapsed
+                _stats["checkout_wait_ms_max"] = max(_stats["checkout_wait_ms_max"], elapsed)
+
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    pass
+
+
+class TimedNullPool(_TimedCheckout, NullPool):
+    pass
+
+
+def _engine_options(config, url):
+    """create_engine() keyword arguments for the configured pool mode and url's driver."""
+    mode = config.DB_POOL_MODE
+    if mode not in POOL_MODES:
+        raise RuntimeError(f"Unknown DB_POOL_MODE '{mode}' (expected one of: {', '.join(POOL_MODES)})")
+
+    if mode == "queue":
+        return {
+            "poolclass": TimedQueuePool,
+            "pool_size": config.DB_POOL_SIZE,
+            "max_overflow": config.DB_MAX_OVERFLOW,
+            "pool_recycle": config.DB_POOL_RECYCLE,
+            "pool_timeout": config.DB_POOL_TIMEOUT,
+            "pool_pre_ping": True,
+        }
+
+    options = {"poolclass": TimedNullPool}
+    if mode == "pgbouncer":
+        from sqlalchemy.engine import make_url
+
+        driver = make_url(url).drivername
+        if driver in ("postgresql+psycopg", "postgresql+psycopg_async"):
+            # psycopg 3 prepares repeated statements automatically; psycopg2 never does
+            options.setdefault("connect_args", {})["prepare_threshold"] = None
+        elif driver == "postgresql+asyncpg":
+            options.setdefault("connect_args", {})["statement_cache_size"] = 0
+    return options
+
+
+def _record_timings(engine):
+    from services import metrics
+
+    @event.listens_for(engine, "do_connect")
+    def _before_connect(dialect, conn_rec, cargs, cparams):
+        conn_rec.info["connect_started"] = time.perf_counter()
+
+    @event.listens_for(engine, "connect")
+    def _after_connect(dbapi_connection, connection_record):
+        started = connection_record.info.pop("connect_started", None)
+        if started is None:
+            return
+        seconds = time.perf_counter() - started
+        elapsed = seconds * 1000
+        with _stats_lock:
+            _stats["connects"] += 1
+            _stats["connect_ms_total"] += elapsed
+            _stats["connect_ms_max"] = max(_stats["connect_ms_max"], elapsed)
+            _stats["last_connect_ms"] = round(elapsed, 2)
+        metrics.record_dependency("postgres_connect", seconds)
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        with _stats_lock:
+            _stats["checkouts"] += 1
+
+    if not metrics.ENABLED:
+        return
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start_statement(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_statement_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _finish_statement(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["metrics_statement_started"].pop()
+        metrics.record_dependency("postgres", time.perf_counter() - started)
+
+    @event.listens_for(engine, "handle_error")
+    def _failed_statement(context):
+        stack = context.connection.info.get("metrics_statement_started") if context.connection else None
+        if stack:
+            metrics.record_dependency("postgres", time.perf_counter() - stack.pop(), error=True)
 
 
 def get_engine():
-    """Get or create SQLAlchemy engine with NullPool for serverless."""
+    """Get or create the SQLAlchemy engine for the configured DB_POOL_MODE."""
     global _engine
     if _engine is None:
         config = get_config()
         if not config.DATABASE_URL:
             raise RuntimeError("POSTGRES_URL not set. Connect Postgres via Vercel Storage tab.")
-        _engine = create_engine(
-            config.DATABASE_URL,
-            poolclass=NullPool,  # No connection pooling in serverless
-            echo=False,
-        )
+        engine = create_engine(config.DATABASE_URL, echo=False, **_engine_options(config, config.DATABASE_URL))
+        _record_timings(engine)
+        _engine = engine
     return _engine
 
 
+def async_database_url(url):
+    """
+    Map a sync SQLAlchemy URL to its asyncio driver.
+
+    libpq-only query parameters are translated or dropped: asyncpg takes
+    ssl= instead of sslmode= and has no channel_binding option.
+    """
+    from sqlalchemy.engine import make_url
+
+    url = make_url(url)
+    if url.get_backend_name() == "sqlite":
+        return url.set(drivername="sqlite+aiosqlite")
+    if url.get_backend_name() != "postgresql":
+        return url
+
+    query = dict(url.query)
+    sslmode = query.pop("sslmode", None)
+    if sslmode and "ssl" not in query:
+        query["ssl"] = sslmode
+    query.pop("channel_binding", None)
+    return url.set(drivername="postgresql+asyncpg", query=query)
+
+
+def _async_engine_options(config, url):
+    """create_async_engine() keyword arguments; asyncio engines need the asyncio queue pool."""
+    options = _engine_options(config, url)
+    if config.DB_POOL_MODE == "queue":
+        options["poolclass"] = TimedAsyncQueuePool
+    return options
+
+
+def get_async_engine():
+    """Get or create the asyncio engine (ASYNC_POSTGRES_URL, or POSTGRES_URL with an async driver)."""
+    global _async_engine
+    if _async_engine is None:
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        config = get_config()
+        if not config.DATABASE_URL:
+            raise RuntimeError("POSTGRES_URL not set. Connect Postgres via Vercel Storage tab.")
+        url = config.ASYNC_DATABASE_URL or async_database_url(config.DATABASE_URL)
+        engine = create_async_engine(url, echo=False, **_async_engine_options(config, url))
+        _record_timings(engine.sync_engine)
+        _async_engine = engine
+    return _async_engine
+
+
+async def dispose_async_engine():
+    """Close the asyncio engine's connections (ASGI shutdown)."""
+    global _async_engine
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+
+
 def get_session():
     """Create a new database session. Caller must close it."""
-    engine = get_engine()
-    Session = sessionmaker(bind=engine, autocommit=False, autoflush=False)
-    return Session()
+    global _session_factory
+    if _session_factory is None:
+        _session_factory = sessionmaker(bind=get_engine(), autocommit=False, autoflush=False)
+    return _session_factory()
+
+
+def get_pool_stats():
+    """
+    Connection counters for this process: how often a new connection was
+    opened and what it cost, and how long getting a connection from the
+    pool took (with DB_POOL_MODE=queue, mostly waiting for a free one).
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    connects = stats.pop("connect_ms_total")
+    stats["avg_connect_ms"] = round(connects / stats["connects"], 2) if stats["connects"] else None
+    stats["connect_ms_max"] = round(stats["connect_ms_max"], 2)
+    waits, wait_ms = stats.pop("checkout_waits"), stats.pop("checkout_wait_ms_total")
+    stats["avg_checkout_wait_ms"] = round(wait_ms / waits, 2) if waits else None
+    stats["checkout_wait_ms_max"] = round(stats["checkout_wait_ms_max"], 2)
+    # Checkouts that didn't need a new connection were served from the pool
+    stats["reused"] = max(stats["checkouts"] - stats["connects"], 0)
+    stats["mode"] = get_config().DB_POOL_MODE
+    if _engine is not None and not isinstance(_engine.pool, NullPool):
+        stats["pool"] = _engine.pool.status()
+    return stats
 
 
 def init_db():
-    """Create all tables. Call once via /api/setup-db."""
+    """Create all tables and any missing indexes. Call via /api/setup-db (safe to re-run)."""
     # Import models so Base knows about them
     import models.call_log
     import models.caller_history
     import models.menu_config
-    Base.metadata.create_all(bind=get_engine())
+    import models.menu_funnel
+    import models.call_stats
+    engine = get_engine()
+    Base.metadata.create_all(bind=engine)
+    _create_missing_indexes(engine)
+
+
+def _create_missing_indexes(engine):
+    """create_all() skips tables that already exist, so add indexes defined since then."""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
@@ -0,0 +1,40 @@
+"""MenuFunnelDaily model - per-day counts of how callers move through menus."""
+
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, Date, DateTime, UniqueConstraint
+from models.database import Base
+
+# Outcomes counted per (day, menu_id, digit)
+FUNNEL_OUTCOMES = ("entered", "pressed", "exit")
+
+
+class MenuFunnelDaily(Base):
+    """
+    One counter per (day, menu_id, digit, outcome), updated as calls are finalized.
+
+    entered: the call reached the menu (digit is '')
+    pressed: the caller pressed `digit` in the menu
+    exit:    the menu was the last one the call was in (digit is '')
+    """
+
+    __tablename__ = "menu_funnel_daily"
+    __table_args__ = (
+        UniqueConstraint("day", "menu_id", "digit", "outcome", name="uq_menu_funnel_daily_key"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    day = Column(Date, nullable=False)
+    menu_id = Column(String(100), nullable=False)
+    digit = Column(String(10), nullable=False, default='')
+    outcome = Column(String(20), nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'day': self.day.isoformat() if self.day else None,
+            'menu_id': self.menu_id,
+            'digit': self.digit,
+            'outcome': self.outcome,
+            'count': self.count,
+        }
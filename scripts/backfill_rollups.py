@@ -0,0 +1,99 @@
+"""
+Rebuild the analytics rollups (menu funnel, call stats) from call_logs.
+
+Each day in the range is rebuilt in its own transaction: the day's rollup
+rows are deleted, then recomputed from that day's calls. Re-running a day
+is safe. Calls finalized for a day while it is being rebuilt can be missed,
+so backfill finished days (or pause the flusher) rather than today.
+
+Usage:
+    python scripts/backfill_rollups.py                                  # every day with calls
+    python scripts/backfill_rollups.py --since 2026-01-01 --until 2026-01-31
+"""
+
+import os
+import sys
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from models.database import get_engine, get_session, init_db
+from models.call_log import CallLog
+from services.call_rollups import ROLLUPS, rollup_totals, upsert_rollup
+
+CHUNK_SIZE = 500
+
+
+def _row(call):
+    return {
+        "call_uuid": call.call_uuid,
+        "start_time": call.start_time,
+        "duration": call.duration,
+        "hangup_cause": call.hangup_cause,
+        "to_number": call.to_number,
+        "menu_path": call.menu_path,
+        "user_inputs": call.user_inputs,
+    }
+
+
+def backfill_day(db, dialect_insert, day):
+    """Recompute every rollup for one day. Returns the number of calls read."""
+    start = datetime.combine(day, datetime.min.time())
+    end = start + timedelta(days=1)
+
+    calls = [
+        _row(call)
+        for call in db.query(CallLog)
+        .filter(CallLog.start_time >= start, CallLog.start_time < end)
+        .yield_per(1000)
+    ]
+
+    now = datetime.utcnow()
+    for rollup in ROLLUPS:
+        column = getattr(rollup.model, rollup.time_column)
+        lower, upper = (day, day + timedelta(days=1)) if rollup.time_column == "day" else (start, end)
+        db.query(rollup.model).filter(column >= lower, column < upper).delete(synchronize_session=False)
+
+        totals = rollup_totals(rollup, calls)
+        for i in range(0, len(totals), CHUNK_SIZE):
+            db.execute(upsert_rollup(dialect_insert, rollup, totals[i:i + CHUNK_SIZE], now))
+
+    db.commit()
+    return len(calls)
+
+
+def main(args):
+    init_db()  # make sure the rollup tables exist
+    engine = get_engine()
+    dialect_insert = postgresql.insert if engine.dialect.name == "postgresql" else sqlite.insert
+
+    db = get_session()
+    try:
+        if "--since" in args:
+            since = date.fromisoformat(args[args.index("--since") + 1])
+        else:
+            first = db.query(func.min(CallLog.start_time)).scalar()
+            if first is None:
+                print("No calls to backfill")
+                return 0
+            since = first.date()
+        until = date.fromisoformat(args[args.index("--until") + 1]) if "--until" in args else datetime.utcnow().date()
+
+        day = since
+        while day <= until:
+            try:
+                count = backfill_day(db, dialect_insert, day)
+            except Exception:
+                db.rollback()
+                raise
+            print(f"{day.isoformat()}: {count} calls")
+            day += timedelta(days=1)
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,289 @@
+"""
+Offline benchmarks for the IVR hot path: IVRService call handling and the
+PlivoXMLService builders, on one machine with no Neon or Upstash.
+
+Sessions go through the real RedisSessionService (Lua scripts, MULTI/EXEC)
+backed by an in-process fakeredis server, or through the memory store with
+--store memory. Call logs go to a throwaway SQLite file unless --db points
+at a database (e.g. a local Postgres).
+
+For each scenario it reports ops/sec, mean latency, peak memory allocated
+per operation, and Redis commands and SQL statements per operation
+(counted by services/metrics.py). A thresholds file caps round trips (and
+optionally latency); exceeding one fails the run with exit code 1.
+
+Usage:
+    pip install fakeredis                      # Redis stand-in (needs lupa for Lua)
+    python scripts/benchmark_ivr.py
+    python scripts/benchmark_ivr.py --ops 2000 --scenario ivr.digit --storage json
+    python scripts/benchmark_ivr.py --db postgresql+psycopg2://localhost/ivr_bench
+    python scripts/benchmark_ivr.py --json bench.json --thresholds scripts/benchmark_thresholds.json
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+DEFAULT_THRESHOLDS = os.path.join(PROJECT_ROOT, "scripts", "benchmark_thresholds.json")
+
+
+class UsageError(ValueError):
+    pass
+
+
+def _arg(args, name, default=None, cast=str):
+    if name not in args:
+        return default
+    index = args.index(name) + 1
+    if index >= len(args) or args[index].startswith("--"):
+        raise UsageError(f"{name} needs a value")
+    try:
+        return cast(args[index])
+    except ValueError:
+        raise UsageError(f"invalid value for {name}: {args[index]!r}")
+
+
+def _usage():
+    print("Usage: python scripts/benchmark_ivr.py [--ops N] [--warmup N] [--scenario NAME]")
+    print("       [--store redis|memory] [--storage hash|json] [--db URL] [--json PATH] [--thresholds PATH]")
+
+
+def configure(args):
+    """Point config at the local stand-ins. Must run before anything imports config."""
+    store = _arg(args, "--store", "redis")
+    db_url = _arg(args, "--db")
+    if db_url is None:
+        db_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='ivr-bench-'), 'bench.db')}"
+
+    os.environ["POSTGRES_URL"] = db_url
+    os.environ["SESSION_BACKEND"] = store
+    os.environ["SESSION_STORAGE"] = _arg(args, "--storage", "hash")
+    os.environ["METRICS_ENABLED"] = "true"
+    os.environ["CALL_LOG_WRITE_BEHIND"] = "false"
+    # admission.* scenarios call the check directly; the ivr.* ones never reach it
+    os.environ["ADMISSION_CONTROL_ENABLED"] = "true"
+    os.environ["ADMISSION_MAX_ACTIVE_CALLS"] = "0"
+    os.environ.setdefault("MENU_ARTIFACT_PATH", "")
+    # The menu version check is periodic, not per call; one landing mid-run
+    # would add a fraction of a Redis command to whichever scenario was running
+    os.environ["MENU_VERSION_CHECK_INTERVAL"] = "3600"
+
+    if store == "redis":
+        try:
+            import fakeredis
+        except ImportError:
+            sys.exit("The Redis stand-in needs fakeredis: pip install fakeredis (or use --store memory)")
+        import services.redis_service as redis_service
+        redis_service._tcp_client = redis_service.TcpRedisClient(fakeredis.FakeRedis(decode_responses=True))
+    return store, db_url
+
+
+# ===== SCENARIOS =====
+# Each scenario is (setup, op): setup(i) runs untimed and returns op's argument.
+
+def build_scenarios():
+    from services.ivr_service import get_ivr_service
+    from services.menu_cache import get_menu_cache
+    from services.plivo_service import plivo_service
+    from services.admission import check_admission
+    from config import get_config
+
+    ivr = get_ivr_service()
+    action_url = get_config().HANDLE_INPUT_URL
+    main_menu = get_menu_cache().get("main_menu")
+
+    def new_call(i):
+        call_uuid = f"bench-{uuid.uuid4()}"
+        ivr.handle_incoming_call(call_uuid, f"+1555{i:07d}", "+18005550100")
+        return call_uuid
+
+    def fresh_uuid(i):
+        return f"bench-{uuid.uuid4()}", f"+1555{i:07d}"
+
+    def repeat_caller(i):
+        # After the first ADMISSION_CALLER_BURST calls (warmup), every one is shed
+        return f"bench-{uuid.uuid4()}", "+15550000000"
+
+    def lifecycle(args):
+        call_uuid, from_number = args
+        ivr.handle_incoming_call(call_uuid, from_number, "+18005550100")
+        ivr.handle_digit_input(call_uuid, "9")
+        ivr.handle_digit_input(call_uuid, "1")
+        ivr.handle_hangup(call_uuid, "NORMAL_CLEARING", 42)
+
+    def write_behind_hangup(call_uuid):
+        ivr.config.CALL_LOG_WRITE_BEHIND = True
+        try:
+            ivr.handle_hangup(call_uuid, "NORMAL_CLEARING", 42)
+        finally:
+            ivr.config.CALL_LOG_WRITE_BEHIND = False
+
+    return {
+        "xml.menu": (lambda i: None, lambda _: plivo_service.generate_menu_xml(
+            "Press 1 for sales, 2 for support & 3 for your number.", 10, 1, action_url)),
+        "xml.transfer": (lambda i: None, lambda _: plivo_service.generate_transfer_xml(
+            "+18005550199", 30, "Connecting you to sales.")),
+        "xml.hangup": (lambda i: None, lambda _: plivo_service.generate_hangup_xml("Thank you for calling.")),
+        "xml.prerender_menu": (lambda i: None, lambda _: plivo_service.prerender_menu_responses(main_menu, action_url)),
+        "ivr.incoming": (fresh_uuid, lambda args: ivr.handle_incoming_call(args[0], args[1], "+18005550100")),
+        "ivr.digit": (new_call, lambda call_uuid: ivr.handle_digit_input(call_uuid, "1")),
+        "ivr.digit_invalid": (new_call, lambda call_uuid: ivr.handle_digit_input(call_uuid, "9")),
+        "ivr.hangup": (new_call, lambda call_uuid: ivr.handle_hangup(call_uuid, "NORMAL_CLEARING", 42)),
+        "ivr.hangup_write_behind": (new_call, write_behind_hangup),
+        "ivr.call_lifecycle": (fresh_uuid, lifecycle),
+        "admission.admit": (fresh_uuid, lambda args: check_admission(*args)),
+        "admission.shed": (repeat_caller, lambda args: check_admission(*args)),
+    }
+
+
+def run_scenario(setup, op, ops, warmup):
+    """Time `ops` calls of op, then measure allocations and round trips over a second pass."""
+    from services import metrics
+
+    for i in range(warmup):
+        op(setup(i))
+
+    inputs = [setup(warmup + i) for i in range(ops)]
+    elapsed = 0.0
+    for arg in inputs:
+        started = time.perf_counter()
+        op(arg)
+        elapsed += time.perf_counter() - started
+
+    # Second pass under tracemalloc and a metrics "request" per op; both
+    # slow things down, so they are kept out of the timing above
+    inputs = [setup(warmup + ops + i) for i in range(ops)]
+    round_trips = {}
+    peak_total = 0
+    tracemalloc.start()
+    for arg in inputs:
+        token = metrics.start_request()
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+        op(arg)
+        _, peak = tracemalloc.get_traced_memory()
+        peak_total += peak - baseline
+        for name, (calls, _) in metrics.request_timings().items():
+            round_trips[name] = round_trips.get(name, 0) + calls
+        metrics.finish_request(token, "BENCH", "benchmark", 200)
+    tracemalloc.stop()
+
+    return {
+        "ops": ops,
+        "ops_per_sec": round(ops / elapsed, 1) if elapsed else None,
+        "mean_us": round(elapsed / ops * 1e6, 1),
+        "alloc_peak_kb_per_op": round(peak_total / ops / 1024, 2),
+        "redis_per_op": round(round_trips.get("redis", 0) / ops, 2),
+        "postgres_per_op": round(
+            (round_trips.get("postgres", 0) + round_trips.get("postgres_connect", 0)) / ops, 2
+        ),
+    }
+
+
+ROUND_TRIP_KEYS = ("redis_per_op", "postgres_per_op")
+
+
+def check_thresholds(results, thresholds, dialect):
+    """
+    Return a message for every measured value above its limit (below, for
+    ops_per_sec). A limit may be a {dialect: limit} mapping, e.g. for
+    postgres_per_op, which differs between SQLite and Postgres; dialects
+    it doesn't list aren't checked. A scenario's "tolerance" is added to
+    every round-trip limit.
+    """
+    failures = []
+    for scenario, limits in thresholds.items():
+        result = results.get(scenario)
+        if result is None:
+            continue
+        tolerance = limits.get("tolerance", 0)
+        for key, limit in limits.items():
+            if key == "tolerance":
+                continue
+            if isinstance(limit, dict):
+                limit = limit.get(dialect)
+            value = result.get(key)
+            if value is None or limit is None:
+                continue
+            if key == "ops_per_sec":
+                if value < limit:
+                    failures.append(f"{scenario}: ops_per_sec {value} < {limit}")
+                continue
+            if key in ROUND_TRIP_KEYS:
+                limit += tolerance
+            if value > limit:
+                failures.append(f"{scenario}: {key} {value} > {limit}")
+    return failures
+
+
+def main(args):
+    try:
+        store, db_url = configure(args)
+        ops = _arg(args, "--ops", 500, int)
+        warmup = _arg(args, "--warmup", 20, int)
+        selected = _arg(args, "--scenario")
+        json_path = _arg(args, "--json")
+        thresholds_path = _arg(args, "--thresholds", DEFAULT_THRESHOLDS)
+        if ops <= 0 or warmup < 0:
+            raise UsageError("--ops must be positive and --warmup can't be negative")
+    except UsageError as e:
+        print(f"Error: {e}")
+        _usage()
+        return 2
+
+    from api.index import app
+    client = app.test_client()
+    for path, method in (("/api/setup-db", "get"), ("/api/seed-menus", "post")):
+        response = getattr(client, method)(path)
+        if response.status_code != 200:
+            sys.exit(f"{path} failed: {response.get_data(as_text=True)[:200]}")
+
+    import logging
+    logging.disable(logging.INFO)  # the IVR logs every call; keep it out of the timings
+
+    scenarios = build_scenarios()
+
+    print(f"\nstore={store} storage={os.environ['SESSION_STORAGE']} db={db_url.split('://', 1)[0]} ops={ops}\n")
+    print(f"  {'scenario':<26} {'ops/s':>10} {'mean us':>10} {'alloc kb':>9} {'redis/op':>9} {'sql/op':>7}")
+    results = {}
+    for name, (setup, op) in scenarios.items():
+        if selected and name != selected:
+            continue
+        result = results[name] = run_scenario(setup, op, ops, warmup)
+        print(f"  {name:<26} {result['ops_per_sec']:>10} {result['mean_us']:>10} "
+              f"{result['alloc_peak_kb_per_op']:>9} {result['redis_per_op']:>9} {result['postgres_per_op']:>7}")
+
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump({"store": store, "storage": os.environ["SESSION_STORAGE"], "results": results}, f, indent=2)
+
+    if not os.path.exists(thresholds_path):
+        return 0
+    with open(thresholds_path) as f:
+        thresholds = json.load(f)
+    # Round-trip limits describe the Redis-backed store; the memory store makes none
+    if store != "redis":
+        thresholds = {
+            scenario: {key: value for key, value in limits.items() if key != "redis_per_op"}
+            for scenario, limits in thresholds.items()
+        }
+    from sqlalchemy.engine import make_url
+    failures = check_thresholds(results, thresholds, make_url(db_url).get_backend_name())
+    if failures:
+        print("\nThreshold failures:")
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+    print(f"\nAll thresholds in {os.path.relpath(thresholds_path)} met")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,52 @@
+"""
+Compile the IVR menu graph into a static routing artifact.
+
+Loads every MenuConfiguration row from Postgres, validates the graph
+(dangling targets, unreachable menus, cycles without an exit, transfers
+without a number) and writes a flat transition table. Deploy the file with
+the app and set MENU_ARTIFACT_PATH to serve menus without touching Postgres.
+
+Usage:
+    POSTGRES_URL=... python scripts/compile_menus.py [output_path]
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.database import get_session
+from models.menu_config import MenuConfiguration
+from services.menu_cache import MenuSnapshot
+from services.menu_graph import DEFAULT_ARTIFACT_PATH, MenuGraphError, compile_menus, write_artifact
+
+
+def load_menus():
+    db = get_session()
+    try:
+        rows = db.query(MenuConfiguration).all()
+        return {row.menu_id: MenuSnapshot.from_model(row) for row in rows}
+    finally:
+        db.close()
+
+
+def main(output_path):
+    menus = load_menus()
+    print(f"Loaded {len(menus)} menus")
+
+    try:
+        artifact = compile_menus(menus)
+    except MenuGraphError as e:
+        print(f"\nMenu graph has {len(e.problems)} problem(s):")
+        for problem in e.problems:
+            print(f"  - {problem}")
+        return 1
+
+    write_artifact(artifact, output_path)
+    print(f"Wrote {output_path} (version {artifact['version']})")
+    return 0
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_ARTIFACT_PATH
+    sys.exit(main(path))
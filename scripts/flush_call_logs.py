@@ -0,0 +1,45 @@
+"""
+Drain the write-behind call record queue into Postgres.
+
+Use on long-running hosts instead of (or alongside) the /api/flush-call-logs
+cron. Only one flusher runs at a time; extra copies just skip.
+
+Usage:
+    python scripts/flush_call_logs.py                 # flush once
+    python scripts/flush_call_logs.py --loop 5        # flush every 5 seconds
+    python scripts/flush_call_logs.py --replay-dead   # retry dead-lettered records
+"""
+
+import os
+import sys
+import time
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.call_log_writer import flush_call_logs
+from services.session_store import get_session_store
+
+logging.basicConfig(level=logging.INFO)
+
+
+def main(args):
+    store = get_session_store()
+
+    if "--replay-dead" in args:
+        print(f"Moved {store.replay_dead_call_records()} dead-lettered records back to the queue")
+
+    interval = None
+    if "--loop" in args:
+        interval = float(args[args.index("--loop") + 1])
+
+    while True:
+        stats = flush_call_logs()
+        print(f"{stats} queue={store.call_queue_lengths()}")
+        if interval is None:
+            return 0
+        time.sleep(interval)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,75 @@
+"""
+Manage monthly partitions of call_logs (Postgres only).
+
+Usage:
+    python scripts/manage_partitions.py status
+    python scripts/manage_partitions.py migrate                  # one-off: partition an existing call_logs
+    python scripts/manage_partitions.py ensure [--months 3]      # create upcoming partitions
+    python scripts/manage_partitions.py archive [--retention 12] [--out archive] [--drop]
+    python scripts/manage_partitions.py attach call_logs_p2025_01
+    python scripts/manage_partitions.py restore archive/call_logs_p2025_01.ndjson.gz
+"""
+
+import os
+import sys
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import get_config
+from models.database import get_engine
+from services import partitions
+
+logging.basicConfig(level=logging.INFO)
+
+
+def _option(args, name, default):
+    return args[args.index(name) + 1] if name in args else default
+
+
+def main(args):
+    if not args:
+        print(__doc__)
+        return 1
+
+    config = get_config()
+    engine = get_engine()
+    command = args[0]
+
+    if command == "status":
+        with engine.connect() as conn:
+            if not partitions.is_partitioned(conn, refresh=True):
+                print("call_logs is not partitioned")
+                return 0
+            for name, _ in partitions.list_partitions(conn):
+                print(name)
+    elif command == "migrate":
+        moved = partitions.migrate_to_partitioned(engine, int(_option(args, "--months", config.CALL_LOG_PARTITION_MONTHS_AHEAD)))
+        print(f"Copied {moved} rows; drop call_logs_legacy once you have checked the new table")
+    elif command == "ensure":
+        created = partitions.ensure_partitions(engine, int(_option(args, "--months", config.CALL_LOG_PARTITION_MONTHS_AHEAD)))
+        print(f"Created: {', '.join(created) or 'nothing'}")
+    elif command == "archive":
+        archived = partitions.archive_partitions(
+            engine,
+            int(_option(args, "--retention", config.CALL_LOG_RETENTION_MONTHS)),
+            _option(args, "--out", config.CALL_LOG_ARCHIVE_DIR),
+            drop="--drop" in args,
+        )
+        for item in archived:
+            print(f"{item['partition']}: {item['rows']} rows -> {item['file']} ({item['action']})")
+        if not archived:
+            print("Nothing older than the retention window")
+    elif command == "attach":
+        partitions.attach_partition(engine, args[1])
+        print(f"Attached {args[1]}")
+    elif command == "restore":
+        print(f"Restored {partitions.restore_archive(engine, args[1])} rows from {args[1]}")
+    else:
+        print(__doc__)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
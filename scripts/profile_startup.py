@@ -0,0 +1,106 @@
+"""
+Measure cold-start cost: how long `import api.index` takes in a fresh
+interpreter and how long the first request takes after it.
+
+Every run starts a new Python process, so each one is a true cold start
+(aside from the OS file cache). Uses the current environment, so set
+POSTGRES_URL / KV_* / SESSION_BACKEND as the deployment would.
+
+Usage:
+    python scripts/profile_startup.py                    # 5 runs, first request = GET /api/warmup
+    python scripts/profile_startup.py --runs 10
+    python scripts/profile_startup.py --path /api/health
+    python scripts/profile_startup.py --answer           # first request = synthetic /api/answer
+    python scripts/profile_startup.py --importtime       # slowest packages (python -X importtime)
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child process; prints one JSON line with its timings
+CHILD = """
+import json, sys, time, uuid
+started = time.perf_counter()
+from api.index import app
+import_ms = (time.perf_counter() - started) * 1000
+
+path, answer = sys.argv[1], sys.argv[2] == "1"
+client = app.test_client()
+timings = []
+for _ in range(2):
+    call_uuid = str(uuid.uuid4())
+    started = time.perf_counter()
+    if answer:
+        response = client.post("/api/answer", data={"CallUUID": call_uuid, "From": "+15550000000", "To": "+15550000001"})
+    else:
+        response = client.get(path)
+    timings.append((time.perf_counter() - started) * 1000)
+    if answer:
+        from services.session_store import get_session_store
+        get_session_store().delete_session(call_uuid)
+
+print(json.dumps({"import_ms": import_ms, "first_ms": timings[0], "second_ms": timings[1], "status": response.status_code}))
+"""
+
+
+def run_once(path, answer):
+    proc = subprocess.run(
+        [sys.executable, "-c", CHILD, path, "1" if answer else "0"],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip())
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def show_importtime(limit=15):
+    """Print the slowest packages loaded by api.index and the modules its routes import."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c",
+         "import api.index, services.ivr_service, services.call_log_writer, models"],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+    )
+    # Keep the outermost (largest cumulative) entry for each top-level package
+    packages = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line.split(":", 1)[1].split("|")
+        package = name.strip().split(".")[0]
+        packages[package] = max(packages.get(package, 0), int(cumulative_us))
+
+    print(f"{'cumulative ms':>14}  package")
+    for package, cumulative_us in sorted(packages.items(), key=lambda item: -item[1])[:limit]:
+        print(f"{cumulative_us / 1000:>14.1f}  {package}")
+
+
+def main(args):
+    if "--importtime" in args:
+        show_importtime()
+        return 0
+
+    runs = int(args[args.index("--runs") + 1]) if "--runs" in args else 5
+    path = args[args.index("--path") + 1] if "--path" in args else "/api/warmup"
+    answer = "--answer" in args
+    target = "POST /api/answer" if answer else f"GET {path}"
+
+    results = [run_once(path, answer) for _ in range(runs)]
+    print(f"{runs} cold starts, first request = {target} (last status {results[-1]['status']})")
+    print(f"{'':>12}  {'median':>8}  {'min':>8}  {'max':>8}")
+    for key, label in (("import_ms", "import"), ("first_ms", "1st request"), ("second_ms", "2nd request")):
+        values = [result[key] for result in results]
+        print(f"{label:>12}  {statistics.median(values):>8.1f}  {min(values):>8.1f}  {max(values):>8.1f}  ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
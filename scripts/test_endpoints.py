@@ -3,13 +3,40 @@ Test script for Vercel-deployed IVR endpoints.
 
 Usage:
     python scripts/test_endpoints.py https://your-project.vercel.app
+
+Load mode simulates whole calls against any base URL (a deployment or a
+local `flask --app api/index run`): /api/answer, then /api/handle-input
+with digits drawn from --digits and exponential think times until the
+call leaves the menus (or --max-inputs), then /api/hangup. Calls arrive as
+a Poisson process at --rate calls/second (or back to back without
+--rate), with at most --concurrency in flight. Seed menus first.
+
+    python scripts/test_endpoints.py http://localhost:5000 --load \
+        --concurrency 200 --rate 20 --duration 60 --think 1.5 \
+        --digits 1:0.4,2:0.35,3:0.15,9:0.1 --report load-report.json \
+        [--calls 1000] [--max-inputs 5] [--seed 1] [--baseline previous.json]
+
+A request counts as an error unless it returns 200 with a real answer:
+the webhooks also reply 200 with error XML ("System error.", "Your
+session has expired", ...), and those count as errors too.
+
+The report (JSON) has per-route request counts, error rates, throughput
+and p50/p95/p99 latency; --baseline prints the p50/p99 change per route
+against an earlier report.
 """
 
 import sys
 import json
+import random
+import threading
+import time
+import uuid
 import urllib.request
 import urllib.parse
 import urllib.error
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 
 
 def make_request(url, method="GET", data=None, content_type=None):
@@ -110,13 +137,13 @@ def test_all(base_url):
     status, body = make_request(
         f"{base_url}/api/log-call",
         method="POST",
-        data=json.dumps({
-            "call_uuid": f"test-{int(__import__('time').time())}",
+        data={
+            "call_uuid": f"test-{int(time.time())}",
             "from_number": "+1234567890",
             "to_number": "+0987654321",
             "duration": 120,
             "call_status": "completed",
-        }),
+        },
         content_type="application/json",
     )
     check("POST /api/log-call", status, body, expected_status=201)
@@ -142,10 +169,299 @@ def test_all(base_url):
     print(f"{'='*40}\n")
 
 
-if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python scripts/test_endpoints.py <base_url>")
-        print("Example: python scripts/test_endpoints.py https://your-project.vercel.app")
-        sys.exit(1)
+# ===== LOAD GENERATION =====
+
+# Digit presses for the seeded menus: 1 sales, 2 support, 3 phone readback,
+# 9 is invalid and re-prompts
+DEFAULT_DIGITS = "1:0.4,2:0.35,3:0.15,9:0.1"
+
+FORM = "application/x-www-form-urlencoded"
+
+
+def parse_digits(spec):
+    """'1:0.4,2:0.6' -> (['1', '2'], [0.4, 0.6])"""
+    digits, weights = [], []
+    for part in spec.split(","):
+        digit, _, weight = part.partition(":")
+        digits.append(digit.strip())
+        weights.append(float(weight or 1))
+    return digits, weights
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+class LoadStats:
+    """Thread-safe latency and error collection for a load run."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.calls = {"started": 0, "completed": 0, "failed": 0}
+
+    def record(self, route, seconds, ok):
+        with self._lock:
+            self.latencies[route].append(seconds)
+            if not ok:
+                self.errors[route] += 1
+
+    def call_started(self):
+        with self._lock:
+            self.calls["started"] += 1
+
+    def call_finished(self, ok):
+        with self._lock:
+            self.calls["completed" if ok else "failed"] += 1
+
+    def in_flight(self):
+        with self._lock:
+            return self.calls["started"] - self.calls["completed"] - self.calls["failed"]
+
+    def report(self, elapsed):
+        routes = {}
+        for route in sorted(self.latencies):
+            values = sorted(self.latencies[route])
+            count = len(values)
+            routes[route] = {
+                "requests": count,
+                "errors": self.errors[route],
+                "error_rate": round(self.errors[route] / count, 4),
+                "throughput_rps": round(count / elapsed, 2),
+                "latency_ms": {
+                    "p50": round(percentile(values, 0.50) * 1000, 2),
+                    "p95": round(percentile(values, 0.95) * 1000, 2),
+                    "p99": round(percentile(values, 0.99) * 1000, 2),
+                    "max": round(values[-1] * 1000, 2),
+                    "mean": round(sum(values) / count * 1000, 2),
+                },
+            }
+        finished = self.calls["completed"] + self.calls["failed"]
+        return {
+            "elapsed_s": round(elapsed, 2),
+            "calls": dict(self.calls, per_second=round(finished / elapsed, 2)),
+            "routes": routes,
+        }
+
+
+# Bodies the webhooks answer with (status 200) when the backend failed
+ERROR_BODIES = (
+    "An error occurred",
+    "Your session has expired",
+    "System error",
+    "Transfer configuration error",
+    "our system is unavailable",
+    "Invalid call parameters",
+    "Invalid input parameters",
+)
+IVR_VERBS = ("<GetDigits", "<Dial", "<Hangup")
+
+
+def response_ok(route, status, body):
+    """True if a webhook reply is a real answer, not the 200 error XML."""
+    if status != 200:
+        return False
+    if route == "/api/hangup":
+        return body == ""
+    return any(verb in body for verb in IVR_VERBS) and not any(error in body for error in ERROR_BODIES)
+
+
+def simulate_call(base_url, stats, rng, digits, weights, think, max_inputs):
+    """Run one call: answer, digit presses until the menus end, hangup. Returns True if every request succeeded."""
+    call_uuid = f"load-{uuid.uuid4()}"
+    started = time.time()
+
+    def post(route, data):
+        request_started = time.perf_counter()
+        status, body = make_request(f"{base_url}{route}", method="POST", data=data, content_type=FORM)
+        ok = response_ok(route, status, body)
+        stats.record(route, time.perf_counter() - request_started, ok)
+        return ok, body
+
+    ok, body = post("/api/answer", {
+        "CallUUID": call_uuid,
+        "From": f"+1555{rng.randrange(10 ** 7):07d}",
+        "To": "+18005550100",
+    })
+    all_ok = ok
+
+    inputs = 0
+    while ok and "<GetDigits" in body and inputs < max_inputs:
+        if think:
+            time.sleep(rng.expovariate(1 / think))
+        ok, body = post("/api/handle-input", {"CallUUID": call_uuid, "Digits": rng.choices(digits, weights)[0]})
+        all_ok = all_ok and ok
+        inputs += 1
+
+    # Plivo sends the hangup webhook even when the call flow failed
+    ok, _ = post("/api/hangup", {
+        "CallUUID": call_uuid,
+        "Duration": str(int(time.time() - started)),
+        "HangupCause": "NORMAL_CLEARING",
+    })
+    return all_ok and ok
 
-    test_all(sys.argv[1])
+
+def run_load(base_url, concurrency=50, rate=None, duration=60, calls=None,
+             think=1.0, digits=DEFAULT_DIGITS, max_inputs=5, seed=None):
+    """Drive simulated calls for `duration` seconds (or `calls` calls) and return the report."""
+    base_url = base_url.rstrip('/')
+    digit_choices, weights = parse_digits(digits)
+    stats = LoadStats()
+    rng = random.Random(seed)
+    slots = threading.Semaphore(concurrency)
+
+    def call(call_seed):
+        try:
+            ok = simulate_call(base_url, stats, random.Random(call_seed), digit_choices, weights, think, max_inputs)
+        except Exception as e:
+            print(f"  call error: {e}")
+            ok = False
+        finally:
+            slots.release()
+        stats.call_finished(ok)
+
+    print(f"\nLoad: {base_url} concurrency={concurrency} rate={rate or 'max'}/s "
+          f"duration={duration}s calls={calls or '-'} think={think}s digits={digits}\n")
+
+    started = time.perf_counter()
+    next_arrival = started
+    last_progress = started
+    dispatched = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while time.perf_counter() - started < duration and (calls is None or dispatched < calls):
+            if rate:
+                delay = next_arrival - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                next_arrival += rng.expovariate(rate)
+            # Blocks while `concurrency` calls are in flight
+            slots.acquire()
+            stats.call_started()
+            executor.submit(call, rng.random())
+            dispatched += 1
+
+            now = time.perf_counter()
+            if now - last_progress >= 5:
+                print(f"  {now - started:6.1f}s  started={dispatched} in_flight={stats.in_flight()}")
+                last_progress = now
+        print(f"  dispatch done after {time.perf_counter() - started:.1f}s, waiting for {stats.in_flight()} calls")
+
+    report = stats.report(time.perf_counter() - started)
+    report.update({
+        "base_url": base_url,
+        "started_at": datetime.utcnow().isoformat(),
+        "config": {
+            "concurrency": concurrency,
+            "rate": rate,
+            "duration": duration,
+            "calls": calls,
+            "think": think,
+            "digits": digits,
+            "max_inputs": max_inputs,
+            "seed": seed,
+        },
+    })
+    return report
+
+
+def print_report(report, baseline=None):
+    calls = report["calls"]
+    print(f"\nCalls: {calls['completed']} completed, {calls['failed']} failed, "
+          f"{calls['per_second']}/s over {report['elapsed_s']}s\n")
+    print(f"  {'route':<20} {'reqs':>7} {'err%':>6} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}  (ms)")
+    for route, data in report["routes"].items():
+        latency = data["latency_ms"]
+        line = (f"  {route:<20} {data['requests']:>7} {data['error_rate'] * 100:>6.2f} {data['throughput_rps']:>8.2f} "
+                f"{latency['p50']:>8.2f} {latency['p95']:>8.2f} {latency['p99']:>8.2f} {latency['max']:>8.2f}")
+        previous = (baseline or {}).get("routes", {}).get(route)
+        if previous:
+            old = previous["latency_ms"]
+            line += f"  p50 {latency['p50'] - old['p50']:+.2f}  p99 {latency['p99'] - old['p99']:+.2f}"
+        print(line)
+    print()
+
+
+class UsageError(ValueError):
+    pass
+
+
+def _arg(args, name, default=None, cast=str):
+    if name not in args:
+        return default
+    index = args.index(name) + 1
+    if index >= len(args) or args[index].startswith("--"):
+        raise UsageError(f"{name} needs a value")
+    try:
+        return cast(args[index])
+    except ValueError:
+        raise UsageError(f"invalid value for {name}: {args[index]!r}")
+
+
+def _digit_spec(spec):
+    parse_digits(spec)  # raises ValueError for e.g. "1:x"
+    return spec
+
+
+def _usage():
+    print("Usage: python scripts/test_endpoints.py <base_url> [--load ...]")
+    print("Example: python scripts/test_endpoints.py https://your-project.vercel.app")
+    print("Load options: --concurrency N --rate CALLS_PER_S --duration S --calls N --think S")
+    print("              --digits 1:0.4,2:0.6 --max-inputs N --seed N --report PATH --baseline PATH")
+
+
+def main(args):
+    if not args or args[0].startswith("--"):
+        _usage()
+        return 1
+
+    base_url = args[0]
+    if "--load" not in args:
+        test_all(base_url)
+        return 0
+
+    try:
+        options = dict(
+            concurrency=_arg(args, "--concurrency", 50, int),
+            rate=_arg(args, "--rate", None, float),
+            duration=_arg(args, "--duration", 60, float),
+            calls=_arg(args, "--calls", None, int),
+            think=_arg(args, "--think", 1.0, float),
+            digits=_arg(args, "--digits", DEFAULT_DIGITS, _digit_spec),
+            max_inputs=_arg(args, "--max-inputs", 5, int),
+            seed=_arg(args, "--seed", None, int),
+        )
+        if options["concurrency"] <= 0:
+            raise UsageError("--concurrency must be positive")
+        if options["rate"] is not None and options["rate"] <= 0:
+            raise UsageError("--rate must be positive")
+        if options["think"] < 0:
+            raise UsageError("--think can't be negative")
+        baseline_path = _arg(args, "--baseline")
+        path = _arg(args, "--report", "load-report.json")
+    except UsageError as e:
+        print(f"Error: {e}")
+        _usage()
+        return 2
+
+    report = run_load(base_url, **options)
+
+    baseline = None
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {path}")
+    return 0 if report["calls"]["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,93 @@
+"""
+Admission - Shed incoming calls before /api/answer does any work.
+
+During a robocall flood every answer webhook would otherwise create a
+session and check the menu version. With ADMISSION_CONTROL_ENABLED, the
+answer routes first ask the session store, in one round trip (one EVAL on
+Redis), whether to take the call:
+- caller: each From number has a token bucket refilled at
+  ADMISSION_CALLER_CALLS_PER_MINUTE, holding up to ADMISSION_CALLER_BURST
+- global: at most ADMISSION_MAX_ACTIVE_CALLS calls in progress across all
+  instances; hangup frees the slot, and slots of calls that never hung up
+  expire after ADMISSION_CALL_TTL
+
+A shed call gets precomputed XML (no rendering, no further backend calls)
+and is counted twice: in Redis (shared by every instance, /api/admission)
+and in this instance's ivr_calls_shed_total (/api/metrics).
+
+If the store can't be reached the call is admitted; an outage of the
+limiter shouldn't become an outage of the phone line.
+"""
+
+import logging
+from config import get_config
+from services import metrics
+from services.plivo_service import plivo_service
+from services.plivo_xml import Hangup, Response
+
+logger = logging.getLogger(__name__)
+
+BUSY_XML = plivo_service.generate_hangup_xml("All of our lines are busy. Please try again later.")
+REJECT_XML = Response(Hangup(reason="busy")).to_bytes()
+
+
+def _limits(config):
+    return (
+        config.ADMISSION_CALLER_CALLS_PER_MINUTE / 60,
+        config.ADMISSION_CALLER_BURST,
+        config.ADMISSION_MAX_ACTIVE_CALLS,
+        config.ADMISSION_CALL_TTL,
+    )
+
+
+def _shed_response(config, call_uuid, from_number, reason):
+    logger.info(f"SHED: CallUUID={call_uuid}, From={from_number}, limit={reason}")
+    metrics.record_shed(reason)
+    return REJECT_XML if config.ADMISSION_SHED_RESPONSE == "reject" else BUSY_XML
+
+
+def check_admission(call_uuid, from_number):
+    """Return None to take the call, or the XML to answer a shed call with."""
+    config = get_config()
+    if not config.ADMISSION_CONTROL_ENABLED:
+        return None
+
+    from services.session_store import get_session_store
+    try:
+        admitted, reason = get_session_store().admit_call(call_uuid, from_number, *_limits(config))
+    except Exception as e:
+        logger.warning(f"Admission check failed, admitting call: {e}")
+        return None
+    return None if admitted else _shed_response(config, call_uuid, from_number, reason)
+
+
+async def check_admission_async(call_uuid, from_number):
+    """check_admission for the ASGI app."""
+    config = get_config()
+    if not config.ADMISSION_CONTROL_ENABLED:
+        return None
+
+    from services.async_session_store import get_async_session_store
+    try:
+        admitted, reason = await get_async_session_store().admit_call(call_uuid, from_number, *_limits(config))
+    except Exception as e:
+        logger.warning(f"Admission check failed, admitting call: {e}")
+        return None
+    return None if admitted else _shed_response(config, call_uuid, from_number, reason)
+
+
+def admission_status():
+    """Settings plus calls in progress and shed counts (all instances), for /api/admission."""
+    config = get_config()
+    from services.session_store import get_session_store
+    return {
+        "enabled": config.ADMISSION_CONTROL_ENABLED,
+        "limits": {
+            "caller_calls_per_minute": config.ADMISSION_CALLER_CALLS_PER_MINUTE,
+            "caller_burst": config.ADMISSION_CALLER_BURST,
+            "max_active_calls": config.ADMISSION_MAX_ACTIVE_CALLS,
+            "call_ttl": config.ADMISSION_CALL_TTL,
+        },
+        "shed_response": config.ADMISSION_SHED_RESPONSE,
+        **get_session_store().admission_stats(),
+    }
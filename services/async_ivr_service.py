@@ -0,0 +1,132 @@
+"""
+Async IVR Service - IVRService for the ASGI app (api/asgi.py).
+
+Same call flow, same XML, same Redis keys and CallLog rows, but every
+wait on Redis or Postgres is awaited, so one worker keeps answering other
+calls while a request waits on Upstash or a Neon handshake. Independent
+lookups run concurrently:
+- answer: creating the session and checking the menu version
+- digit:  reading the session fields and checking the menu version
+
+Routing and XML rendering are inherited from IVRService. They get the
+menus mapping from all_async() and read pre-rendered XML without another
+freshness check, so they never reach the blocking MenuCache.all().
+"""
+
+import asyncio
+import logging
+from services.async_session_store import get_async_session_store
+from services.ivr_service import (
+    IVRService,
+    UNAVAILABLE_XML,
+    SESSION_EXPIRED_XML,
+    SYSTEM_ERROR_XML,
+    INVALID_INPUT_XML,
+)
+from services.menu_cache import get_menu_cache
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncIVRService(IVRService):
+    """Orchestrate the IVR call flow with coroutine handlers."""
+
+    @property
+    def sessions(self):
+        return get_async_session_store()
+
+    async def _menus(self):
+        """Make sure the menu cache is current without blocking the event loop."""
+        return await get_menu_cache().all_async(self.sessions.get_menu_version)
+
+    def _prerendered(self, menu_id, action_type, variant):
+        # _menus() already checked the version; response() could reload on the event loop
+        return get_menu_cache().response_cached(menu_id, action_type, variant)
+
+    async def handle_incoming_call(self, call_uuid, from_number, to_number):
+        """Handle incoming call: create session, return main menu XML."""
+        logger.info(f"INCOMING CALL: {from_number}")
+
+        _, menus = await asyncio.gather(
+            self.sessions.create_session(call_uuid, from_number, to_number),
+            self._menus(),
+        )
+
+        menu = menus.get("main_menu")
+        if menu is None:
+            logger.error("main_menu not found in database!")
+            return UNAVAILABLE_XML
+
+        return self._menu_response(menu, "prompt")
+
+    async def handle_digit_input(self, call_uuid, digit):
+        """Handle user pressing a digit."""
+        logger.info(f"DIGIT INPUT: {digit}")
+
+        session, menus = await asyncio.gather(
+            self.sessions.get_session_fields(call_uuid, "current_menu_id", "from_number"),
+            self._menus(),
+        )
+        if session is None:
+            return SESSION_EXPIRED_XML
+
+        current_menu_id = session["current_menu_id"]
+        menu = menus.get(current_menu_id)
+        if menu is None:
+            return SYSTEM_ERROR_XML
+
+        if not menu.validate_digit(digit):
+            invalid_menu_id = menu.invalid_input_menu_id
+            if invalid_menu_id:
+                invalid_menu = menus.get(invalid_menu_id)
+                if invalid_menu:
+                    return self._menu_response(invalid_menu, "prompt")
+            return INVALID_INPUT_XML
+
+        xml, moved_to = self._route_digit(session, menu, digit, menus)
+
+        await self.sessions.record_digit(call_uuid, current_menu_id, digit, next_menu_id=moved_to)
+        return xml
+
+    async def handle_hangup(self, call_uuid, hangup_cause=None, duration=None):
+        """Handle call end: save to DB, cleanup Redis."""
+        logger.info(f"CALL HANGUP: {call_uuid}")
+
+        if self.config.CALL_LOG_WRITE_BEHIND:
+            if await self.sessions.finalize_session(call_uuid, hangup_cause, duration) is None:
+                logger.warning("Session already expired/deleted")
+            return
+
+        async with self.sessions.batch() as batch:
+            pending = batch.get_session(call_uuid)
+            batch.mark_call_completed(call_uuid)
+            batch.delete_session(call_uuid)
+            batch.release_call(call_uuid)
+
+        session = pending.value
+        if session is None:
+            logger.warning("Session already expired/deleted")
+            return
+
+        session["state"] = "completed"
+        await self._save_call_to_database_async(call_uuid, session, hangup_cause, duration)
+
+    async def _save_call_to_database_async(self, call_uuid, session, hangup_cause, duration):
+        """Write the CallLog row and CallerHistory counters through the async engine."""
+        from services.call_log_writer import call_log_values, finalize_calls_async
+        try:
+            await finalize_calls_async([call_log_values(call_uuid, session, hangup_cause, duration)])
+            logger.info(f"Saved call to CallLog: {call_uuid}")
+        except Exception as e:
+            logger.error(f"Error saving call: {e}")
+
+
+# Lazy singleton
+_async_ivr_instance = None
+
+
+def get_async_ivr_service():
+    global _async_ivr_instance
+    if _async_ivr_instance is None:
+        _async_ivr_instance = AsyncIVRService()
+    return _async_ivr_instance
@@ -0,0 +1,380 @@
+"""
+Async Session Store - asyncio counterparts of the session backends for the
+ASGI app (api/asgi.py).
+
+Only the operations the webhooks need are async: admission, create, read
+fields, record a digit, the hangup batch, finalize (write-behind), the
+menu version and ping. Everything else (flusher, admin routes) keeps using
+services/session_store.py through the mounted Flask app.
+
+- upstash: upstash_redis.asyncio (the same REST API over aiohttp)
+- redis:   redis.asyncio with its own connection pool (REDIS_URL)
+- memory:  the process's MemorySessionStore; its calls never wait on I/O,
+           so they run inline, and Flask routes see the same sessions
+
+Redis commands and Lua scripts come from RedisSessionService's command
+builders, so both apps read and write exactly the same keys.
+"""
+
+import inspect
+import logging
+from datetime import datetime
+from config import get_config
+from services import metrics
+from services.session_store import (
+    BatchResult,
+    MemorySessionBatch,
+    PENDING_CALLS_KEY,
+    ACTIVE_CALLS_KEY,
+    get_session_store,
+)
+from services.redis_scripts import FINALIZE_SESSION_SCRIPT
+from services.redis_service import MENU_VERSION_KEY, RedisSessionService
+
+logger = logging.getLogger(__name__)
+
+# Lazy-initialized async clients, created inside the running event loop
+_upstash_client = None
+_tcp_client = None
+
+
+def _get_upstash():
+    global _upstash_client
+    if _upstash_client is None:
+        config = get_config()
+        if not config.KV_REST_API_URL or not config.KV_REST_API_TOKEN:
+            raise RuntimeError(
+                "KV_REST_API_URL and KV_REST_API_TOKEN not set. "
+                "Connect Redis via Vercel Storage tab."
+            )
+        from upstash_redis.asyncio import Redis
+        _upstash_client = Redis(url=config.KV_REST_API_URL, token=config.KV_REST_API_TOKEN)
+    return _upstash_client
+
+
+def _get_tcp_redis():
+    global _tcp_client
+    if _tcp_client is None:
+        config = get_config()
+        if not config.REDIS_URL:
+            raise RuntimeError("REDIS_URL not set. It is required when SESSION_BACKEND=redis.")
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("SESSION_BACKEND=redis needs redis-py: pip install redis")
+
+        pool = redis.ConnectionPool.from_url(
+            config.REDIS_URL,
+            max_connections=config.REDIS_POOL_SIZE,
+            decode_responses=True,
+            socket_timeout=5,
+            socket_connect_timeout=5,
+            health_check_interval=30,
+        )
+        _tcp_client = AsyncTcpRedisClient(redis.Redis(connection_pool=pool))
+    return _tcp_client
+
+
+class AsyncTcpRedisClient:
+    """TcpRedisClient for redis.asyncio: Upstash-style eval() and multi()/exec()."""
+
+    def __init__(self, client):
+        self._client = client
+        self._scripts = {}
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def _script(self, script):
+        registered = self._scripts.get(script)
+        if registered is None:
+            registered = self._scripts[script] = self._client.register_script(script)
+        return registered
+
+    async def eval(self, script, keys=None, args=None):
+        return await self._script(script)(keys=keys or [], args=args or [])
+
+    def multi(self):
+        return _AsyncTcpTransaction(self, self._client.pipeline(transaction=True))
+
+    async def close(self):
+        await self._client.aclose()
+        await self._client.connection_pool.disconnect()
+
+
+class _AsyncTcpTransaction:
+    """Queue commands on a redis.asyncio pipeline; exec() sends them as one MULTI/EXEC."""
+
+    def __init__(self, owner, pipeline):
+        self._owner = owner
+        self._pipeline = pipeline
+
+    def __getattr__(self, name):
+        return getattr(self._pipeline, name)
+
+    def eval(self, script, keys=None, args=None):
+        # What AsyncScript.__call__ does for a pipeline, without awaiting
+        registered = self._owner._script(script)
+        keys, args = keys or [], args or []
+        self._pipeline.scripts.add(registered)
+        self._pipeline.evalsha(registered.sha, len(keys), *keys, *args)
+        return self
+
+    async def exec(self):
+        return await self._pipeline.execute()
+
+
+class _AsyncTimedClient:
+    """Record every command as a "redis" call (services/metrics.py), like _TimedClient."""
+
+    __slots__ = ("_client",)
+
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name in ("multi", "close") or not callable(attr):
+            return attr
+
+        async def call(*args, **kwargs):
+            with metrics.timed("redis"):
+                result = attr(*args, **kwargs)
+                return await result if inspect.isawaitable(result) else result
+        return call
+
+
+class AsyncRedisSessionService:
+    """Async webhook operations on the Redis session layout (Upstash REST or TCP)."""
+
+    def __init__(self, backend="upstash"):
+        self.config = get_config()
+        self.backend = backend
+        # Command builders and reply decoders; never sends anything itself
+        self._commands = RedisSessionService(backend)
+        self._hash_layout = self._commands._hash_layout
+
+    def _get_client(self):
+        client = _get_tcp_redis() if self.backend == "redis" else _get_upstash()
+        return _AsyncTimedClient(client) if metrics.ENABLED else client
+
+    async def _run(self, command, decode):
+        name, args, kwargs = command
+        result = getattr(self._get_client(), name)(*args, **kwargs)
+        return decode(await result if inspect.isawaitable(result) else result)
+
+    def batch(self):
+        """``async with store.batch() as batch:`` - one MULTI/EXEC on exit."""
+        return AsyncSessionBatch(self)
+
+    # ===== SESSION CRUD =====
+
+    async def create_session(self, call_uuid, from_number, to_number):
+        """Create a new call session with TTL."""
+        session_data = {
+            "call_uuid": call_uuid,
+            "from_number": from_number,
+            "to_number": to_number,
+            "current_menu_id": "main_menu",
+            "menu_history": ["main_menu"],
+            "user_inputs": [],
+            "start_time": datetime.utcnow().isoformat(),
+            "last_activity": datetime.utcnow().isoformat(),
+            "state": "active",
+        }
+        await self._run(*self._commands._create_session_command(call_uuid, session_data))
+        logger.info(f"Session created: {call_uuid}")
+        return session_data
+
+    async def get_session(self, call_uuid):
+        return await self._run(*self._commands._get_session_command(call_uuid))
+
+    async def get_session_fields(self, call_uuid, *names):
+        """Fetch only the named scalar fields of a session (one HMGET in hash mode)."""
+        if self._hash_layout:
+            values = await self._get_client().hmget(self._commands._hash_keys(call_uuid)[0], *names)
+            if any(value is not None for value in values):
+                return dict(zip(names, values))
+
+        session = await self.get_session(call_uuid)
+        if session is None:
+            return None
+        return {name: session.get(name) for name in names}
+
+    async def record_digit(self, call_uuid, menu_id, digit, next_menu_id=None):
+        """Record a digit press and optionally move to next_menu_id in one EVAL."""
+        return await self._run(*self._commands._record_digit_command(call_uuid, menu_id, digit, next_menu_id))
+
+    # ===== CALL RECORD QUEUE =====
+
+    async def finalize_session(self, call_uuid, hangup_cause=None, duration=None):
+        """Atomically delete a session and queue it as a finalized call record."""
+        session_json = await self._get_client().eval(
+            FINALIZE_SESSION_SCRIPT,
+            keys=self._commands._hash_keys(call_uuid) + [PENDING_CALLS_KEY, ACTIVE_CALLS_KEY],
+            args=[
+                call_uuid,
+                hangup_cause or "",
+                "" if duration is None else str(duration),
+                datetime.utcnow().isoformat(),
+            ],
+        )
+        if session_json is None:
+            return None
+        return self._commands._decode_json_session(session_json)
+
+    # ===== ADMISSION CONTROL =====
+
+    async def admit_call(self, call_uuid, from_number, rate, burst, max_active, call_ttl):
+        """Token bucket for the caller plus the active-call ceiling, in one EVAL."""
+        return await self._run(
+            *self._commands._admit_call_command(call_uuid, from_number, rate, burst, max_active, call_ttl)
+        )
+
+    # ===== MENU VERSION / HEALTH =====
+
+    async def get_menu_version(self):
+        version = await self._get_client().get(MENU_VERSION_KEY)
+        return int(version) if version is not None else 0
+
+    async def ping(self):
+        try:
+            result = await self._get_client().ping()
+            return result == "PONG" or result is True
+        except Exception as e:
+            logger.error(f"Redis ping failed: {e}")
+            return False
+
+    async def close(self):
+        global _upstash_client, _tcp_client
+        client = _tcp_client if self.backend == "redis" else _upstash_client
+        if client is not None:
+            await client.close()
+        if self.backend == "redis":
+            _tcp_client = None
+        else:
+            _upstash_client = None
+
+
+class AsyncSessionBatch:
+    """SessionBatch for AsyncRedisSessionService: the queued operations go out on __aexit__."""
+
+    def __init__(self, service):
+        self._service = service
+        self._queued = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            await self.execute()
+        else:
+            self._queued = []
+
+    def _queue(self, command, decode):
+        result = BatchResult()
+        self._queued.append((command, decode, result))
+        return result
+
+    def get_session(self, call_uuid):
+        return self._queue(*self._service._commands._get_session_command(call_uuid))
+
+    def update_session(self, call_uuid, updates):
+        return self._queue(*self._service._commands._update_session_command(call_uuid, updates))
+
+    def mark_call_completed(self, call_uuid):
+        return self.update_session(call_uuid, {"state": "completed"})
+
+    def delete_session(self, call_uuid):
+        return self._queue(*self._service._commands._delete_session_command(call_uuid))
+
+    def release_call(self, call_uuid):
+        return self._queue(*self._service._commands._release_call_command(call_uuid))
+
+    async def execute(self):
+        queued, self._queued = self._queued, []
+        if not queued:
+            return []
+
+        transaction = self._service._get_client().multi()
+        for (name, args, kwargs), _, _ in queued:
+            getattr(transaction, name)(*args, **kwargs)
+        with metrics.timed("redis"):
+            replies = await transaction.exec()
+
+        for (_, decode, result), reply in zip(queued, replies):
+            result.value = decode(reply)
+            result.ready = True
+        return [result.value for _, _, result in queued]
+
+
+class AsyncMemorySessionStore:
+    """Await-able view of the process's MemorySessionStore (no I/O, so nothing to wait on)."""
+
+    def __init__(self, store):
+        self._store = store
+
+    async def create_session(self, call_uuid, from_number, to_number):
+        return self._store.create_session(call_uuid, from_number, to_number)
+
+    async def get_session(self, call_uuid):
+        return self._store.get_session(call_uuid)
+
+    async def get_session_fields(self, call_uuid, *names):
+        return self._store.get_session_fields(call_uuid, *names)
+
+    async def record_digit(self, call_uuid, menu_id, digit, next_menu_id=None):
+        return self._store.record_digit(call_uuid, menu_id, digit, next_menu_id)
+
+    async def finalize_session(self, call_uuid, hangup_cause=None, duration=None):
+        return self._store.finalize_session(call_uuid, hangup_cause, duration)
+
+    async def admit_call(self, call_uuid, from_number, rate, burst, max_active, call_ttl):
+        return self._store.admit_call(call_uuid, from_number, rate, burst, max_active, call_ttl)
+
+    async def get_menu_version(self):
+        return self._store.get_menu_version()
+
+    async def ping(self):
+        return self._store.ping()
+
+    def batch(self):
+        return AsyncMemorySessionBatch(self._store)
+
+    async def close(self):
+        pass
+
+
+class AsyncMemorySessionBatch(MemorySessionBatch):
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.__exit__(exc_type, exc_val, exc_tb)
+
+
+# Lazy singleton - created on first use
+_async_store_instance = None
+
+
+def get_async_session_store():
+    """Get the async session store for the configured SESSION_BACKEND."""
+    global _async_store_instance
+    if _async_store_instance is None:
+        backend = get_config().SESSION_BACKEND
+        if backend == "memory":
+            _async_store_instance = AsyncMemorySessionStore(get_session_store())
+        elif backend in ("upstash", "redis"):
+            _async_store_instance = AsyncRedisSessionService(backend)
+        else:
+            raise RuntimeError(f"Unknown SESSION_BACKEND '{backend}'. Use upstash, redis or memory.")
+    return _async_store_instance
+
+
+async def close_async_session_store():
+    """Release the async store's connections (ASGI shutdown)."""
+    global _async_store_instance
+    if _async_store_instance is not None:
+        await _async_store_instance.close()
+        _async_store_instance = None
@@ -0,0 +1,197 @@
+"""
+Call Log Ingest - Bulk loading of call records (carrier CDR exports, backfills).
+
+Records are validated one by one and inserted in chunks, each chunk as one
+multi-row INSERT ... ON CONFLICT DO NOTHING in its own transaction. A
+call_uuid that is already stored is skipped and counted as a duplicate, so
+re-sending a file (or the rest of one after a failure) is safe. If a
+chunk's insert fails, it is split in halves and retried, so a row the
+database rejects fails on its own and the rest of the chunk still loads.
+
+By default only call_logs is written. With finalize=True each chunk goes
+through finalize_calls() instead, which also updates CallerHistory and
+the analytics rollups at some cost in throughput.
+"""
+
+import json
+import logging
+from datetime import datetime
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import DBAPIError, OperationalError
+from config import get_config
+from models.database import get_engine
+from models.call_log import CallLog
+from services.partitions import call_log_conflict_target, conflict_target_outdated
+
+logger = logging.getLogger(__name__)
+
+# Per-row errors returned in the response; the rest are only counted
+MAX_REPORTED_ERRORS = 1000
+
+_REQUIRED = ("call_uuid", "from_number", "to_number", "start_time")
+_STRING_LIMITS = {
+    "call_uuid": 255,
+    "from_number": 20,
+    "to_number": 20,
+    "call_status": 50,
+    "hangup_cause": 100,
+}
+
+
+def _timestamp(record, field):
+    value = record.get(field)
+    if value in (None, ""):
+        return None
+    if not isinstance(value, str):
+        raise ValueError(f"{field} must be an ISO 8601 string")
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"{field} is not an ISO 8601 timestamp")
+
+
+def validate_record(record):
+    """Turn one submitted record into CallLog column values. Raises ValueError."""
+    if not isinstance(record, dict):
+        raise ValueError("record must be a JSON object")
+
+    missing = [field for field in _REQUIRED if not record.get(field)]
+    if missing:
+        raise ValueError(f"missing {', '.join(missing)}")
+
+    row = {
+        "call_uuid": record["call_uuid"],
+        "from_number": record["from_number"],
+        "to_number": record["to_number"],
+        "start_time": _timestamp(record, "start_time"),
+        "answer_time": _timestamp(record, "answer_time"),
+        "end_time": _timestamp(record, "end_time"),
+        "duration": record.get("duration"),
+        "call_status": record.get("call_status") or "completed",
+        "hangup_cause": record.get("hangup_cause"),
+        "menu_path": record.get("menu_path"),
+        "user_inputs": record.get("user_inputs"),
+    }
+
+    for field, limit in _STRING_LIMITS.items():
+        value = row[field]
+        if value is not None and (not isinstance(value, str) or len(value) > limit):
+            raise ValueError(f"{field} must be a string of at most {limit} characters")
+    if row["duration"] is not None:
+        if isinstance(row["duration"], bool) or not isinstance(row["duration"], int) or row["duration"] < 0:
+            raise ValueError("duration must be a non-negative integer")
+    for field in ("menu_path", "user_inputs"):
+        if row[field] is not None and not isinstance(row[field], list):
+            raise ValueError(f"{field} must be a list")
+    if row["user_inputs"] and not all(isinstance(item, dict) for item in row["user_inputs"]):
+        raise ValueError("user_inputs must be a list of objects")
+    return row
+
+
+def parse_ndjson(lines):
+    """Yield (line number, record or ValueError) for each non-blank NDJSON line."""
+    for line_no, line in enumerate(lines, 1):
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", errors="replace")
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except ValueError as e:
+            yield line_no, ValueError(f"invalid JSON: {e}")
+
+
+def _insert_chunk(rows):
+    """Insert rows, skipping existing call_uuids. Returns the number inserted."""
+    engine = get_engine()
+    now = datetime.utcnow()
+    rows = [dict(row, created_at=now, updated_at=now) for row in rows]
+    dialect = postgresql if engine.dialect.name == "postgresql" else sqlite
+
+    def insert():
+        with engine.begin() as conn:
+            stmt = (
+                dialect.insert(CallLog)
+                .on_conflict_do_nothing(index_elements=call_log_conflict_target(conn))
+                .returning(CallLog.call_uuid)
+            )
+            return len(conn.execute(stmt, rows).all())
+
+    try:
+        return insert()
+    except DBAPIError as e:
+        if not conflict_target_outdated(e):
+            raise
+    return insert()
+
+
+def ingest_call_logs(records, chunk_size=None, finalize=False):
+    """
+    Load (line number, record) pairs in chunks.
+
+    records may contain ValueError instances in place of records (unparsable
+    lines); they are reported like validation errors. Returns a summary with
+    received/inserted/duplicates/failed counts and per-row errors.
+    """
+    chunk_size = chunk_size or get_config().CALL_LOG_INGEST_CHUNK_SIZE
+    if finalize:
+        from services.call_log_writer import finalize_calls
+
+    summary = {"received": 0, "inserted": 0, "duplicates": 0, "failed": 0, "errors": []}
+
+    def fail(line_no, call_uuid, message):
+        summary["failed"] += 1
+        if len(summary["errors"]) < MAX_REPORTED_ERRORS:
+            summary["errors"].append({"line": line_no, "call_uuid": call_uuid, "error": message})
+
+    def insert(lines):
+        """Insert (line number, row) pairs, halving on database errors until bad rows are isolated."""
+        rows = [row for _, row in lines]
+        try:
+            inserted = len(finalize_calls(rows)) if finalize else _insert_chunk(rows)
+        except OperationalError as e:
+            # The database is unreachable; splitting would only fail slower
+            logger.error(f"Ingest chunk of {len(rows)} rows could not reach the database: {e}")
+            for line_no, row in lines:
+                fail(line_no, row["call_uuid"], f"database error: {str(e)[:200]}")
+            return
+        except Exception as e:
+            if len(lines) == 1:
+                line_no, row = lines[0]
+                logger.error(f"Ingest row {row['call_uuid']} (line {line_no}) failed: {e}")
+                fail(line_no, row["call_uuid"], f"database error: {str(e)[:200]}")
+                return
+            middle = len(lines) // 2
+            insert(lines[:middle])
+            insert(lines[middle:])
+            return
+        summary["inserted"] += inserted
+        summary["duplicates"] += len(rows) - inserted
+
+    def flush(chunk):
+        if not chunk:
+            return
+        # Repeats of a call_uuid within the file count as duplicates too
+        lines = list({row["call_uuid"]: (line_no, row) for line_no, row in reversed(chunk)}.values())
+        summary["duplicates"] += len(chunk) - len(lines)
+        insert(lines)
+
+    chunk = []
+    for line_no, record in records:
+        summary["received"] += 1
+        if isinstance(record, ValueError):
+            fail(line_no, None, str(record))
+            continue
+        try:
+            chunk.append((line_no, validate_record(record)))
+        except ValueError as e:
+            fail(line_no, record.get("call_uuid") if isinstance(record, dict) else None, str(e))
+            continue
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+            chunk = []
+    flush(chunk)
+
+    summary["errors_truncated"] = summary["failed"] > len(summary["errors"])
+    return summary
@@ -0,0 +1,111 @@
+"""
+Call Log Query - Filtered, keyset-paginated reads of call_logs.
+
+Pages are ordered newest first by (start_time, id). The cursor returned
+with a page encodes the last row's (start_time, id) and the next page
+starts strictly after it, so every page is an index range scan of the
+same size no matter how deep the client has walked. Cursors are opaque
+to clients: base64url-encoded JSON.
+"""
+
+import base64
+import binascii
+import json
+from datetime import datetime
+from sqlalchemy import tuple_
+from config import get_config
+from models.call_log import CallLog
+
+# Query parameters matched exactly against the column of the same name
+EXACT_FILTERS = ("call_status", "hangup_cause", "to_number")
+
+
+class QueryError(ValueError):
+    """Raised for a malformed cursor, filter or page size (reported as HTTP 400)."""
+
+
+def encode_cursor(start_time, row_id):
+    raw = json.dumps([start_time.isoformat(), row_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Return (start_time, id) from a cursor produced by encode_cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        start_time, row_id = json.loads(raw)
+        return datetime.fromisoformat(start_time), int(row_id)
+    except (binascii.Error, ValueError, TypeError):
+        raise QueryError("invalid cursor")
+
+
+def _parse_time(name, value):
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise QueryError(f"{name} must be an ISO 8601 timestamp")
+
+
+def parse_filters(args):
+    """
+    Read filters from request args.
+
+    call_status, hangup_cause and to_number match exactly; since (inclusive)
+    and until (exclusive) bound start_time. Unknown args are ignored.
+    """
+    filters = {name: args[name] for name in EXACT_FILTERS if args.get(name)}
+    for name in ("since", "until"):
+        if args.get(name):
+            filters[name] = _parse_time(name, args[name])
+    return filters
+
+
+def parse_limit(args):
+    config = get_config()
+    value = args.get("limit")
+    if value is None or value == "":
+        return config.CALL_LOGS_PAGE_SIZE
+    try:
+        limit = int(value)
+    except ValueError:
+        raise QueryError("limit must be an integer")
+    if limit < 1:
+        raise QueryError("limit must be at least 1")
+    return min(limit, config.CALL_LOGS_MAX_PAGE_SIZE)
+
+
+def filter_conditions(filters):
+    """WHERE clauses on call_logs for filters from parse_filters()."""
+    conditions = [getattr(CallLog, name) == filters[name] for name in EXACT_FILTERS if name in filters]
+    if "from_number" in filters:
+        conditions.append(CallLog.from_number == filters["from_number"])
+    if "since" in filters:
+        conditions.append(CallLog.start_time >= filters["since"])
+    if "until" in filters:
+        conditions.append(CallLog.start_time < filters["until"])
+    return conditions
+
+
+def filtered_call_logs(db, filters):
+    """Query for call_logs matching filters, newest first."""
+    return (
+        db.query(CallLog)
+        .filter(*filter_conditions(filters))
+        .order_by(CallLog.start_time.desc(), CallLog.id.desc())
+    )
+
+
+def page_call_logs(db, filters, cursor=None, limit=None):
+    """Return (rows, next_cursor) for one page. next_cursor is None on the last page."""
+    limit = limit or get_config().CALL_LOGS_PAGE_SIZE
+    query = filtered_call_logs(db, filters)
+    if cursor:
+        start_time, row_id = decode_cursor(cursor)
+        query = query.filter(tuple_(CallLog.start_time, CallLog.id) < tuple_(start_time, row_id))
+
+    # One extra row tells us whether there is another page without a COUNT
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].start_time, rows[-1].id)
@@ -0,0 +1,307 @@
+"""
+Call Log Writer - Turns finished calls into CallLog rows.
+
+With CALL_LOG_WRITE_BEHIND enabled, /api/hangup only moves the session
+into a durable Redis list (see SessionStore.finalize_session) and returns.
+flush_call_logs() drains that list in batches: each batch is inserted in
+one transaction, failed records are retried, and records that fail
+CALL_LOG_MAX_ATTEMPTS times go to a dead-letter list for inspection.
+
+Run the flusher from /api/flush-call-logs (cron) or scripts/flush_call_logs.py.
+
+Both the synchronous hangup path and the flusher go through finalize_calls(),
+which writes CallLog rows and CallerHistory counters in one statement.
+Re-finalizing a call_uuid that is already stored is a no-op.
+"""
+
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import case, select, func, literal
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import DBAPIError, OperationalError
+from config import get_config
+from models.database import get_engine
+from models.call_log import CallLog
+from models.caller_history import CallerHistory
+from services.partitions import call_log_conflict_target, conflict_target_outdated
+from services.call_rollups import ROLLUPS, rollup_events_values, rollup_totals, upsert_rollup
+from services.session_store import get_session_store
+
+logger = logging.getLogger(__name__)
+
+FLUSH_LOCK = "call-log-flush"
+
+
+def call_log_values(call_uuid, session, hangup_cause, duration, ended_at=None):
+    """Build the CallLog column values for a finished call session."""
+    start_time = datetime.fromisoformat(session["start_time"])
+    if duration:
+        end_time = start_time + timedelta(seconds=duration)
+    elif ended_at:
+        end_time = datetime.fromisoformat(ended_at)
+    else:
+        end_time = datetime.utcnow()
+
+    return {
+        "call_uuid": call_uuid,
+        "from_number": session["from_number"],
+        "to_number": session["to_number"],
+        "start_time": start_time,
+        "end_time": end_time,
+        "duration": duration,
+        "menu_path": session.get("menu_history"),
+        "user_inputs": session.get("user_inputs"),
+        "call_status": "completed",
+        "hangup_cause": hangup_cause,
+    }
+
+
+def _record_values(record):
+    return call_log_values(
+        record["call_uuid"],
+        record["session"],
+        record.get("hangup_cause"),
+        record.get("duration"),
+        record.get("ended_at"),
+    )
+
+
+def _upsert_callers(dialect_insert, source, now):
+    """
+    INSERT ... SELECT per-caller totals from `source` into caller_history,
+    adding to existing counters. first/last_call_at come from the calls'
+    own start/end times (not the flush time), and only ever widen, so
+    write-behind delays and out-of-order batches don't skew them.
+    """
+    totals = select(
+        source.c.from_number,
+        func.min(source.c.start_time),
+        func.coalesce(func.max(source.c.end_time), func.max(source.c.start_time)),
+        func.count(),
+        func.coalesce(func.sum(source.c.duration), 0),
+        literal(now),
+        literal(now),
+    ).group_by(source.c.from_number)
+
+    stmt = dialect_insert(CallerHistory).from_select(
+        ["phone_number", "first_call_at", "last_call_at", "total_calls",
+         "total_duration", "created_at", "updated_at"],
+        totals,
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=["phone_number"],
+        set_={
+            "total_calls": CallerHistory.total_calls + stmt.excluded.total_calls,
+            "total_duration": CallerHistory.total_duration + stmt.excluded.total_duration,
+            "first_call_at": case(
+                (stmt.excluded.first_call_at < CallerHistory.first_call_at, stmt.excluded.first_call_at),
+                else_=CallerHistory.first_call_at,
+            ),
+            "last_call_at": case(
+                (stmt.excluded.last_call_at > CallerHistory.last_call_at, stmt.excluded.last_call_at),
+                else_=CallerHistory.last_call_at,
+            ),
+            "updated_at": stmt.excluded.updated_at,
+        },
+    )
+
+
+def finalize_calls(rows):
+    """
+    Insert CallLog rows and update CallerHistory and the analytics rollups
+    in a single round trip.
+
+    On Postgres this is one statement: a CTE inserts the call_logs rows
+    (ON CONFLICT (call_uuid) DO NOTHING) and feeds only the rows it actually
+    inserted into an INSERT ... ON CONFLICT (phone_number) DO UPDATE on
+    caller_history and into the rollup tables (services/call_rollups.py).
+    Concurrent calls from a new number can't race on the unique index, and
+    replaying a call never double-counts it.
+
+    Other dialects (SQLite for local runs) get the same statements in
+    one transaction. Returns the set of call_uuids that were inserted.
+    """
+    if not rows:
+        return set()
+
+    now = datetime.utcnow()
+    rows = [dict(row, created_at=now, updated_at=now) for row in rows]
+    try:
+        with get_engine().begin() as conn:
+            return _insert_calls(conn, rows, now)
+    except DBAPIError as e:
+        if not conflict_target_outdated(e):
+            raise
+    with get_engine().begin() as conn:
+        return _insert_calls(conn, rows, now)
+
+
+async def finalize_calls_async(rows):
+    """
+    finalize_calls() on the asyncio engine, for the ASGI app.
+
+    The same statements run through run_sync() on an asyncpg (or
+    aiosqlite) connection, so waiting on Postgres doesn't block the loop.
+    """
+    if not rows:
+        return set()
+
+    from models.database import get_async_engine
+
+    now = datetime.utcnow()
+    rows = [dict(row, created_at=now, updated_at=now) for row in rows]
+    try:
+        async with get_async_engine().begin() as conn:
+            return await conn.run_sync(_insert_calls, rows, now)
+    except DBAPIError as e:
+        if not conflict_target_outdated(e):
+            raise
+    async with get_async_engine().begin() as conn:
+        return await conn.run_sync(_insert_calls, rows, now)
+
+
+def _insert_calls(conn, rows, now):
+    """The finalize_calls() statements on an open transaction. Returns the inserted call_uuids."""
+    if conn.dialect.name == "postgresql":
+        inserted = (
+            postgresql.insert(CallLog)
+            .values(rows)
+            .on_conflict_do_nothing(index_elements=call_log_conflict_target(conn))
+            .returning(
+                CallLog.call_uuid, CallLog.from_number, CallLog.duration,
+                CallLog.start_time, CallLog.end_time,
+            )
+            .cte("inserted_calls")
+        )
+        ctes = [_upsert_callers(postgresql.insert, inserted, now).cte("caller_upsert")]
+
+        for rollup in ROLLUPS:
+            events = rollup_events_values(rollup, rows)
+            if events is None:
+                continue
+            # Only events of calls the CTE actually inserted are counted
+            key = [events.c[name] for name in rollup.key_names]
+            totals = (
+                select(*key, *[func.sum(events.c[name]) for name in rollup.measures])
+                .select_from(events.join(inserted, events.c.call_uuid == inserted.c.call_uuid))
+                .group_by(*key)
+            )
+            upsert = upsert_rollup(postgresql.insert, rollup, totals, now)
+            ctes.append(upsert.cte(f"{rollup.model.__tablename__}_upsert"))
+
+        stmt = select(inserted.c.call_uuid).add_cte(*ctes)
+        return {call_uuid for (call_uuid,) in conn.execute(stmt)}
+
+    inserted = conn.execute(
+        sqlite.insert(CallLog)
+        .values(rows)
+        .on_conflict_do_nothing(index_elements=["call_uuid"])
+        .returning(CallLog.call_uuid)
+    ).scalars().all()
+    if inserted:
+        source = select(CallLog.from_number, CallLog.duration, CallLog.start_time, CallLog.end_time).where(
+            CallLog.call_uuid.in_(inserted)
+        ).subquery()
+        conn.execute(_upsert_callers(sqlite.insert, source, now))
+
+        inserted_uuids = set(inserted)
+        new_rows = [row for row in rows if row["call_uuid"] in inserted_uuids]
+        for rollup in ROLLUPS:
+            totals = rollup_totals(rollup, new_rows)
+            if totals:
+                conn.execute(upsert_rollup(sqlite.insert, rollup, totals, now))
+    return set(inserted)
+
+
+def write_call_logs(records):
+    """Finalize a batch of queued call records. Returns the call_uuids that were new."""
+    return finalize_calls([_record_values(record) for record in records])
+
+
+def flush_call_logs(batch_size=None, max_batches=None):
+    """
+    Drain the pending call record queue into Postgres.
+
+    Returns counts of records written, retried and dead-lettered. Only one
+    flusher runs at a time; a concurrent call returns immediately. The lock
+    is extended before each batch is claimed, and if it has been lost (a
+    batch outlived CALL_LOG_FLUSH_LOCK_TTL and another flusher took over)
+    this flusher stops claiming so the two never write the same records.
+    """
+    config = get_config()
+    store = get_session_store()
+    batch_size = batch_size or config.CALL_LOG_FLUSH_BATCH_SIZE
+    stats = {"written": 0, "retried": 0, "dead_lettered": 0, "batches": 0, "skipped": False, "lock_lost": False}
+
+    lock_ttl = config.CALL_LOG_FLUSH_LOCK_TTL
+    token = store.acquire_lock(FLUSH_LOCK, lock_ttl)
+    if token is None:
+        stats["skipped"] = True
+        return stats
+
+    try:
+        recovered = store.recover_call_records()
+        if recovered:
+            logger.warning(f"Recovered {recovered} call records from an interrupted flush")
+
+        while max_batches is None or stats["batches"] < max_batches:
+            if stats["batches"] and not store.extend_lock(FLUSH_LOCK, token, lock_ttl):
+                logger.error("Call log flush lock expired mid-run; leaving the rest to the next flush")
+                stats["lock_lost"] = True
+                break
+            records = store.claim_call_records(batch_size)
+            if not records:
+                break
+            stats["batches"] += 1
+
+            try:
+                write_call_logs(records)
+                stats["written"] += len(records)
+            except OperationalError as e:
+                # Postgres is unreachable; retrying row by row would only fail slower
+                logger.error(f"Call log flush could not reach Postgres: {e}")
+                _retry_or_dead_letter(store, records, config.CALL_LOG_MAX_ATTEMPTS, stats)
+            except Exception as e:
+                logger.error(f"Batch insert of {len(records)} call records failed: {e}")
+                written, failed = _write_individually(records)
+                stats["written"] += written
+                _retry_or_dead_letter(store, failed, config.CALL_LOG_MAX_ATTEMPTS, stats)
+            store.ack_call_records()
+
+            if stats["retried"]:
+                # Something is wrong with Postgres; leave the rest for the next run
+                break
+    finally:
+        store.release_lock(FLUSH_LOCK, token)
+
+    if stats["written"] or stats["retried"] or stats["dead_lettered"]:
+        logger.info(f"Call log flush: {stats}")
+    return stats
+
+
+def _write_individually(records):
+    """Isolate bad records after a failed batch. Returns (written count, failed records)."""
+    written, failed = 0, []
+    for record in records:
+        try:
+            write_call_logs([record])
+            written += 1
+        except Exception as e:
+            logger.error(f"Call record {record.get('call_uuid')} failed: {e}")
+            record["last_error"] = str(e)[:500]
+            failed.append(record)
+    return written, failed
+
+
+def _retry_or_dead_letter(store, records, max_attempts, stats):
+    retry, dead = [], []
+    for record in records:
+        record["attempts"] = record.get("attempts", 0) + 1
+        (dead if record["attempts"] >= max_attempts else retry).append(record)
+
+    store.requeue_call_records(retry)
+    store.dead_letter_call_records(dead)
+    stats["retried"] += len(retry)
+    stats["dead_lettered"] += len(dead)
+    for record in dead:
+        logger.error(f"Dead-lettered call record {record.get('call_uuid')} after {record['attempts']} attempts")
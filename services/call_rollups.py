@@ -0,0 +1,295 @@
+"""
+Call Rollups - Pre-aggregated analytics maintained as calls are finalized.
+
+finalize_calls() (services/call_log_writer.py) folds each newly inserted
+call into every rollup table in the same statement that writes call_logs,
+so analytics endpoints read a few pre-aggregated rows instead of scanning
+and parsing call_logs.
+
+- menu_funnel_daily: (day, menu_id, digit, outcome) counters, see
+  models/menu_funnel.py
+- call_stats_buckets: per-minute/per-hour call counts, durations and
+  breakdowns, see models/call_stats.py
+
+Each rollup turns a CallLog row into events (key, measures). Finalization
+sums the measures per key and adds them to the stored counters with
+INSERT ... ON CONFLICT DO UPDATE. scripts/backfill_rollups.py rebuilds a
+date range from call_logs.
+"""
+
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Tuple
+from sqlalchemy import func, literal, values, column, String, Date, DateTime, Integer
+from models.menu_funnel import MenuFunnelDaily
+from models.call_stats import CallStatsBucket
+
+# Upper bounds (seconds) of the duration histogram kept in call_stats_buckets
+DURATION_BOUNDS = (5, 10, 15, 30, 45, 60, 90, 120, 180, 300, 600, 1200, 1800, 3600)
+
+STATS_GRANULARITIES = {"minute": timedelta(minutes=1), "hour": timedelta(hours=1)}
+
+
+@dataclass(frozen=True)
+class Rollup:
+    """How one rollup table is derived from CallLog rows."""
+
+    model: type
+    key: Tuple[Tuple[str, type], ...]       # (column name, SQL type) of the upsert key
+    measures: Tuple[str, ...]               # counter columns added on conflict
+    time_column: str                        # column used to select a date range
+    events: Callable                        # CallLog row dict -> [(key tuple, measures tuple)]
+
+    @property
+    def key_names(self):
+        return [name for name, _ in self.key]
+
+
+# ===== MENU FUNNEL =====
+
+def funnel_events(row):
+    """(day, menu_id, digit, outcome) events for one CallLog row, each counting 1."""
+    day = row["start_time"].date()
+    path = row.get("menu_path") or []
+    events = [((day, menu_id, "", "entered"), (1,)) for menu_id in path]
+    for item in row.get("user_inputs") or []:
+        if item.get("menu_id"):
+            events.append(((day, item["menu_id"], str(item.get("digit", ""))[:10], "pressed"), (1,)))
+    if path:
+        events.append(((day, path[-1], "", "exit"), (1,)))
+    return events
+
+
+MENU_FUNNEL = Rollup(
+    model=MenuFunnelDaily,
+    key=(("day", Date), ("menu_id", String), ("digit", String), ("outcome", String)),
+    measures=("count",),
+    time_column="day",
+    events=funnel_events,
+)
+
+
+# ===== CALL STATS =====
+
+def duration_bucket(duration):
+    for bound in DURATION_BOUNDS:
+        if duration <= bound:
+            return str(bound)
+    return "inf"
+
+
+def truncate_time(moment, granularity):
+    if granularity == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(second=0, microsecond=0)
+
+
+def stats_events(row):
+    """Per-minute and per-hour counters for one CallLog row."""
+    duration = row.get("duration") or 0
+    measures = (1, duration)
+    dimensions = [
+        ("all", ""),
+        ("hangup_cause", (row.get("hangup_cause") or "unknown")[:100]),
+        ("to_number", row.get("to_number") or ""),
+        ("duration_le", duration_bucket(duration)),
+    ]
+    return [
+        ((granularity, truncate_time(row["start_time"], granularity), dimension, value), measures)
+        for granularity in STATS_GRANULARITIES
+        for dimension, value in dimensions
+    ]
+
+
+CALL_STATS = Rollup(
+    model=CallStatsBucket,
+    key=(("granularity", String), ("bucket_start", DateTime), ("dimension", String), ("dimension_value", String)),
+    measures=("calls", "total_duration"),
+    time_column="bucket_start",
+    events=stats_events,
+)
+
+ROLLUPS = (MENU_FUNNEL, CALL_STATS)
+
+
+# ===== UPSERTS =====
+
+def rollup_events_values(rollup, rows):
+    """A VALUES construct of (call_uuid, *key, *measures), one row per event, or None."""
+    data = [
+        (row["call_uuid"],) + key + measures
+        for row in rows
+        for key, measures in rollup.events(row)
+    ]
+    if not data:
+        return None
+    columns = [column("call_uuid", String)]
+    columns += [column(name, type_) for name, type_ in rollup.key]
+    columns += [column(name, Integer) for name in rollup.measures]
+    return values(*columns, name=f"{rollup.model.__tablename__}_events").data(data)
+
+
+def rollup_totals(rollup, rows):
+    """Sum the events of rows per key into upsert-ready dicts."""
+    totals = defaultdict(lambda: [0] * len(rollup.measures))
+    for row in rows:
+        for key, measures in rollup.events(row):
+            for i, value in enumerate(measures):
+                totals[key][i] += value
+    return [
+        dict(zip(rollup.key_names, key), **dict(zip(rollup.measures, measures)))
+        for key, measures in totals.items()
+    ]
+
+
+def upsert_rollup(dialect_insert, rollup, totals, now):
+    """
+    Add totals to the rollup table.
+
+    totals is either a SELECT of (*key, *measures) or a list of dicts from
+    rollup_totals(). Each key must appear only once.
+    """
+    if isinstance(totals, list):
+        stmt = dialect_insert(rollup.model).values([dict(row, updated_at=now) for row in totals])
+    else:
+        stmt = dialect_insert(rollup.model).from_select(
+            rollup.key_names + list(rollup.measures) + ["updated_at"],
+            totals.add_columns(literal(now)),
+        )
+    return stmt.on_conflict_do_update(
+        index_elements=rollup.key_names,
+        set_=dict(
+            {name: getattr(rollup.model, name) + getattr(stmt.excluded, name) for name in rollup.measures},
+            updated_at=stmt.excluded.updated_at,
+        ),
+    )
+
+
+# ===== READS =====
+
+def read_funnel(db, since, until, menu_id=None):
+    """
+    Sum funnel counters for days in [since, until] into
+    {menu_id: {"entered", "exit", "exit_rate", "pressed": {digit: count}}}.
+    """
+    query = db.query(
+        MenuFunnelDaily.menu_id,
+        MenuFunnelDaily.digit,
+        MenuFunnelDaily.outcome,
+        func.sum(MenuFunnelDaily.count),
+    ).filter(MenuFunnelDaily.day >= since, MenuFunnelDaily.day <= until)
+    if menu_id:
+        query = query.filter(MenuFunnelDaily.menu_id == menu_id)
+    query = query.group_by(MenuFunnelDaily.menu_id, MenuFunnelDaily.digit, MenuFunnelDaily.outcome)
+
+    menus = {}
+    for menu, digit, outcome, count in query:
+        entry = menus.setdefault(menu, {"entered": 0, "exit": 0, "pressed": {}})
+        if outcome == "pressed":
+            entry["pressed"][digit] = int(count)
+        else:
+            entry[outcome] = int(count)
+
+    for entry in menus.values():
+        entry["exit_rate"] = round(entry["exit"] / entry["entered"], 4) if entry["entered"] else None
+    return menus
+
+
+def default_day_range(days=7):
+    """(since, until) covering the last `days` days, today included."""
+    until = datetime.utcnow().date()
+    return until - timedelta(days=days - 1), until
+
+
+def duration_percentile(histogram, fraction):
+    """
+    Estimate a duration percentile from {upper bound: calls}, interpolating
+    linearly inside the bucket that contains it.
+    """
+    total = sum(histogram.values())
+    if not total:
+        return None
+    target = fraction * total
+    seen, lower = 0, 0
+    for bound in DURATION_BOUNDS:
+        count = histogram.get(str(bound), 0)
+        if count and seen + count >= target:
+            return round(lower + (bound - lower) * (target - seen) / count, 1)
+        seen += count
+        lower = bound
+    return float(DURATION_BOUNDS[-1])  # in the open-ended bucket; report its lower bound
+
+
+def read_stats(db, granularity, since, until):
+    """Calls per bucket, duration stats and breakdowns for buckets in [since, until)."""
+    rows = db.query(
+        CallStatsBucket.bucket_start,
+        CallStatsBucket.dimension,
+        CallStatsBucket.dimension_value,
+        CallStatsBucket.calls,
+        CallStatsBucket.total_duration,
+    ).filter(
+        CallStatsBucket.granularity == granularity,
+        CallStatsBucket.bucket_start >= since,
+        CallStatsBucket.bucket_start < until,
+    ).order_by(CallStatsBucket.bucket_start)
+
+    buckets = []
+    breakdowns = {"hangup_cause": defaultdict(int), "to_number": defaultdict(int)}
+    histogram = defaultdict(int)
+    calls = total_duration = 0
+    for bucket_start, dimension, value, bucket_calls, bucket_duration in rows:
+        if dimension == "all":
+            buckets.append({
+                "start": bucket_start.isoformat(),
+                "calls": bucket_calls,
+                "avg_duration": round(bucket_duration / bucket_calls, 1) if bucket_calls else None,
+            })
+            calls += bucket_calls
+            total_duration += bucket_duration
+        elif dimension == "duration_le":
+            histogram[value] += bucket_calls
+        elif dimension in breakdowns:
+            breakdowns[dimension][value] += bucket_calls
+
+    return {
+        "granularity": granularity,
+        "since": since.isoformat(),
+        "until": until.isoformat(),
+        "buckets": buckets,
+        "totals": {
+            "calls": calls,
+            "total_duration": total_duration,
+            "avg_duration": round(total_duration / calls, 1) if calls else None,
+            "p50_duration": duration_percentile(histogram, 0.5),
+            "p90_duration": duration_percentile(histogram, 0.9),
+            "p99_duration": duration_percentile(histogram, 0.99),
+        },
+        "hangup_causes": dict(breakdowns["hangup_cause"]),
+        "to_numbers": dict(breakdowns["to_number"]),
+    }
+
+
+# Short-lived per-process cache so dashboards polling every few seconds
+# share one query per STATS_CACHE_TTL
+_stats_cache = {}
+_stats_cache_lock = threading.Lock()
+
+
+def cached(key, ttl, loader):
+    """Return loader()'s result for key, reusing it for ttl seconds."""
+    now = time.monotonic()
+    with _stats_cache_lock:
+        hit = _stats_cache.get(key)
+        if hit and hit[0] > now:
+            return hit[1]
+    value = loader()
+    with _stats_cache_lock:
+        # Drop expired entries so arbitrary query strings can't grow the cache forever
+        for stale in [k for k, (expires, _) in _stats_cache.items() if expires <= now]:
+            del _stats_cache[stale]
+        _stats_cache[key] = (now + ttl, value)
+    return value
@@ -0,0 +1,117 @@
+"""
+Health - Concurrent, time-limited, cached dependency probes for /api/health.
+
+Load balancers poll readiness every few seconds from several regions, so:
+- the session store and Postgres are probed in parallel threads, and a
+  probe that hasn't answered within HEALTH_PROBE_TIMEOUT is reported as
+  timed out instead of holding the request
+- a probe that is still hung from an earlier check is not started again,
+  so a stuck backend can't pile up threads or connections
+- results are reused for HEALTH_CACHE_TTL seconds, and concurrent requests
+  wait for the one check in progress instead of starting their own
+
+Liveness (/api/health/live) never calls these; it only shows the process
+is serving requests.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+from config import get_config
+
+logger = logging.getLogger(__name__)
+
+
+def probe_session_store():
+    from services.session_store import get_session_store
+    if not get_session_store().ping():
+        raise RuntimeError("ping failed")
+
+
+def probe_postgres():
+    from models.database import get_engine
+    from sqlalchemy import text
+    with get_engine().connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+
+# Response key -> probe. "redis" probes whichever session backend is configured.
+PROBES = {
+    "redis": probe_session_store,
+    "postgres": probe_postgres,
+}
+
+_executor = None
+_in_flight = {}     # probe name -> future still running from an earlier check
+_cached = None      # (monotonic expiry, result)
+_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=len(PROBES) * 2, thread_name_prefix="health")
+    return _executor
+
+
+def _timed(probe):
+    """Run probe, returning (latency ms, error message or None)."""
+    started = time.perf_counter()
+    try:
+        probe()
+        error = None
+    except Exception as e:
+        error = str(e)
+    return round((time.perf_counter() - started) * 1000, 2), error
+
+
+def run_probes(timeout):
+    """Probe every dependency concurrently. Returns {name: (status, latency ms or None)}."""
+    futures = {}
+    for name, probe in PROBES.items():
+        future = _in_flight.get(name)
+        if future is None or future.done():
+            future = _get_executor().submit(_timed, probe)
+            _in_flight[name] = future
+        futures[name] = future
+
+    done, _ = wait(futures.values(), timeout=timeout)
+    results = {}
+    for name, future in futures.items():
+        if future in done:
+            _in_flight.pop(name, None)
+            latency, error = future.result()
+            results[name] = ("ok" if error is None else f"error: {error}", latency)
+        else:
+            logger.warning(f"Health probe {name} timed out after {timeout}s")
+            results[name] = (f"error: timed out after {timeout}s", None)
+    return results
+
+
+def check_readiness():
+    """
+    Return the readiness result, probing at most once per HEALTH_CACHE_TTL.
+
+    {"status": "healthy"|"unhealthy", <probe>: "ok"|"error: ...",
+     "latency_ms": {<probe>: ms or None}, "timestamp", "cached"}
+    """
+    global _cached
+    config = get_config()
+    with _lock:
+        now = time.monotonic()
+        if _cached and _cached[0] > now:
+            return dict(_cached[1], cached=True)
+
+        probes = run_probes(config.HEALTH_PROBE_TIMEOUT)
+        result = {"status": "healthy"}
+        for name, (status, _) in probes.items():
+            result[name] = status
+            if status != "ok":
+                result["status"] = "unhealthy"
+        result["latency_ms"] = {name: latency for name, (_, latency) in probes.items()}
+        result["timestamp"] = datetime.utcnow().isoformat()
+
+        _cached = (time.monotonic() + config.HEALTH_CACHE_TTL, result)
+    return dict(result, cached=False)
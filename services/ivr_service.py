@@ -5,17 +5,21 @@ Adapted from Day3: uses lazy-initialized Redis and per-request DB sessions.
 """
 
 import logging
-from datetime import datetime, timedelta
-from models.database import get_session
-from models.menu_config import MenuConfiguration
-from models.call_log import CallLog
-from models.caller_history import CallerHistory
-from services.redis_service import get_redis_service
+from services.session_store import get_session_store
+from services.menu_cache import get_menu_cache
 from services.plivo_service import plivo_service
+from services import metrics
 from config import get_config
 
 logger = logging.getLogger(__name__)
 
+# Fixed responses that never depend on the menu or the caller
+UNAVAILABLE_XML = plivo_service.generate_hangup_xml("Sorry, our system is unavailable. Please try later.")
+SESSION_EXPIRED_XML = plivo_service.generate_hangup_xml("Your session has expired. Please call back.")
+SYSTEM_ERROR_XML = plivo_service.generate_hangup_xml("System error. Please try later.")
+THANK_YOU_XML = plivo_service.generate_hangup_xml("Thank you for calling.")
+INVALID_INPUT_XML = plivo_service.generate_invalid_input_xml()
+
 
 class IVRService:
     """Orchestrate the IVR call flow."""
@@ -24,50 +28,38 @@ class IVRService:
         self.config = get_config()
 
     @property
-    def redis(self):
-        return get_redis_service()
+    def sessions(self):
+        return get_session_store()
 
     def handle_incoming_call(self, call_uuid, from_number, to_number):
         """Handle incoming call: create session, return main menu XML."""
         logger.info(f"INCOMING CALL: {from_number}")
 
-        # Create session in Redis
-        self.redis.create_session(call_uuid, from_number, to_number)
+        # Create session in the session store
+        self.sessions.create_session(call_uuid, from_number, to_number)
 
-        # Load main menu from database
+        # Load main menu from the menu cache
         menu = self._get_menu_config("main_menu")
         if menu is None:
             logger.error("main_menu not found in database!")
-            return plivo_service.generate_hangup_xml(
-                "Sorry, our system is unavailable. Please try later."
-            )
-
-        # Build the action URL using Vercel deployment URL
-        base_url = self.config.WEBHOOK_BASE_URL
-        action_url = f"{base_url}/api/handle-input" if base_url else "/api/handle-input"
-
-        xml = plivo_service.generate_menu_xml(
-            message=menu.message,
-            timeout=menu.timeout,
-            max_digits=menu.max_digits,
-            action_url=action_url,
-        )
-        return xml
+            return UNAVAILABLE_XML
+
+        return self._menu_response(menu, "prompt")
 
     def handle_digit_input(self, call_uuid, digit):
         """Handle user pressing a digit."""
         logger.info(f"DIGIT INPUT: {digit}")
 
-        # Get session
-        session = self.redis.get_session(call_uuid)
+        # Get only the session fields routing needs
+        session = self.sessions.get_session_fields(call_uuid, "current_menu_id", "from_number")
         if session is None:
-            return plivo_service.generate_hangup_xml("Your session has expired. Please call back.")
+            return SESSION_EXPIRED_XML
 
         # Get current menu
         current_menu_id = session["current_menu_id"]
         menu = self._get_menu_config(current_menu_id)
         if menu is None:
-            return plivo_service.generate_hangup_xml("System error. Please try later.")
+            return SYSTEM_ERROR_XML
 
         # Validate digit
         if not menu.validate_digit(digit):
@@ -75,39 +67,66 @@ class IVRService:
             if invalid_menu_id:
                 invalid_menu = self._get_menu_config(invalid_menu_id)
                 if invalid_menu:
-                    base_url = self.config.WEBHOOK_BASE_URL
-                    action_url = f"{base_url}/api/handle-input" if base_url else "/api/handle-input"
-                    return plivo_service.generate_menu_xml(
-                        message=invalid_menu.message,
-                        timeout=invalid_menu.timeout,
-                        action_url=action_url,
-                    )
-            return plivo_service.generate_invalid_input_xml()
-
-        # Record input
-        self.redis.add_user_input(call_uuid, current_menu_id, digit)
-
-        # Determine next action
+                    return self._menu_response(invalid_menu, "prompt")
+            return INVALID_INPUT_XML
+
+        xml, moved_to = self._route_digit(session, menu, digit)
+
+        # Record input (and the menu move, if any) in one atomic Redis call
+        self.sessions.record_digit(call_uuid, current_menu_id, digit, next_menu_id=moved_to)
+        return xml
+
+    def handle_hangup(self, call_uuid, hangup_cause=None, duration=None):
+        """Handle call end: save to DB, cleanup Redis."""
+        logger.info(f"CALL HANGUP: {call_uuid}")
+
+        if self.config.CALL_LOG_WRITE_BEHIND:
+            # Queue the call for flush_call_logs and return without touching Postgres
+            if self.sessions.finalize_session(call_uuid, hangup_cause, duration) is None:
+                logger.warning("Session already expired/deleted")
+            return
+
+        # Read, mark completed, delete and free the admission slot in one Redis round trip
+        with self.sessions.batch() as batch:
+            pending = batch.get_session(call_uuid)
+            batch.mark_call_completed(call_uuid)
+            batch.delete_session(call_uuid)
+            batch.release_call(call_uuid)
+
+        session = pending.value
+        if session is None:
+            logger.warning("Session already expired/deleted")
+            return
+
+        session["state"] = "completed"
+        self._save_call_to_database(call_uuid, session, hangup_cause, duration)
+
+    # ===== HELPERS =====
+
+    def _get_menu_config(self, menu_id):
+        """Look up a menu snapshot from the per-process menu cache."""
+        return get_menu_cache().get(menu_id)
+
+    def _route_digit(self, session, menu, digit, menus=None):
+        """
+        Work out the response to a valid digit. Returns (xml, menu_id moved to or None).
+        `menus` is a snapshot mapping the caller already holds; without it the
+        next menu comes from the menu cache.
+        """
         next_menu_id = menu.get_digit_option(digit)
         if not next_menu_id:
-            return plivo_service.generate_hangup_xml("Thank you for calling.")
+            return THANK_YOU_XML, None
 
-        next_menu = self._get_menu_config(next_menu_id)
+        next_menu = menus.get(next_menu_id) if menus is not None else self._get_menu_config(next_menu_id)
         if next_menu is None:
-            return plivo_service.generate_hangup_xml("System error.")
+            return plivo_service.generate_hangup_xml("System error."), None
 
         # Generate response based on next menu's action type
         if next_menu.action_type == "transfer":
             transfer_number = next_menu.action_config.get("transfer_number") if next_menu.action_config else None
             if not transfer_number:
-                return plivo_service.generate_hangup_xml("Transfer configuration error.")
-            transfer_timeout = next_menu.action_config.get("timeout", 30)
-            self.redis.set_current_menu(call_uuid, next_menu_id)
-            return plivo_service.generate_transfer_xml(
-                phone_number=transfer_number,
-                timeout=transfer_timeout,
-                message=next_menu.message,
-            )
+                return plivo_service.generate_hangup_xml("Transfer configuration error."), None
+            return self._menu_response(next_menu, "transfer"), next_menu_id
 
         elif next_menu.action_type == "phone_readback":
             # Read the caller's phone number back to them
@@ -115,100 +134,54 @@ class IVRService:
             # Spell out digits for clarity (e.g., "+1234" → "plus 1 2 3 4")
             spoken_number = " ".join(c if c != "+" else "plus" for c in from_number)
             message = f"Your phone number is {spoken_number}. Thank you for calling. Goodbye."
-            return plivo_service.generate_hangup_xml(message)
+            with metrics.timed("xml"):
+                return plivo_service.generate_hangup_xml(
+                    message, voice=next_menu.voice, language=next_menu.language
+                ), next_menu_id
 
         elif next_menu.action_type == "hangup":
-            return plivo_service.generate_hangup_xml(next_menu.message)
+            # Terminal menus still go into menu_history, so the funnel tells a
+            # call that reached them apart from one that hung up before
+            return self._menu_response(next_menu, "hangup"), next_menu_id
 
         else:
             # Navigate to next menu
-            self.redis.set_current_menu(call_uuid, next_menu_id)
-            base_url = self.config.WEBHOOK_BASE_URL
-            action_url = f"{base_url}/api/handle-input" if base_url else "/api/handle-input"
-            return plivo_service.generate_menu_xml(
-                message=next_menu.message,
-                timeout=next_menu.timeout,
-                max_digits=next_menu.max_digits,
-                action_url=action_url,
-            )
-
-    def handle_hangup(self, call_uuid, hangup_cause=None, duration=None):
-        """Handle call end: save to DB, cleanup Redis."""
-        logger.info(f"CALL HANGUP: {call_uuid}")
-
-        session = self.redis.get_session(call_uuid)
-        if session is None:
-            logger.warning("Session already expired/deleted")
-            return
-
-        self.redis.mark_call_completed(call_uuid)
-        self._save_call_to_database(call_uuid, session, hangup_cause, duration)
-        self._update_caller_history(session["from_number"], duration)
-        self.redis.delete_session(call_uuid)
-
-    # ===== HELPERS =====
+            return self._menu_response(next_menu, "prompt"), next_menu_id
+
+    def _menu_response(self, menu, variant):
+        """Serve a menu's pre-rendered XML, rendering it on the spot if missing."""
+        action_type = menu.action_type or "menu"
+        xml = self._prerendered(menu.menu_id, action_type, variant)
+        if xml is not None:
+            return xml
+        with metrics.timed("xml"):
+            rendered = plivo_service.prerender_menu_responses(menu, self.config.HANDLE_INPUT_URL)
+            xml = rendered.get((menu.menu_id, action_type, variant))
+            if xml is None:
+                # Only reachable when a menu is used as something it wasn't configured for
+                xml = plivo_service.generate_menu_xml(
+                    message=menu.message,
+                    timeout=menu.timeout,
+                    max_digits=menu.max_digits,
+                    action_url=self.config.HANDLE_INPUT_URL,
+                    voice=menu.voice,
+                    language=menu.language,
+                    audio_url=menu.audio_url,
+                )
+        return xml
 
-    def _get_menu_config(self, menu_id):
-        """Load menu configuration from database."""
-        db = get_session()
-        try:
-            return db.query(MenuConfiguration).filter_by(menu_id=menu_id).first()
-        finally:
-            db.close()
+    def _prerendered(self, menu_id, action_type, variant):
+        return get_menu_cache().response(menu_id, action_type, variant)
 
     def _save_call_to_database(self, call_uuid, session, hangup_cause, duration):
-        """Save call data to CallLog table."""
-        db = get_session()
+        """Write the CallLog row and CallerHistory counters in one statement."""
+        # Imported here so answering a call doesn't load SQLAlchemy
+        from services.call_log_writer import call_log_values, finalize_calls
         try:
-            start_time = datetime.fromisoformat(session["start_time"])
-            end_time = start_time + timedelta(seconds=duration) if duration else datetime.utcnow()
-
-            call_log = CallLog(
-                call_uuid=call_uuid,
-                from_number=session["from_number"],
-                to_number=session["to_number"],
-                start_time=start_time,
-                end_time=end_time,
-                duration=duration,
-                menu_path=session.get("menu_history"),
-                user_inputs=session.get("user_inputs"),
-                call_status="completed",
-                hangup_cause=hangup_cause,
-            )
-            db.add(call_log)
-            db.commit()
+            finalize_calls([call_log_values(call_uuid, session, hangup_cause, duration)])
             logger.info(f"Saved call to CallLog: {call_uuid}")
         except Exception as e:
             logger.error(f"Error saving call: {e}")
-            db.rollback()
-        finally:
-            db.close()
-
-    def _update_caller_history(self, phone_number, duration):
-        """Update caller history with new call data."""
-        db = get_session()
-        try:
-            caller = db.query(CallerHistory).filter_by(phone_number=phone_number).first()
-            if caller:
-                caller.total_calls += 1
-                if duration:
-                    caller.total_duration += duration
-                caller.last_call_at = datetime.utcnow()
-            else:
-                caller = CallerHistory(
-                    phone_number=phone_number,
-                    first_call_at=datetime.utcnow(),
-                    last_call_at=datetime.utcnow(),
-                    total_calls=1,
-                    total_duration=duration or 0,
-                )
-                db.add(caller)
-            db.commit()
-        except Exception as e:
-            logger.error(f"Error updating caller history: {e}")
-            db.rollback()
-        finally:
-            db.close()
 
 
 # Lazy singleton
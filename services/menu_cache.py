@@ -0,0 +1,260 @@
+"""
+Menu Cache - Per-process cache of IVR menu configuration.
+
+Every webhook used to open a fresh Postgres connection (NullPool) just to
+read a few MenuConfiguration rows. Menus change rarely, so we load all of
+them in one query, keep detached immutable snapshots keyed by menu_id, and
+only reload when the shared menu version in Redis moves. /api/seed-menus
+bumps that version, so every warm instance picks up the change on its next
+version check.
+
+When MENU_ARTIFACT_PATH points at a compiled routing artifact (see
+services/menu_graph.py), menus come from that file instead and are never
+reloaded: the artifact is fixed for the lifetime of a deployment.
+
+Each load also pre-renders the static Plivo XML for every menu, so serving
+a menu prompt, transfer or goodbye is a dict lookup returning ready bytes.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass, fields
+from types import MappingProxyType
+from typing import Mapping, Optional
+from config import get_config
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class MenuSnapshot:
+    """Read-only copy of a MenuConfiguration row, safe to share across requests."""
+
+    menu_id: str
+    parent_menu_id: Optional[str]
+    menu_type: str
+    title: str
+    message: str
+    audio_url: Optional[str]
+    language: str
+    voice: str
+    max_digits: int
+    timeout: int
+    digit_actions: Optional[Mapping[str, str]]
+    invalid_input_menu_id: Optional[str]
+    timeout_menu_id: Optional[str]
+    action_type: Optional[str]
+    action_config: Optional[Mapping[str, object]]
+    is_active: bool
+    priority: int
+
+    @classmethod
+    def from_model(cls, menu):
+        return cls(
+            menu_id=menu.menu_id,
+            parent_menu_id=menu.parent_menu_id,
+            menu_type=menu.menu_type,
+            title=menu.title,
+            message=menu.message,
+            audio_url=menu.audio_url,
+            language=menu.language,
+            voice=menu.voice,
+            max_digits=menu.max_digits,
+            timeout=menu.timeout,
+            digit_actions=_freeze(menu.digit_actions),
+            invalid_input_menu_id=menu.invalid_input_menu_id,
+            timeout_menu_id=menu.timeout_menu_id,
+            action_type=menu.action_type,
+            action_config=_freeze(menu.action_config),
+            is_active=menu.is_active,
+            priority=menu.priority,
+        )
+
+    @classmethod
+    def from_record(cls, record):
+        """Build a snapshot from a plain dict, e.g. one read from a compiled artifact."""
+        values = {f.name: record.get(f.name) for f in fields(cls)}
+        values["digit_actions"] = _freeze(values["digit_actions"])
+        values["action_config"] = _freeze(values["action_config"])
+        return cls(**values)
+
+    def as_record(self):
+        """Return the snapshot as a JSON-serializable dict."""
+        record = {f.name: getattr(self, f.name) for f in fields(self)}
+        for name in ("digit_actions", "action_config"):
+            if record[name] is not None:
+                record[name] = dict(record[name])
+        return record
+
+    def get_digit_option(self, digit):
+        if self.digit_actions and digit in self.digit_actions:
+            return self.digit_actions[digit]
+        return None
+
+    def validate_digit(self, digit):
+        if self.digit_actions:
+            return digit in self.digit_actions
+        return False
+
+
+def _freeze(mapping):
+    if mapping is None:
+        return None
+    return MappingProxyType(dict(mapping))
+
+
+class MenuCache:
+    """Hold menu snapshots for this process, keyed by menu_id."""
+
+    def __init__(self):
+        self.config = get_config()
+        self._menus = None
+        self._responses = {}
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, menu_id):
+        """Return the MenuSnapshot for menu_id, or None if it doesn't exist."""
+        return self.all().get(menu_id)
+
+    def response(self, menu_id, action_type, variant):
+        """Return pre-rendered XML bytes for (menu_id, action_type, variant), or None."""
+        self.all()
+        return self._responses.get((menu_id, action_type, variant))
+
+    def response_cached(self, menu_id, action_type, variant):
+        """response() without the freshness check, for callers that just ran all_async()."""
+        return self._responses.get((menu_id, action_type, variant))
+
+    def all(self):
+        """Return a read-only mapping of every menu snapshot."""
+        if self._is_fresh():
+            return self._menus
+
+        with self._lock:
+            if self._is_fresh():
+                return self._menus
+            if self.config.MENU_ARTIFACT_PATH:
+                return self._use_artifact()
+            return self._refresh(self._read_version())
+
+    async def all_async(self, read_version):
+        """
+        all() for the ASGI app: `read_version` is the async session store's
+        get_menu_version, awaited instead of blocking the event loop. The
+        rare reload (a Postgres query) runs in a worker thread.
+        """
+        if self._is_fresh():
+            return self._menus
+        if self.config.MENU_ARTIFACT_PATH:
+            return await asyncio.to_thread(self.all)
+
+        try:
+            version = await read_version()
+        except Exception as e:
+            logger.warning(f"Menu version check failed: {e}")
+            version = self._version
+
+        if self._menus is not None and version == self._version:
+            self._checked_at = time.monotonic()
+            return self._menus
+        return await asyncio.to_thread(self._refresh_locked, version)
+
+    def _is_fresh(self):
+        return (
+            self._menus is not None
+            and time.monotonic() - self._checked_at < self.config.MENU_VERSION_CHECK_INTERVAL
+        )
+
+    def _use_artifact(self):
+        if self._menus is None:
+            self._load_artifact()
+        self._checked_at = float("inf")
+        return self._menus
+
+    def _refresh_locked(self, version):
+        with self._lock:
+            return self._refresh(version)
+
+    def _refresh(self, version):
+        """Reload if version moved (or nothing is loaded). Caller holds the lock."""
+        if self._menus is None or version != self._version:
+            self._menus = self._load_menus()
+            self._responses = self._render_responses(self._menus)
+            self._version = version
+            logger.info(f"Menu cache loaded {len(self._menus)} menus (version {version})")
+        self._checked_at = time.monotonic()
+        return self._menus
+
+    def invalidate(self):
+        """Drop the local snapshot so the next lookup reloads from the database."""
+        with self._lock:
+            self._menus = None
+            self._responses = {}
+            self._version = None
+            self._checked_at = 0.0
+
+    def bump_version(self):
+        """Mark menus as changed for every instance. Call after editing menus."""
+        self.invalidate()
+        try:
+            from services.session_store import get_session_store
+            return get_session_store().bump_menu_version()
+        except Exception as e:
+            logger.warning(f"Could not bump menu version: {e}")
+            return None
+
+    # ===== HELPERS =====
+
+    def _read_version(self):
+        try:
+            from services.session_store import get_session_store
+            return get_session_store().get_menu_version()
+        except Exception as e:
+            # Keep serving the snapshot we have; a reload happens once Redis is back
+            logger.warning(f"Menu version check failed: {e}")
+            return self._version
+
+    def _load_artifact(self):
+        from services.menu_graph import load_artifact
+
+        version, menus = load_artifact(self.config.MENU_ARTIFACT_PATH)
+        self._menus = MappingProxyType(menus)
+        self._responses = self._render_responses(self._menus)
+        self._version = version
+        logger.info(f"Menu cache loaded {len(menus)} menus from artifact (version {version})")
+
+    def _load_menus(self):
+        from models.database import get_session
+        from models.menu_config import MenuConfiguration
+
+        db = get_session()
+        try:
+            rows = db.query(MenuConfiguration).all()
+            return MappingProxyType({row.menu_id: MenuSnapshot.from_model(row) for row in rows})
+        finally:
+            db.close()
+
+    def _render_responses(self, menus):
+        from services.plivo_service import plivo_service
+        from services import metrics
+
+        responses = {}
+        with metrics.timed("xml"):
+            for menu in menus.values():
+                responses.update(plivo_service.prerender_menu_responses(menu, self.config.HANDLE_INPUT_URL))
+        return responses
+
+
+# Lazy singleton
+_menu_cache = None
+
+
+def get_menu_cache():
+    global _menu_cache
+    if _menu_cache is None:
+        _menu_cache = MenuCache()
+    return _menu_cache
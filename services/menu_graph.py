@@ -0,0 +1,159 @@
+"""
+Menu Graph - Validate the menu graph and compile it into a routing artifact.
+
+MenuConfiguration rows link to each other through digit_actions,
+invalid_input_menu_id, timeout_menu_id and parent_menu_id. The compiler
+checks that graph once, ahead of time, and writes a flat JSON transition
+table. Pointing MENU_ARTIFACT_PATH at that file lets the app load menus at
+cold start without touching Postgres on the call path.
+
+Compile with: python scripts/compile_menus.py
+"""
+
+import hashlib
+import json
+import os
+from datetime import datetime
+from services.menu_cache import MenuSnapshot
+
+ARTIFACT_FORMAT = 1
+DEFAULT_ARTIFACT_PATH = "menus.compiled.json"
+ENTRY_MENU_ID = "main_menu"
+
+# Menu types that end the caller's trip through the menus
+EXIT_ACTION_TYPES = {"transfer", "hangup", "phone_readback"}
+
+
+class MenuGraphError(Exception):
+    """Raised when the menu graph fails validation."""
+
+    def __init__(self, problems):
+        self.problems = problems
+        super().__init__("; ".join(problems))
+
+
+def _edges(menu):
+    """Yield (label, target) for every menu this one can route to at runtime."""
+    for digit, target in sorted((menu.digit_actions or {}).items()):
+        yield f"digit {digit}", target
+    if menu.invalid_input_menu_id:
+        yield "invalid_input_menu_id", menu.invalid_input_menu_id
+    if menu.timeout_menu_id:
+        yield "timeout_menu_id", menu.timeout_menu_id
+
+
+def validate_menus(menus, entry=ENTRY_MENU_ID):
+    """
+    Check a {menu_id: MenuSnapshot} graph and return a list of problems.
+
+    Looks for dangling targets, menus unreachable from the entry menu,
+    menus that can never reach an exit (cycles or dead ends), and transfer
+    menus without a transfer_number. An empty list means the graph is valid.
+    """
+    problems = []
+
+    if entry not in menus:
+        problems.append(f"entry menu '{entry}' does not exist")
+
+    for menu_id, menu in sorted(menus.items()):
+        for label, target in _edges(menu):
+            if target and target not in menus:
+                problems.append(f"{menu_id}: {label} points to missing menu '{target}'")
+        if menu.parent_menu_id and menu.parent_menu_id not in menus:
+            problems.append(f"{menu_id}: parent_menu_id points to missing menu '{menu.parent_menu_id}'")
+
+        if menu.action_type == "transfer":
+            if not (menu.action_config or {}).get("transfer_number"):
+                problems.append(f"{menu_id}: transfer menu has no transfer_number")
+        elif menu.action_type not in EXIT_ACTION_TYPES and not menu.digit_actions:
+            problems.append(f"{menu_id}: menu has no digit_actions")
+
+    if entry not in menus:
+        return problems
+
+    # Reachability from the entry menu
+    reachable = set()
+    stack = [entry]
+    while stack:
+        menu_id = stack.pop()
+        if menu_id in reachable or menu_id not in menus:
+            continue
+        reachable.add(menu_id)
+        stack.extend(target for _, target in _edges(menus[menu_id]) if target)
+
+    for menu_id in sorted(set(menus) - reachable):
+        problems.append(f"{menu_id}: unreachable from '{entry}'")
+
+    # Walk edges backwards from every exit; whatever isn't reached is stuck
+    incoming = {menu_id: set() for menu_id in menus}
+    can_exit = set()
+    for menu_id, menu in menus.items():
+        if menu.action_type in EXIT_ACTION_TYPES:
+            can_exit.add(menu_id)
+        for _, target in _edges(menu):
+            if not target:
+                # An empty digit target hangs up with "Thank you for calling"
+                can_exit.add(menu_id)
+            elif target in incoming:
+                incoming[target].add(menu_id)
+
+    stack = list(can_exit)
+    while stack:
+        for source in incoming[stack.pop()]:
+            if source not in can_exit:
+                can_exit.add(source)
+                stack.append(source)
+
+    for menu_id in sorted(reachable - can_exit):
+        problems.append(f"{menu_id}: no path to a transfer, hangup or readback (cycle without exit)")
+
+    return problems
+
+
+def compile_menus(menus, entry=ENTRY_MENU_ID):
+    """Validate menus and return the routing artifact as a dict. Raises MenuGraphError."""
+    problems = validate_menus(menus, entry)
+    if problems:
+        raise MenuGraphError(problems)
+
+    records = {menu_id: menus[menu_id].as_record() for menu_id in sorted(menus)}
+    transitions = {
+        menu_id: {label: target for label, target in _edges(menu)}
+        for menu_id, menu in sorted(menus.items())
+    }
+    digest = hashlib.sha256(
+        json.dumps({"menus": records, "entry": entry}, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+    return {
+        "format": ARTIFACT_FORMAT,
+        "version": digest[:16],
+        "compiled_at": datetime.utcnow().isoformat(),
+        "entry": entry,
+        "transitions": transitions,
+        "menus": records,
+    }
+
+
+def write_artifact(artifact, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(artifact, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def load_artifact(path):
+    """Read a compiled artifact and return (version, {menu_id: MenuSnapshot})."""
+    if not os.path.isabs(path):
+        # Relative paths are relative to the project root, not the process cwd
+        path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), path)
+    with open(path, encoding="utf-8") as f:
+        artifact = json.load(f)
+
+    if artifact.get("format") != ARTIFACT_FORMAT:
+        raise ValueError(f"Unsupported menu artifact format: {artifact.get('format')}")
+
+    menus = {
+        menu_id: MenuSnapshot.from_record(record)
+        for menu_id, record in artifact["menus"].items()
+    }
+    return artifact["version"], menus
@@ -0,0 +1,202 @@
+"""
+Metrics - Per-request timings, Server-Timing headers and Prometheus aggregates.
+
+api/index.py starts a request timer (start_request) and finishes it in an
+after_request hook (finish_request), which:
+- adds the request's latency to a per-route histogram
+- returns a Server-Timing header with time spent per dependency and in total
+
+Dependencies are timed where the calls happen, with `with timed("redis"):`
+or record_dependency():
+- redis: every command/transaction sent by RedisSessionService
+- postgres: every statement (and new connection) on the SQLAlchemy engine
+- xml: rendering Plivo XML in IVRService
+
+Per-request timings live in a contextvar, so concurrent requests on
+threads never mix; process-wide aggregates are behind a lock. Aggregates
+are per instance and reset on cold start; scrape /api/metrics (Prometheus
+text format) and compare histogram_quantile(0.5/0.99, ...) across deploys.
+"""
+
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from config import get_config
+
+# With METRICS_ENABLED=false, timed()/record_dependency() record nothing
+ENABLED = get_config().METRICS_ENABLED
+
+# Histogram upper bounds in seconds, shared by routes and dependencies
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# {dependency: [calls, seconds]} for the current request, None outside one
+_request_timings = ContextVar("request_timings", default=None)
+
+_lock = threading.Lock()
+_started_at = time.time()
+
+
+class _Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.total += seconds
+        self.count += 1
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+
+
+_routes = defaultdict(_Histogram)          # (method, route, status) -> histogram
+_dependencies = defaultdict(_Histogram)    # dependency -> histogram
+_dependency_errors = defaultdict(int)      # dependency -> failed calls
+_shed_calls = defaultdict(int)             # reason -> calls refused by admission control
+
+
+# ===== RECORDING =====
+
+def record_dependency(name, seconds, error=False):
+    """Count one call to a dependency for this request and the process totals."""
+    if not ENABLED:
+        return
+    timings = _request_timings.get()
+    if timings is not None:
+        entry = timings.setdefault(name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+    with _lock:
+        _dependencies[name].observe(seconds)
+        if error:
+            _dependency_errors[name] += 1
+
+
+@contextmanager
+def timed(name):
+    """Time the enclosed call to dependency `name`."""
+    started = time.perf_counter()
+    error = False
+    try:
+        yield
+    except Exception:
+        error = True
+        raise
+    finally:
+        record_dependency(name, time.perf_counter() - started, error)
+
+
+def record_shed(reason):
+    """Count one incoming call shed by admission control ("caller" or "global")."""
+    with _lock:
+        _shed_calls[reason] += 1
+
+
+def start_request():
+    """Begin timing a request. Returns a token for finish_request."""
+    return time.perf_counter(), _request_timings.set({})
+
+
+def request_timings():
+    """{dependency: (calls, seconds)} recorded so far in the current request."""
+    return {name: (calls, seconds) for name, (calls, seconds) in (_request_timings.get() or {}).items()}
+
+
+def finish_request(token, method, route, status):
+    """
+    Record the request in the route histogram and return its Server-Timing
+    header value, e.g. 'redis;dur=3.1;desc="2 calls", total;dur=8.4'.
+    """
+    started, context_token = token
+    elapsed = time.perf_counter() - started
+    timings = _request_timings.get() or {}
+    _request_timings.reset(context_token)
+
+    with _lock:
+        _routes[(method, route, str(status))].observe(elapsed)
+
+    parts = [
+        f'{name};dur={seconds * 1000:.2f};desc="{calls} call{"" if calls == 1 else "s"}"'
+        for name, (calls, seconds) in timings.items()
+    ]
+    parts.append(f"total;dur={elapsed * 1000:.2f}")
+    return ", ".join(parts)
+
+
+# ===== EXPOSITION =====
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _histogram_lines(metric, labels, histogram):
+    label_text = ",".join(f'{key}="{_label(value)}"' for key, value in labels)
+    prefix = f"{label_text}," if label_text else ""
+    lines = []
+    cumulative = 0
+    for bound, count in zip(BUCKETS, histogram.counts):
+        cumulative += count
+        lines.append(f'{metric}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+    lines.append(f'{metric}_bucket{{{prefix}le="+Inf"}} {histogram.count}')
+    lines.append(f"{metric}_sum{{{label_text}}} {histogram.total:.6f}")
+    lines.append(f"{metric}_count{{{label_text}}} {histogram.count}")
+    return lines
+
+
+def render_prometheus():
+    """All aggregates in the Prometheus text exposition format."""
+    with _lock:
+        routes = sorted(_routes.items())
+        dependencies = sorted(_dependencies.items())
+        errors = sorted(_dependency_errors.items())
+        shed = sorted(_shed_calls.items())
+
+        lines = [
+            "# HELP ivr_request_duration_seconds Request latency by route",
+            "# TYPE ivr_request_duration_seconds histogram",
+        ]
+        for (method, route, status), histogram in routes:
+            lines += _histogram_lines(
+                "ivr_request_duration_seconds",
+                [("method", method), ("route", route), ("status", status)],
+                histogram,
+            )
+
+        lines += [
+            "# HELP ivr_dependency_duration_seconds Time per call to Redis, Postgres and XML rendering",
+            "# TYPE ivr_dependency_duration_seconds histogram",
+        ]
+        for name, histogram in dependencies:
+            lines += _histogram_lines("ivr_dependency_duration_seconds", [("dependency", name)], histogram)
+
+    lines += [
+        "# HELP ivr_dependency_errors_total Dependency calls that raised",
+        "# TYPE ivr_dependency_errors_total counter",
+    ]
+    lines += [f'ivr_dependency_errors_total{{dependency="{_label(name)}"}} {count}' for name, count in errors]
+    lines += [
+        "# HELP ivr_calls_shed_total Incoming calls refused by admission control, by limit hit",
+        "# TYPE ivr_calls_shed_total counter",
+    ]
+    lines += [f'ivr_calls_shed_total{{reason="{_label(reason)}"}} {count}' for reason, count in shed]
+    lines += [
+        "# HELP ivr_process_start_time_seconds When this instance started collecting metrics",
+        "# TYPE ivr_process_start_time_seconds gauge",
+        f"ivr_process_start_time_seconds {_started_at:.3f}",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    """Clear every aggregate."""
+    with _lock:
+        _routes.clear()
+        _dependencies.clear()
+        _dependency_errors.clear()
+        _shed_calls.clear()
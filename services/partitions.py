@@ -0,0 +1,318 @@
+"""
+Partitions - Monthly range partitioning of call_logs on start_time (Postgres).
+
+After migrate_to_partitioned(), call_logs is a partitioned parent with one
+partition per month (call_logs_pYYYY_MM) plus call_logs_default for rows
+outside every month partition. Indexes defined on CallLog are created on
+the parent and cascade to each partition, so they stay month-sized.
+
+Postgres requires unique constraints on a partitioned table to include the
+partition key, so call_uuid is unique per (call_uuid, start_time) there.
+A replayed call has the same start_time, so ON CONFLICT still makes
+finalization idempotent; call_log_conflict_target() picks the right columns.
+That also means call_uuid alone is no longer globally unique once
+partitioned: the same call_uuid with a different start_time is a new row.
+
+Whether call_logs is partitioned is cached per process. An instance that
+cached the old answer before another one migrated gets an ON CONFLICT
+error; writers check conflict_target_outdated() and retry once.
+
+Maintenance (scripts/manage_partitions.py, /api/maintenance/partitions):
+- ensure_partitions(): create this month's and upcoming partitions
+- archive_partitions(): export months older than the retention window to
+  gzipped NDJSON, then detach (or drop) them
+- attach_partition() / restore_archive(): bring a month back for audits
+"""
+
+import gzip
+import json
+import logging
+import os
+import re
+from datetime import date, datetime
+from sqlalchemy import DateTime, text
+from models.call_log import CallLog
+
+logger = logging.getLogger(__name__)
+
+TABLE = CallLog.__tablename__
+DEFAULT_PARTITION = f"{TABLE}_default"
+PARTITION_NAME = re.compile(rf"^{TABLE}_p(\d{{4}})_(\d{{2}})$")
+
+# Per-process cache of whether call_logs is partitioned
+_partitioned = None
+
+
+def _month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def _add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f"{TABLE}_p{month.year:04d}_{month.month:02d}"
+
+
+def partition_month(name):
+    """The first day of the month a partition covers, or None for other tables."""
+    match = PARTITION_NAME.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def is_partitioned(conn, refresh=False):
+    """True when call_logs is a partitioned table. Cached per process."""
+    global _partitioned
+    if _partitioned is None or refresh:
+        if conn.dialect.name != "postgresql":
+            _partitioned = False
+        else:
+            relkind = conn.execute(
+                text("SELECT relkind::text FROM pg_class WHERE oid = to_regclass(:table)"),
+                {"table": TABLE},
+            ).scalar()
+            _partitioned = relkind == "p"
+    return _partitioned
+
+
+def call_log_conflict_target(conn):
+    """Columns for ON CONFLICT on call_logs: the unique key differs once partitioned."""
+    return ["call_uuid", "start_time"] if is_partitioned(conn) else ["call_uuid"]
+
+
+def conflict_target_outdated(error):
+    """
+    True when a DBAPIError is Postgres rejecting the ON CONFLICT columns
+    because call_logs was (un)partitioned since this process cached it.
+    Drops the cache, so the caller can retry in a new transaction.
+    """
+    global _partitioned
+    orig = getattr(error, "orig", None)
+    code = getattr(orig, "pgcode", None) or getattr(orig, "sqlstate", None)
+    if code != "42P10" and "matching the ON CONFLICT specification" not in str(error):
+        return False
+    logger.warning("call_logs unique key changed under this process; re-checking partitioning")
+    _partitioned = None
+    return True
+
+
+def list_partitions(conn):
+    """Attached partitions of call_logs as [(name, month or None for default)], oldest first."""
+    names = conn.execute(text("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = to_regclass(:table)
+        ORDER BY child.relname
+    """), {"table": TABLE}).scalars().all()
+    return [(name, partition_month(name)) for name in names]
+
+
+def _create_partition(conn, month):
+    """Create the partition for month, moving any of its rows out of the default partition."""
+    name = partition_name(month)
+    lower, upper = month.isoformat(), _add_months(month, 1).isoformat()
+    stranded = conn.execute(
+        text(f"SELECT count(*) FROM {DEFAULT_PARTITION} WHERE start_time >= :lower AND start_time < :upper"),
+        {"lower": lower, "upper": upper},
+    ).scalar()
+
+    if not stranded:
+        conn.execute(text(
+            f"CREATE TABLE {name} PARTITION OF {TABLE} FOR VALUES FROM ('{lower}') TO ('{upper}')"
+        ))
+        return
+
+    # Postgres refuses a new partition whose range already has rows in the
+    # default partition, so move them across while the default is detached
+    conn.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {DEFAULT_PARTITION}"))
+    conn.execute(text(
+        f"CREATE TABLE {name} PARTITION OF {TABLE} FOR VALUES FROM ('{lower}') TO ('{upper}')"
+    ))
+    params = {"lower": lower, "upper": upper}
+    conn.execute(text(
+        f"INSERT INTO {name} SELECT * FROM {DEFAULT_PARTITION} WHERE start_time >= :lower AND start_time < :upper"
+    ), params)
+    conn.execute(text(
+        f"DELETE FROM {DEFAULT_PARTITION} WHERE start_time >= :lower AND start_time < :upper"
+    ), params)
+    conn.execute(text(f"ALTER TABLE {TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"))
+    logger.info(f"Moved {stranded} rows from {DEFAULT_PARTITION} into {name}")
+
+
+def ensure_partitions(engine, months_ahead=3, today=None):
+    """Create partitions from this month through months_ahead months out. Returns the names created."""
+    today = today or datetime.utcnow().date()
+    created = []
+    with engine.begin() as conn:
+        if not is_partitioned(conn, refresh=True):
+            raise RuntimeError(f"{TABLE} is not partitioned; run scripts/manage_partitions.py migrate first")
+        existing = {name for name, _ in list_partitions(conn)}
+        month = _month_start(today)
+        for _ in range(months_ahead + 1):
+            if partition_name(month) not in existing:
+                _create_partition(conn, month)
+                created.append(partition_name(month))
+            month = _add_months(month, 1)
+    if created:
+        logger.info(f"Created partitions: {', '.join(created)}")
+    return created
+
+
+def migrate_to_partitioned(engine, months_ahead=3):
+    """
+    Convert an unpartitioned call_logs into a partitioned one, in one transaction.
+
+    The old table is renamed to call_logs_legacy (its indexes get a _legacy
+    suffix), a partitioned call_logs is created with the same columns,
+    partitions are created for every month that has rows plus months_ahead
+    upcoming months, and the rows are copied across. Drop call_logs_legacy
+    once the new table has been checked.
+    """
+    from models.database import Base
+
+    legacy = f"{TABLE}_legacy"
+    with engine.begin() as conn:
+        if is_partitioned(conn, refresh=True):
+            raise RuntimeError(f"{TABLE} is already partitioned")
+
+        conn.execute(text(f"ALTER TABLE {TABLE} RENAME TO {legacy}"))
+        for index in conn.execute(
+            text("SELECT indexname FROM pg_indexes WHERE tablename = :table"), {"table": legacy}
+        ).scalars().all():
+            conn.execute(text(f'ALTER INDEX "{index}" RENAME TO "{index[:56]}_legacy"'))
+
+        conn.execute(text(f"""
+            CREATE TABLE {TABLE} (
+                LIKE {legacy} INCLUDING DEFAULTS,
+                PRIMARY KEY (id, start_time),
+                UNIQUE (call_uuid, start_time)
+            ) PARTITION BY RANGE (start_time)
+        """))
+        # Keep the id sequence when the legacy table is dropped
+        sequence = conn.execute(text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": legacy}).scalar()
+        if sequence:
+            conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {TABLE}.id"))
+        conn.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT"))
+
+        first, last = conn.execute(text(f"SELECT min(start_time), max(start_time) FROM {legacy}")).one()
+        month = _month_start(first.date()) if first else _month_start(datetime.utcnow().date())
+        end = _add_months(_month_start(max(last.date() if last else month, datetime.utcnow().date())), months_ahead)
+        while month <= end:
+            _create_partition(conn, month)
+            month = _add_months(month, 1)
+
+        # Indexes on the parent cascade to every partition. Unique indexes
+        # without start_time can't exist on a partitioned table, so those
+        # become plain indexes (call_uuid lookups still use them).
+        for index in Base.metadata.tables[TABLE].indexes:
+            if index.unique:
+                columns = ", ".join(column.name for column in index.columns)
+                conn.execute(text(f"CREATE INDEX {index.name} ON {TABLE} ({columns})"))
+            else:
+                index.create(bind=conn)
+
+        moved = conn.execute(text(f"INSERT INTO {TABLE} SELECT * FROM {legacy}")).rowcount
+        is_partitioned(conn, refresh=True)
+    logger.info(f"Migrated {moved} rows into partitioned {TABLE}")
+    return moved
+
+
+def _json_value(value):
+    return value.isoformat() if isinstance(value, (datetime, date)) else value
+
+
+def export_partition(engine, name, out_dir):
+    """Write every row of a partition to <out_dir>/<name>.ndjson.gz. Returns (path, rows)."""
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, f"{name}.ndjson.gz")
+    tmp_path = f"{path}.tmp"
+    rows = 0
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=5000).execute(
+            text(f"SELECT * FROM {name} ORDER BY start_time, id")
+        )
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            for row in result.mappings():
+                f.write(json.dumps({key: _json_value(value) for key, value in row.items()}, separators=(",", ":")))
+                f.write("\n")
+                rows += 1
+    os.replace(tmp_path, path)
+    return path, rows
+
+
+def archive_partitions(engine, retention_months, out_dir, drop=False, today=None):
+    """
+    Export, then detach (or drop) month partitions that ended before the
+    retention window. A partition is only detached after its file has been
+    written and its row count matches. Returns [{partition, file, rows, action}].
+    """
+    today = today or datetime.utcnow().date()
+    cutoff = _add_months(_month_start(today), -retention_months)
+    archived = []
+
+    with engine.connect() as conn:
+        if not is_partitioned(conn, refresh=True):
+            raise RuntimeError(f"{TABLE} is not partitioned; run scripts/manage_partitions.py migrate first")
+        old = [name for name, month in list_partitions(conn) if month and month < cutoff]
+
+    for name in old:
+        path, rows = export_partition(engine, name, out_dir)
+        with engine.begin() as conn:
+            count = conn.execute(text(f"SELECT count(*) FROM {name}")).scalar()
+            if count != rows:
+                raise RuntimeError(f"{name}: exported {rows} rows but the partition has {count}; not detaching")
+            conn.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {name}"))
+            if drop:
+                conn.execute(text(f"DROP TABLE {name}"))
+        action = "dropped" if drop else "detached"
+        logger.info(f"Archived {name}: {rows} rows to {path} ({action})")
+        archived.append({"partition": name, "file": path, "rows": rows, "action": action})
+    return archived
+
+
+def attach_partition(engine, name):
+    """Re-attach a detached month partition (e.g. call_logs_p2025_01) for queries."""
+    month = partition_month(name)
+    if month is None:
+        raise ValueError(f"{name} is not a month partition name ({TABLE}_pYYYY_MM)")
+    with engine.begin() as conn:
+        lower, upper = month.isoformat(), _add_months(month, 1).isoformat()
+        conn.execute(text(
+            f"ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM ('{lower}') TO ('{upper}')"
+        ))
+
+
+def restore_archive(engine, path):
+    """Recreate a dropped month partition from its .ndjson.gz archive. Returns rows loaded."""
+    name = os.path.basename(path).split(".", 1)[0]
+    month = partition_month(name)
+    if month is None:
+        raise ValueError(f"{path} is not a partition archive ({TABLE}_pYYYY_MM.ndjson.gz)")
+
+    timestamps = [column.name for column in CallLog.__table__.columns if isinstance(column.type, DateTime)]
+    rows = 0
+    with engine.begin() as conn:
+        if name in {existing for existing, _ in list_partitions(conn)}:
+            raise RuntimeError(f"{name} is attached; restoring would duplicate its rows")
+        if conn.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar():
+            raise RuntimeError(f"{name} still exists detached; use attach instead")
+        _create_partition(conn, month)
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            batch = []
+            for line in f:
+                record = json.loads(line)
+                for key in timestamps:
+                    if record.get(key):
+                        record[key] = datetime.fromisoformat(record[key])
+                batch.append(record)
+                if len(batch) == 1000:
+                    conn.execute(CallLog.__table__.insert(), batch)
+                    rows += len(batch)
+                    batch = []
+            if batch:
+                conn.execute(CallLog.__table__.insert(), batch)
+                rows += len(batch)
+    return rows
@@ -1,76 +1,81 @@
 """
 Plivo XML Service - Generates XML responses for Plivo Voice API.
-Same as Day3 version, no changes needed for Vercel.
+
+Responses are built with the verb classes in services/plivo_xml.py and
+returned as compact UTF-8 bytes, ready to send as the response body.
+Menus speak with their configured voice and language, or play their
+audio_url instead when one is set. The common spoken shapes are compiled
+templates; recorded audio and multi-number transfers use the builder.
 """
 
 from config import get_config
+from services.plivo_xml import Dial, GetDigits, Hangup, Number, Play, Response, Slot, Speak, Template
 
 config = get_config()
 
+_SPEAK = Speak(Slot("message"), voice=Slot("voice"), language=Slot("language"))
+_DIAL = Dial(Number(Slot("phone_number")), timeout=Slot("timeout"))
+
+MENU_TEMPLATE = Template(Response(
+    GetDigits(_SPEAK, action=Slot("action_url"), timeout=Slot("timeout"), num_digits=Slot("max_digits"))
+))
+TRANSFER_TEMPLATE = Template(Response(_DIAL))
+SPEAK_TRANSFER_TEMPLATE = Template(Response(_SPEAK, _DIAL))
+HANGUP_TEMPLATE = Template(Response(Hangup()))
+SPEAK_HANGUP_TEMPLATE = Template(Response(_SPEAK, Hangup()))
+SPEAK_TEMPLATE = Template(Response(_SPEAK))
+
 
 class PlivoXMLService:
     """Generate Plivo XML responses for voice calls."""
 
     @staticmethod
-    def _escape_xml(text):
-        replacements = {"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&apos;"}
-        for char, replacement in replacements.items():
-            text = text.replace(char, replacement)
-        return text
+    def _prompt(message, voice=None, language=None, audio_url=None):
+        """The verb that delivers a message: Play for recorded audio, otherwise Speak."""
+        if audio_url:
+            return Play(audio_url)
+        return Speak(message, voice=voice, language=language)
 
     @staticmethod
-    def generate_menu_xml(message, timeout=None, max_digits=None, action_url="/api/handle-input"):
+    def generate_menu_xml(message, timeout=None, max_digits=None, action_url="/api/handle-input",
+                          voice=None, language=None, audio_url=None):
         if timeout is None:
             timeout = config.DEFAULT_TIMEOUT
         if max_digits is None:
             max_digits = 1
 
-        xml = (
-            '<Response>\n'
-            f'  <GetDigits action="{action_url}" timeout="{timeout}" numDigits="{max_digits}">\n'
-            f'    <Speak>{PlivoXMLService._escape_xml(message)}</Speak>\n'
-            '  </GetDigits>\n'
-            '</Response>'
+        if audio_url:
+            return Response(
+                GetDigits(Play(audio_url), action=action_url, timeout=timeout, num_digits=max_digits)
+            ).to_bytes()
+        return MENU_TEMPLATE.render(
+            message=message, voice=voice, language=language,
+            action_url=action_url, timeout=timeout, max_digits=max_digits,
         )
-        return xml
 
     @staticmethod
-    def generate_transfer_xml(phone_number, timeout=30, message=None):
-        if message:
-            xml = (
-                '<Response>\n'
-                f'  <Speak>{PlivoXMLService._escape_xml(message)}</Speak>\n'
-                f'  <Dial timeout="{timeout}">\n'
-                f'    <Number>{phone_number}</Number>\n'
-                '  </Dial>\n'
-                '</Response>'
-            )
-        else:
-            xml = (
-                '<Response>\n'
-                f'  <Dial timeout="{timeout}">\n'
-                f'    <Number>{phone_number}</Number>\n'
-                '  </Dial>\n'
-                '</Response>'
+    def generate_transfer_xml(phone_number, timeout=30, message=None, voice=None, language=None, audio_url=None):
+        """Dial one number, or several at once (first to answer is connected) when given a list."""
+        if isinstance(phone_number, str) and not audio_url:
+            template = SPEAK_TRANSFER_TEMPLATE if message else TRANSFER_TEMPLATE
+            return template.render(
+                message=message, voice=voice, language=language, phone_number=phone_number, timeout=timeout
             )
-        return xml
+
+        numbers = [phone_number] if isinstance(phone_number, str) else phone_number
+        verbs = []
+        if message or audio_url:
+            verbs.append(PlivoXMLService._prompt(message, voice, language, audio_url))
+        verbs.append(Dial(*[Number(number) for number in numbers], timeout=timeout))
+        return Response(*verbs).to_bytes()
 
     @staticmethod
-    def generate_hangup_xml(message=None):
-        if message:
-            xml = (
-                '<Response>\n'
-                f'  <Speak>{PlivoXMLService._escape_xml(message)}</Speak>\n'
-                '  <Hangup />\n'
-                '</Response>'
-            )
-        else:
-            xml = (
-                '<Response>\n'
-                '  <Hangup />\n'
-                '</Response>'
-            )
-        return xml
+    def generate_hangup_xml(message=None, voice=None, language=None, audio_url=None):
+        if not audio_url:
+            if not message:
+                return HANGUP_TEMPLATE.render()
+            return SPEAK_HANGUP_TEMPLATE.render(message=message, voice=voice, language=language)
+        return Response(Play(audio_url), Hangup()).to_bytes()
 
     @staticmethod
     def generate_invalid_input_xml(retry_count=None, max_retries=None):
@@ -83,13 +88,44 @@ class PlivoXMLService:
         return PlivoXMLService.generate_speak_only_xml(message)
 
     @staticmethod
-    def generate_speak_only_xml(message):
-        xml = (
-            '<Response>\n'
-            f'  <Speak>{PlivoXMLService._escape_xml(message)}</Speak>\n'
-            '</Response>'
-        )
-        return xml
+    def generate_speak_only_xml(message, voice=None, language=None):
+        return SPEAK_TEMPLATE.render(message=message, voice=voice, language=language)
+
+    @staticmethod
+    def prerender_menu_responses(menu, action_url):
+        """
+        Render the static responses for a menu as bytes.
+
+        Keys are (menu_id, action_type, variant). Menus whose response depends
+        on the caller (phone_readback) are left out and rendered per request.
+        """
+        action_type = menu.action_type or "menu"
+        prompt = {"voice": menu.voice, "language": menu.language, "audio_url": menu.audio_url}
+        responses = {}
+
+        if action_type == "transfer":
+            transfer_number = menu.action_config.get("transfer_number") if menu.action_config else None
+            if transfer_number:
+                responses[(menu.menu_id, action_type, "transfer")] = PlivoXMLService.generate_transfer_xml(
+                    phone_number=transfer_number,
+                    timeout=menu.action_config.get("timeout", 30),
+                    message=menu.message,
+                    **prompt,
+                )
+        elif action_type == "hangup":
+            responses[(menu.menu_id, action_type, "hangup")] = PlivoXMLService.generate_hangup_xml(
+                menu.message, **prompt
+            )
+        elif action_type != "phone_readback":
+            responses[(menu.menu_id, action_type, "prompt")] = PlivoXMLService.generate_menu_xml(
+                message=menu.message,
+                timeout=menu.timeout,
+                max_digits=menu.max_digits,
+                action_url=action_url,
+                **prompt,
+            )
+
+        return responses
 
 
 plivo_service = PlivoXMLService()
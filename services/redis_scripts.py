@@ -0,0 +1,289 @@
+"""
+Lua scripts run server-side by RedisSessionService.
+
+Each script does a multi-step session change atomically, in a single
+EVAL round trip. Upstash runs Lua through its REST API just like a TCP
+Redis does.
+"""
+
+# ===== JSON LAYOUT (one string key per session) =====
+
+# Append a digit press, optionally move to a new menu, refresh the TTL and
+# return the updated session.
+# KEYS[1] = session key
+# ARGV = menu_id, digit, timestamp, next_menu_id ('' to stay), ttl
+RECORD_DIGIT_SCRIPT = """
+local raw = redis.call('GET', KEYS[1])
+if not raw then
+    return nil
+end
+local session = cjson.decode(raw)
+session['user_inputs'] = session['user_inputs'] or {}
+table.insert(session['user_inputs'], {menu_id = ARGV[1], digit = ARGV[2], timestamp = ARGV[3]})
+if ARGV[4] ~= '' then
+    session['current_menu_id'] = ARGV[4]
+    session['menu_history'] = session['menu_history'] or {}
+    table.insert(session['menu_history'], ARGV[4])
+end
+session['last_activity'] = ARGV[3]
+local encoded = cjson.encode(session)
+redis.call('SET', KEYS[1], encoded, 'EX', tonumber(ARGV[5]))
+return encoded
+"""
+
+# Merge fields into the session, refresh the TTL and return the result.
+# KEYS[1] = session key
+# ARGV = JSON object of updates, ttl
+UPDATE_SESSION_SCRIPT = """
+local raw = redis.call('GET', KEYS[1])
+if not raw then
+    return nil
+end
+local session = cjson.decode(raw)
+for field, value in pairs(cjson.decode(ARGV[1])) do
+    session[field] = value
+end
+local encoded = cjson.encode(session)
+redis.call('SET', KEYS[1], encoded, 'EX', tonumber(ARGV[2]))
+return encoded
+"""
+
+# ===== HASH LAYOUT (hash for scalars, lists for inputs and history) =====
+# KEYS for every hash-layout script:
+#   KEYS[1] = <session key>:fields   hash of scalar fields
+#   KEYS[2] = <session key>:inputs   list of JSON-encoded input records
+#   KEYS[3] = <session key>:history  list of menu ids
+#   KEYS[4] = <session key>          legacy JSON string (migration source)
+# Scripts that return the session return {HGETALL, inputs, history}.
+
+_HASH_RESULT = """
+return {
+    redis.call('HGETALL', KEYS[1]),
+    redis.call('LRANGE', KEYS[2], 0, -1),
+    redis.call('LRANGE', KEYS[3], 0, -1),
+}
+"""
+
+_HASH_EXPIRE = """
+for i = 1, 3 do
+    redis.call('EXPIRE', KEYS[i], ttl)
+end
+"""
+
+# Read a session, converting a legacy JSON session to the hash layout first.
+# ARGV = ttl (used if the legacy key somehow has none)
+HASH_READ_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    local raw = redis.call('GET', KEYS[4])
+    if not raw then
+        return nil
+    end
+    local session = cjson.decode(raw)
+    for _, item in ipairs(session['user_inputs'] or {}) do
+        redis.call('RPUSH', KEYS[2], cjson.encode(item))
+    end
+    for _, menu_id in ipairs(session['menu_history'] or {}) do
+        redis.call('RPUSH', KEYS[3], menu_id)
+    end
+    session['user_inputs'] = nil
+    session['menu_history'] = nil
+    for field, value in pairs(session) do
+        if value ~= cjson.null then
+            redis.call('HSET', KEYS[1], field, tostring(value))
+        end
+    end
+    local ttl = redis.call('TTL', KEYS[4])
+    if ttl < 1 then
+        ttl = tonumber(ARGV[1])
+    end
+""" + _HASH_EXPIRE + """
+    redis.call('DEL', KEYS[4])
+end
+""" + _HASH_RESULT
+
+# Create a session, replacing anything stored under the same call.
+# ARGV = ttl, first menu id, field1, value1, field2, value2, ...
+HASH_CREATE_SCRIPT = """
+local ttl = tonumber(ARGV[1])
+redis.call('DEL', KEYS[1], KEYS[2], KEYS[3], KEYS[4])
+redis.call('HSET', KEYS[1], unpack(ARGV, 3))
+redis.call('RPUSH', KEYS[3], ARGV[2])
+""" + _HASH_EXPIRE + """
+return 1
+"""
+
+# Append a digit press and optionally move to a new menu.
+# ARGV = input record JSON, timestamp, next_menu_id ('' to stay), ttl
+HASH_RECORD_DIGIT_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return nil
+end
+local ttl = tonumber(ARGV[4])
+redis.call('RPUSH', KEYS[2], ARGV[1])
+if ARGV[3] ~= '' then
+    redis.call('HSET', KEYS[1], 'current_menu_id', ARGV[3], 'last_activity', ARGV[2])
+    redis.call('RPUSH', KEYS[3], ARGV[3])
+else
+    redis.call('HSET', KEYS[1], 'last_activity', ARGV[2])
+end
+""" + _HASH_EXPIRE + _HASH_RESULT
+
+# Update scalar fields, optionally replacing the input/history lists.
+# ARGV = ttl, inputs JSON array ('' to keep), history JSON array ('' to keep),
+#        field1, value1, field2, value2, ...
+HASH_UPDATE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return nil
+end
+local ttl = tonumber(ARGV[1])
+if ARGV[2] ~= '' then
+    redis.call('DEL', KEYS[2])
+    for _, item in ipairs(cjson.decode(ARGV[2])) do
+        redis.call('RPUSH', KEYS[2], cjson.encode(item))
+    end
+end
+if ARGV[3] ~= '' then
+    redis.call('DEL', KEYS[3])
+    for _, menu_id in ipairs(cjson.decode(ARGV[3])) do
+        redis.call('RPUSH', KEYS[3], menu_id)
+    end
+end
+if #ARGV > 3 then
+    redis.call('HSET', KEYS[1], unpack(ARGV, 4))
+end
+""" + _HASH_EXPIRE + _HASH_RESULT
+
+# ===== CALL RECORD QUEUE (write-behind hangup) =====
+
+# Remove a session (either layout) and queue it as a finalized call record.
+# KEYS[1..4] = hash-layout keys as above (JSON layout uses KEYS[4] only),
+# KEYS[5] = pending call record list, KEYS[6] = admission active calls set
+# ARGV = call_uuid, hangup_cause ('' if none), duration ('' if none), ended_at
+# Returns the session JSON, or nil if there was no session.
+FINALIZE_SESSION_SCRIPT = """
+redis.call('ZREM', KEYS[6], ARGV[1])
+local session
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    session = {}
+    local flat = redis.call('HGETALL', KEYS[1])
+    for i = 1, #flat, 2 do
+        session[flat[i]] = flat[i + 1]
+    end
+    local inputs = {}
+    for _, item in ipairs(redis.call('LRANGE', KEYS[2], 0, -1)) do
+        table.insert(inputs, cjson.decode(item))
+    end
+    session['user_inputs'] = inputs
+    session['menu_history'] = redis.call('LRANGE', KEYS[3], 0, -1)
+else
+    local raw = redis.call('GET', KEYS[4])
+    if not raw then
+        return nil
+    end
+    session = cjson.decode(raw)
+end
+session['state'] = 'completed'
+local record = {
+    call_uuid = ARGV[1],
+    session = session,
+    hangup_cause = ARGV[2],
+    duration = tonumber(ARGV[3]),
+    ended_at = ARGV[4],
+    attempts = 0,
+}
+redis.call('RPUSH', KEYS[5], cjson.encode(record))
+redis.call('DEL', KEYS[1], KEYS[2], KEYS[3], KEYS[4])
+return cjson.encode(session)
+"""
+
+# Move up to ARGV[1] records from the head of the pending list to the
+# processing list and return them.
+# KEYS[1] = pending list, KEYS[2] = processing list
+CLAIM_CALL_RECORDS_SCRIPT = """
+local items = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #items > 0 then
+    redis.call('LTRIM', KEYS[1], #items, -1)
+    redis.call('RPUSH', KEYS[2], unpack(items))
+end
+return items
+"""
+
+# Put everything left in the processing list (a flusher died mid-batch)
+# back at the head of the pending list, preserving order.
+# KEYS[1] = processing list, KEYS[2] = pending list
+RECOVER_CALL_RECORDS_SCRIPT = """
+local items = redis.call('LRANGE', KEYS[1], 0, -1)
+for i = #items, 1, -1 do
+    redis.call('LPUSH', KEYS[2], items[i])
+end
+redis.call('DEL', KEYS[1])
+return #items
+"""
+
+# ===== LOCKS =====
+
+# Release a lock only if it still holds this owner's token, so a flusher
+# whose lock expired can't delete the lock a second flusher now holds.
+# KEYS[1] = lock key, ARGV[1] = owner token
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Push a lock's expiry out to ARGV[2] seconds if this owner still holds it.
+# KEYS[1] = lock key, ARGV = owner token, ttl
+# Returns 1 if extended, 0 if the lock was lost.
+EXTEND_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], tonumber(ARGV[2]))
+end
+return 0
+"""
+
+# ===== ADMISSION CONTROL (see services/admission.py) =====
+
+# Admit or shed an incoming call in one round trip: a token bucket per
+# caller, then a ceiling on calls in progress. A call already admitted
+# (Plivo retrying the answer webhook) is let in again without a token.
+# Calls in the active set that never hung up drop out after call_ttl.
+# KEYS[1] = caller bucket hash, KEYS[2] = active calls sorted set
+#           (score = admitted at), KEYS[3] = shed counters hash
+# ARGV = call_uuid, now (seconds), rate (tokens/second, 0 = no caller
+#        limit), burst, max active calls (0 = no ceiling), call_ttl
+# Returns {1, ''} when admitted, {0, 'caller' | 'global'} when shed.
+ADMIT_CALL_SCRIPT = """
+local now = tonumber(ARGV[2])
+local rate = tonumber(ARGV[3])
+local burst = tonumber(ARGV[4])
+local max_active = tonumber(ARGV[5])
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now - tonumber(ARGV[6]))
+if redis.call('ZSCORE', KEYS[2], ARGV[1]) then
+    return {1, ''}
+end
+
+local tokens = burst
+if rate > 0 then
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    if bucket[1] then
+        tokens = math.min(burst, tonumber(bucket[1]) + math.max(0, now - tonumber(bucket[2])) * rate)
+    end
+    if tokens < 1 then
+        redis.call('HINCRBY', KEYS[3], 'caller', 1)
+        return {0, 'caller'}
+    end
+end
+
+if max_active > 0 and redis.call('ZCARD', KEYS[2]) >= max_active then
+    redis.call('HINCRBY', KEYS[3], 'global', 1)
+    return {0, 'global'}
+end
+
+if rate > 0 then
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens - 1), 'ts', ARGV[2])
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+end
+redis.call('ZADD', KEYS[2], now, ARGV[1])
+return {1, ''}
+"""
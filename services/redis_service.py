@@ -1,20 +1,58 @@
 """
 Redis Service for Vercel - Uses Upstash REST API.
 
-Unlike the local version that uses redis-py TCP connections,
-this uses the Upstash REST API which works in serverless environments.
-Vercel auto-configures KV_REST_API_URL and KV_REST_API_TOKEN when you
-connect Redis via the Storage tab.
+By default this uses the Upstash REST API, which works in serverless
+environments. Vercel auto-configures KV_REST_API_URL and KV_REST_API_TOKEN
+when you connect Redis via the Storage tab. With SESSION_BACKEND=redis the
+same service talks to any Redis over TCP through a pooled redis-py client
+(REDIS_URL), for long-running deployments where HTTPS per command is waste.
+
+Two storage layouts are supported (SESSION_STORAGE):
+- json: the whole session is one JSON string under ivr:session:<uuid>
+- hash: scalar fields live in a hash (ivr:session:<uuid>:fields), digit
+  presses and menu history in append-only lists (:inputs, :history), so
+  an update only touches the fields that changed. JSON sessions are
+  converted the first time they are read in hash mode.
 """
 
 import json
 import logging
+import time
+import uuid
 from datetime import datetime
-from upstash_redis import Redis
 from config import get_config
+from services import metrics
+from services.session_store import (
+    SessionStore,
+    BatchResult,
+    PENDING_CALLS_KEY,
+    PROCESSING_CALLS_KEY,
+    DEAD_CALLS_KEY,
+    ACTIVE_CALLS_KEY,
+    SHED_CALLS_KEY,
+    caller_bucket_key,
+)
+from services.redis_scripts import (
+    RECORD_DIGIT_SCRIPT,
+    UPDATE_SESSION_SCRIPT,
+    HASH_READ_SCRIPT,
+    HASH_CREATE_SCRIPT,
+    HASH_RECORD_DIGIT_SCRIPT,
+    HASH_UPDATE_SCRIPT,
+    FINALIZE_SESSION_SCRIPT,
+    CLAIM_CALL_RECORDS_SCRIPT,
+    RECOVER_CALL_RECORDS_SCRIPT,
+    RELEASE_LOCK_SCRIPT,
+    EXTEND_LOCK_SCRIPT,
+    ADMIT_CALL_SCRIPT,
+)
 
 logger = logging.getLogger(__name__)
 
+
+# Bumped whenever menus change; see services/menu_cache.py
+MENU_VERSION_KEY = "ivr:menus:version"
+
 # Lazy-initialized Redis client
 _redis_client = None
 
@@ -29,6 +67,8 @@ def _get_redis():
                 "KV_REST_API_URL and KV_REST_API_TOKEN not set. "
                 "Connect Redis via Vercel Storage tab."
             )
+        # Imported here so the redis and memory backends never pay for it
+        from upstash_redis import Redis
         _redis_client = Redis(
             url=config.KV_REST_API_URL,
             token=config.KV_REST_API_TOKEN,
@@ -36,14 +76,128 @@ def _get_redis():
     return _redis_client
 
 
-class RedisSessionService:
-    """Manage call sessions in Upstash Redis via REST API."""
+# Lazy-initialized redis-py client (SESSION_BACKEND=redis)
+_tcp_client = None
+
+
+def _get_tcp_redis():
+    """Get or create the pooled redis-py client, wrapped to look like Upstash's."""
+    global _tcp_client
+    if _tcp_client is None:
+        config = get_config()
+        if not config.REDIS_URL:
+            raise RuntimeError("REDIS_URL not set. It is required when SESSION_BACKEND=redis.")
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("SESSION_BACKEND=redis needs redis-py: pip install redis")
+
+        pool = redis.ConnectionPool.from_url(
+            config.REDIS_URL,
+            max_connections=config.REDIS_POOL_SIZE,
+            decode_responses=True,
+            socket_timeout=5,
+            socket_connect_timeout=5,
+            health_check_interval=30,
+        )
+        _tcp_client = TcpRedisClient(redis.Redis(connection_pool=pool))
+    return _tcp_client
+
+
+class TcpRedisClient:
+    """
+    Adapt a redis-py client to the Upstash client calls this module makes.
+
+    Only eval and multi differ: Upstash takes keys/args lists and runs
+    transactions with exec(). Scripts are registered once and sent as
+    EVALSHA afterwards. Every other command passes straight through.
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self._scripts = {}
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def _script(self, script):
+        registered = self._scripts.get(script)
+        if registered is None:
+            registered = self._scripts[script] = self._client.register_script(script)
+        return registered
+
+    def eval(self, script, keys=None, args=None):
+        return self._script(script)(keys=keys or [], args=args or [])
+
+    def multi(self):
+        return _TcpTransaction(self, self._client.pipeline(transaction=True))
+
+
+class _TcpTransaction:
+    """Upstash-style transaction (queue commands, then exec()) over a redis-py pipeline."""
+
+    def __init__(self, owner, pipeline):
+        self._owner = owner
+        self._pipeline = pipeline
+
+    def __getattr__(self, name):
+        return getattr(self._pipeline, name)
+
+    def eval(self, script, keys=None, args=None):
+        self._owner._script(script)(keys=keys or [], args=args or [], client=self._pipeline)
+        return self
+
+    def exec(self):
+        return self._pipeline.execute()
+
+
+class _TimedClient:
+    """Record every command sent through the client as a "redis" call (services/metrics.py)."""
+
+    __slots__ = ("_client",)
+
+    def __init__(self, client):
+        self._client = client
 
-    def __init__(self):
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name == "multi" or not callable(attr):
+            return attr  # a transaction only goes over the wire on exec(), timed by the caller
+
+        def call(*args, **kwargs):
+            with metrics.timed("redis"):
+                return attr(*args, **kwargs)
+        return call
+
+
+class RedisSessionService(SessionStore):
+    """Manage call sessions in Redis (Upstash REST API, or TCP with SESSION_BACKEND=redis)."""
+
+    def __init__(self, backend="upstash"):
         self.config = get_config()
+        self.backend = backend
+        self._hash_layout = self.config.SESSION_STORAGE == "hash"
 
     def _get_client(self):
-        return _get_redis()
+        client = _get_tcp_redis() if self.backend == "redis" else _get_redis()
+        return _TimedClient(client) if metrics.ENABLED else client
+
+    @staticmethod
+    def _session_key(call_uuid):
+        return f"ivr:session:{call_uuid}"
+
+    def _hash_keys(self, call_uuid):
+        key = self._session_key(call_uuid)
+        return [f"{key}:fields", f"{key}:inputs", f"{key}:history", key]
+
+    def _run(self, command, decode):
+        """Send one command now and decode its reply."""
+        name, args, kwargs = command
+        return decode(getattr(self._get_client(), name)(*args, **kwargs))
+
+    def batch(self):
+        """Collect session operations and send them as one MULTI/EXEC request."""
+        return SessionBatch(self)
 
     # ===== SESSION CRUD =====
 
@@ -61,81 +215,298 @@ class RedisSessionService:
             "state": "active",
         }
 
-        session_key = f"ivr:session:{call_uuid}"
-        client = self._get_client()
-        client.setex(session_key, self.config.SESSION_TTL, json.dumps(session_data))
+        self._run(*self._create_session_command(call_uuid, session_data))
 
         logger.info(f"Session created: {call_uuid}")
         return session_data
 
     def get_session(self, call_uuid):
         """Retrieve a session from Redis."""
-        session_key = f"ivr:session:{call_uuid}"
-        client = self._get_client()
-        session_json = client.get(session_key)
+        return self._run(*self._get_session_command(call_uuid))
 
-        if session_json is None:
-            logger.warning(f"Session not found: {call_uuid}")
-            return None
+    def get_session_fields(self, call_uuid, *names):
+        """
+        Fetch only the named scalar fields (e.g. current_menu_id) of a session.
 
-        # upstash-redis may return a string directly
-        if isinstance(session_json, str):
-            return json.loads(session_json)
-        return session_json
+        In hash mode this is a single HMGET that never transfers the input
+        and history lists. Returns None if the session doesn't exist.
+        """
+        if self._hash_layout:
+            client = self._get_client()
+            values = client.hmget(self._hash_keys(call_uuid)[0], *names)
+            if any(value is not None for value in values):
+                return dict(zip(names, values))
+            # Missing, or still in the JSON layout: a full read converts it
 
-    def update_session(self, call_uuid, updates):
-        """Update an existing session."""
         session = self.get_session(call_uuid)
         if session is None:
             return None
+        return {name: session.get(name) for name in names}
 
-        session.update(updates)
-        session["last_activity"] = datetime.utcnow().isoformat()
-
-        session_key = f"ivr:session:{call_uuid}"
-        client = self._get_client()
-        client.setex(session_key, self.config.SESSION_TTL, json.dumps(session))
-
+    def update_session(self, call_uuid, updates):
+        """Update an existing session."""
+        session = self._run(*self._update_session_command(call_uuid, updates))
+        if session is None and self._hash_layout and self.get_session(call_uuid) is not None:
+            # The session was still in the JSON layout; get_session converted it
+            session = self._run(*self._update_session_command(call_uuid, updates))
         return session
 
     def delete_session(self, call_uuid):
         """Delete a session (cleanup after call ends)."""
-        session_key = f"ivr:session:{call_uuid}"
-        client = self._get_client()
-        result = client.delete(session_key)
-        return result > 0 if isinstance(result, int) else bool(result)
+        return self._run(*self._delete_session_command(call_uuid))
 
     # ===== SESSION MANIPULATION =====
 
-    def add_user_input(self, call_uuid, menu_id, digit):
-        """Record a digit press."""
-        session = self.get_session(call_uuid)
-        if session is None:
-            return None
+    def record_digit(self, call_uuid, menu_id, digit, next_menu_id=None):
+        """
+        Record a digit press and optionally move to next_menu_id in one atomic step.
 
-        input_record = {
-            "menu_id": menu_id,
-            "digit": digit,
-            "timestamp": datetime.utcnow().isoformat(),
-        }
-        session["user_inputs"].append(input_record)
-        return self.update_session(call_uuid, {"user_inputs": session["user_inputs"]})
+        Replaces add_user_input + set_current_menu on the hot path: a single
+        EVAL instead of two read-modify-write cycles, so concurrent webhooks
+        for the same call can't overwrite each other.
+        """
+        return self._run(*self._record_digit_command(call_uuid, menu_id, digit, next_menu_id))
 
-    def set_current_menu(self, call_uuid, menu_id):
-        """Change the current menu for a call."""
-        session = self.get_session(call_uuid)
-        if session is None:
+    # ===== CALL RECORD QUEUE =====
+
+    def finalize_session(self, call_uuid, hangup_cause=None, duration=None):
+        """Atomically delete a session and queue it as a finalized call record."""
+        client = self._get_client()
+        session_json = client.eval(
+            FINALIZE_SESSION_SCRIPT,
+            keys=self._hash_keys(call_uuid) + [PENDING_CALLS_KEY, ACTIVE_CALLS_KEY],
+            args=[
+                call_uuid,
+                hangup_cause or "",
+                "" if duration is None else str(duration),
+                datetime.utcnow().isoformat(),
+            ],
+        )
+        if session_json is None:
             return None
+        return self._decode_json_session(session_json)
+
+    def claim_call_records(self, limit):
+        client = self._get_client()
+        items = client.eval(
+            CLAIM_CALL_RECORDS_SCRIPT,
+            keys=[PENDING_CALLS_KEY, PROCESSING_CALLS_KEY],
+            args=[str(limit)],
+        )
+        return [self._decode_call_record(item) for item in items or []]
+
+    def ack_call_records(self):
+        self._get_client().delete(PROCESSING_CALLS_KEY)
 
-        session["menu_history"].append(menu_id)
-        return self.update_session(call_uuid, {
-            "current_menu_id": menu_id,
-            "menu_history": session["menu_history"],
+    def requeue_call_records(self, records):
+        if records:
+            self._get_client().rpush(PENDING_CALLS_KEY, *[json.dumps(r) for r in records])
+
+    def dead_letter_call_records(self, records):
+        if records:
+            self._get_client().rpush(DEAD_CALLS_KEY, *[json.dumps(r) for r in records])
+
+    def recover_call_records(self):
+        client = self._get_client()
+        return client.eval(RECOVER_CALL_RECORDS_SCRIPT, keys=[PROCESSING_CALLS_KEY, PENDING_CALLS_KEY])
+
+    def replay_dead_call_records(self):
+        client = self._get_client()
+        dead = [self._decode_call_record(item) for item in client.lrange(DEAD_CALLS_KEY, 0, -1)]
+        for record in dead:
+            record["attempts"] = 0
+        self.requeue_call_records(dead)
+        client.ltrim(DEAD_CALLS_KEY, len(dead), -1)
+        return len(dead)
+
+    def call_queue_lengths(self):
+        transaction = self._get_client().multi()
+        transaction.llen(PENDING_CALLS_KEY)
+        transaction.llen(PROCESSING_CALLS_KEY)
+        transaction.llen(DEAD_CALLS_KEY)
+        with metrics.timed("redis"):
+            pending, processing, dead = transaction.exec()
+        return {"pending": pending, "processing": processing, "dead": dead}
+
+    def acquire_lock(self, name, ttl):
+        token = uuid.uuid4().hex
+        result = self._get_client().set(f"ivr:lock:{name}", token, nx=True, ex=ttl)
+        return token if result is True or result == "OK" else None
+
+    def extend_lock(self, name, token, ttl):
+        result = self._get_client().eval(EXTEND_LOCK_SCRIPT, keys=[f"ivr:lock:{name}"], args=[token, str(ttl)])
+        return int(result or 0) == 1
+
+    def release_lock(self, name, token):
+        self._get_client().eval(RELEASE_LOCK_SCRIPT, keys=[f"ivr:lock:{name}"], args=[token])
+
+    # ===== ADMISSION CONTROL =====
+
+    def admit_call(self, call_uuid, from_number, rate, burst, max_active, call_ttl):
+        """Token bucket for the caller plus the active-call ceiling, in one EVAL."""
+        return self._run(*self._admit_call_command(call_uuid, from_number, rate, burst, max_active, call_ttl))
+
+    def release_call(self, call_uuid):
+        self._run(*self._release_call_command(call_uuid))
+
+    def admission_stats(self):
+        transaction = self._get_client().multi()
+        transaction.zcard(ACTIVE_CALLS_KEY)
+        transaction.hmget(SHED_CALLS_KEY, "caller", "global")
+        with metrics.timed("redis"):
+            active, (caller, global_) = transaction.exec()
+        return {"active_calls": active, "shed": {"caller": int(caller or 0), "global": int(global_ or 0)}}
+
+    def _decode_call_record(self, item):
+        record = json.loads(item)
+        record["session"] = self._decode_json_session(record["session"])
+        record["hangup_cause"] = record.get("hangup_cause") or None
+        return record
+
+    # ===== COMMANDS =====
+    # Each builder returns ((method, args, kwargs), decode) so the same
+    # operation can be sent on its own or queued in a SessionBatch.
+
+    def _create_session_command(self, call_uuid, session_data):
+        if self._hash_layout:
+            fields = []
+            for name, value in session_data.items():
+                if name not in ("menu_history", "user_inputs"):
+                    fields += [name, value]
+            command = ("eval", (HASH_CREATE_SCRIPT,), {
+                "keys": self._hash_keys(call_uuid),
+                "args": [str(self.config.SESSION_TTL), session_data["current_menu_id"]] + fields,
+            })
+        else:
+            command = ("setex", (self._session_key(call_uuid), self.config.SESSION_TTL, json.dumps(session_data)), {})
+        return command, lambda result: session_data
+
+    def _get_session_command(self, call_uuid):
+        if self._hash_layout:
+            command = ("eval", (HASH_READ_SCRIPT,), {
+                "keys": self._hash_keys(call_uuid),
+                "args": [str(self.config.SESSION_TTL)],
+            })
+        else:
+            command = ("get", (self._session_key(call_uuid),), {})
+        return command, self._session_decoder(call_uuid)
+
+    def _update_session_command(self, call_uuid, updates):
+        updates = dict(updates)
+        updates["last_activity"] = datetime.utcnow().isoformat()
+
+        if not self._hash_layout:
+            command = ("eval", (UPDATE_SESSION_SCRIPT,), {
+                "keys": [self._session_key(call_uuid)],
+                "args": [json.dumps(updates), str(self.config.SESSION_TTL)],
+            })
+            return command, self._session_decoder(call_uuid)
+
+        user_inputs = updates.pop("user_inputs", None)
+        menu_history = updates.pop("menu_history", None)
+        fields = []
+        for name, value in updates.items():
+            fields += [name, value if isinstance(value, str) else json.dumps(value)]
+
+        command = ("eval", (HASH_UPDATE_SCRIPT,), {
+            "keys": self._hash_keys(call_uuid)[:3],
+            "args": [
+                str(self.config.SESSION_TTL),
+                json.dumps(user_inputs) if user_inputs is not None else "",
+                json.dumps(menu_history) if menu_history is not None else "",
+            ] + fields,
+        })
+        return command, self._session_decoder(call_uuid)
+
+    def _delete_session_command(self, call_uuid):
+        if self._hash_layout:
+            command = ("delete", tuple(self._hash_keys(call_uuid)), {})
+        else:
+            command = ("delete", (self._session_key(call_uuid),), {})
+        return command, lambda result: result > 0 if isinstance(result, int) else bool(result)
+
+    def _record_digit_command(self, call_uuid, menu_id, digit, next_menu_id):
+        timestamp = datetime.utcnow().isoformat()
+        if self._hash_layout:
+            input_record = json.dumps({"menu_id": menu_id, "digit": digit, "timestamp": timestamp})
+            command = ("eval", (HASH_RECORD_DIGIT_SCRIPT,), {
+                "keys": self._hash_keys(call_uuid)[:3],
+                "args": [input_record, timestamp, next_menu_id or "", str(self.config.SESSION_TTL)],
+            })
+        else:
+            command = ("eval", (RECORD_DIGIT_SCRIPT,), {
+                "keys": [self._session_key(call_uuid)],
+                "args": [menu_id, digit, timestamp, next_menu_id or "", str(self.config.SESSION_TTL)],
+            })
+        return command, self._session_decoder(call_uuid)
+
+    def _admit_call_command(self, call_uuid, from_number, rate, burst, max_active, call_ttl):
+        command = ("eval", (ADMIT_CALL_SCRIPT,), {
+            "keys": [caller_bucket_key(from_number), ACTIVE_CALLS_KEY, SHED_CALLS_KEY],
+            "args": [call_uuid, repr(time.time()), repr(float(rate)), str(burst), str(max_active), str(call_ttl)],
         })
+        return command, lambda result: (True, None) if int(result[0]) == 1 else (False, result[1])
+
+    def _release_call_command(self, call_uuid):
+        return ("zrem", (ACTIVE_CALLS_KEY, call_uuid), {}), lambda result: None
+
+    def _session_decoder(self, call_uuid):
+        """Return a function turning a raw reply into a session dict (or None)."""
+        def decode(result):
+            if result is None:
+                logger.warning(f"Session not found: {call_uuid}")
+                return None
+            if self._hash_layout:
+                return self._decode_hash_session(result)
+            return self._decode_json_session(result)
+        return decode
+
+    @staticmethod
+    def _decode_json_session(session_json):
+        # upstash-redis may return a string directly
+        session = json.loads(session_json) if isinstance(session_json, str) else session_json
+        # Lua's cjson encodes an empty list as {}; scripts may have rewritten one
+        for name in ("user_inputs", "menu_history"):
+            if session.get(name) == {}:
+                session[name] = []
+        return session
 
-    def mark_call_completed(self, call_uuid):
-        """Mark a call as completed."""
-        return self.update_session(call_uuid, {"state": "completed"})
+    @staticmethod
+    def _decode_hash_session(result):
+        """Turn a {HGETALL, inputs, history} script result into a session dict."""
+        flat_fields, inputs, history = result
+        session = dict(zip(flat_fields[::2], flat_fields[1::2]))
+        session["user_inputs"] = [json.loads(item) for item in inputs]
+        session["menu_history"] = list(history)
+        return session
+
+    # ===== GENERIC JSON KEYS =====
+
+    def set_json(self, key, data, ttl):
+        """Store a JSON-serializable value under key with a TTL in seconds."""
+        client = self._get_client()
+        client.setex(key, ttl, json.dumps(data))
+
+    def get_json(self, key):
+        """Return the value stored by set_json, or None if missing/expired."""
+        client = self._get_client()
+        value = client.get(key)
+        if value is None:
+            return None
+        return json.loads(value) if isinstance(value, str) else value
+
+    # ===== MENU VERSION =====
+
+    def get_menu_version(self):
+        """Return the shared menu version counter (0 if menus were never bumped)."""
+        client = self._get_client()
+        version = client.get(MENU_VERSION_KEY)
+        return int(version) if version is not None else 0
+
+    def bump_menu_version(self):
+        """Increment the menu version so every instance reloads its menu cache."""
+        client = self._get_client()
+        return client.incr(MENU_VERSION_KEY)
 
     # ===== HEALTH CHECK =====
 
@@ -150,13 +521,69 @@ class RedisSessionService:
             return False
 
 
-# Lazy singleton - created on first use
-_service_instance = None
+class SessionBatch:
+    """
+    Queue session operations and send them in one MULTI/EXEC request.
+
+        with session_batch() as batch:
+            session = batch.get_session(call_uuid)
+            batch.mark_call_completed(call_uuid)
+            batch.delete_session(call_uuid)
+        session.value  # available after the block
+
+    Operations run in order, atomically, when the block exits without an
+    exception. Their results are BatchResult objects.
+    """
 
+    def __init__(self, service):
+        self._service = service
+        self._queued = []
 
-def get_redis_service():
-    """Get the Redis service singleton."""
-    global _service_instance
-    if _service_instance is None:
-        _service_instance = RedisSessionService()
-    return _service_instance
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.execute()
+        else:
+            self._queued = []
+
+    def _queue(self, command, decode):
+        result = BatchResult()
+        self._queued.append((command, decode, result))
+        return result
+
+    def get_session(self, call_uuid):
+        return self._queue(*self._service._get_session_command(call_uuid))
+
+    def update_session(self, call_uuid, updates):
+        return self._queue(*self._service._update_session_command(call_uuid, updates))
+
+    def mark_call_completed(self, call_uuid):
+        return self.update_session(call_uuid, {"state": "completed"})
+
+    def record_digit(self, call_uuid, menu_id, digit, next_menu_id=None):
+        return self._queue(*self._service._record_digit_command(call_uuid, menu_id, digit, next_menu_id))
+
+    def delete_session(self, call_uuid):
+        return self._queue(*self._service._delete_session_command(call_uuid))
+
+    def release_call(self, call_uuid):
+        return self._queue(*self._service._release_call_command(call_uuid))
+
+    def execute(self):
+        """Send every queued operation in one request and fill in the results."""
+        queued, self._queued = self._queued, []
+        if not queued:
+            return []
+
+        transaction = self._service._get_client().multi()
+        for (name, args, kwargs), _, _ in queued:
+            getattr(transaction, name)(*args, **kwargs)
+        with metrics.timed("redis"):
+            replies = transaction.exec()
+
+        for (_, decode, result), reply in zip(queued, replies):
+            result.value = decode(reply)
+            result.ready = True
+        return [result.value for _, _, result in queued]
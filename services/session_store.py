@@ -0,0 +1,574 @@
+"""
+Session Store - Pluggable storage for IVR call sessions.
+
+Everything that reads or writes session state goes through a SessionStore.
+SESSION_BACKEND picks the implementation:
+- upstash: Upstash Redis over its REST API (default, works on Vercel)
+- redis:   redis-py over TCP with a persistent connection pool, for
+           long-running deployments (REDIS_URL, REDIS_POOL_SIZE)
+- memory:  in-process dict with TTL expiry, for local development and
+           single-process deployments; sessions die with the process
+"""
+
+import copy
+import logging
+from abc import ABC, abstractmethod
+import threading
+import time
+import uuid
+from datetime import datetime
+from config import get_config
+
+logger = logging.getLogger(__name__)
+
+# Write-behind call record queue (see services/call_log_writer.py)
+PENDING_CALLS_KEY = "ivr:calls:pending"
+PROCESSING_CALLS_KEY = "ivr:calls:processing"
+DEAD_CALLS_KEY = "ivr:calls:dead"
+
+# Admission control (see services/admission.py)
+ACTIVE_CALLS_KEY = "ivr:admission:active"
+SHED_CALLS_KEY = "ivr:admission:shed"
+
+
+def caller_bucket_key(from_number):
+    return f"ivr:admission:caller:{from_number}"
+
+
+class SessionStore(ABC):
+    """
+    Interface shared by every session backend. Backends must implement
+    every abstract method; a missing one fails at construction, not on
+    the first call that needs it.
+    """
+
+    # ===== SESSION CRUD =====
+
+    @abstractmethod
+    def create_session(self, call_uuid, from_number, to_number):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_session(self, call_uuid):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_session_fields(self, call_uuid, *names):
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_session(self, call_uuid, updates):
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_session(self, call_uuid):
+        raise NotImplementedError
+
+    # ===== SESSION MANIPULATION =====
+
+    @abstractmethod
+    def record_digit(self, call_uuid, menu_id, digit, next_menu_id=None):
+        raise NotImplementedError
+
+    def add_user_input(self, call_uuid, menu_id, digit):
+        """Record a digit press."""
+        return self.record_digit(call_uuid, menu_id, digit)
+
+    def set_current_menu(self, call_uuid, menu_id):
+        """Change the current menu for a call."""
+        session = self.get_session(call_uuid)
+        if session is None:
+            return None
+
+        session["menu_history"].append(menu_id)
+        return self.update_session(call_uuid, {
+            "current_menu_id": menu_id,
+            "menu_history": session["menu_history"],
+        })
+
+    def mark_call_completed(self, call_uuid):
+        """Mark a call as completed."""
+        return self.update_session(call_uuid, {"state": "completed"})
+
+    @abstractmethod
+    def batch(self):
+        """Return a context manager that groups operations into one round trip."""
+        raise NotImplementedError
+
+    # ===== CALL RECORD QUEUE =====
+    # Records are dicts: call_uuid, session, hangup_cause, duration,
+    # ended_at and attempts.
+
+    @abstractmethod
+    def finalize_session(self, call_uuid, hangup_cause=None, duration=None):
+        """
+        Atomically delete a session and queue it as a finalized call record.
+
+        Returns the session (state=completed), or None if it didn't exist.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def claim_call_records(self, limit):
+        """Move up to limit pending records to the processing list and return them."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def ack_call_records(self):
+        """Drop the processing list once its records are safely in Postgres."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def requeue_call_records(self, records):
+        """Put records back at the tail of the pending list."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def dead_letter_call_records(self, records):
+        """Park records that keep failing in the dead-letter list."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def recover_call_records(self):
+        """Return records stranded in the processing list to the pending list."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def replay_dead_call_records(self):
+        """Move every dead-lettered record back to the pending list."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def call_queue_lengths(self):
+        """Return {"pending": n, "processing": n, "dead": n}."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def acquire_lock(self, name, ttl):
+        """Take a named lock for ttl seconds. Returns an owner token, or None if it is held."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def extend_lock(self, name, token, ttl):
+        """Reset the lock's ttl if token still owns it. Returns False if the lock was lost."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def release_lock(self, name, token):
+        """Release the lock only if token still owns it."""
+        raise NotImplementedError
+
+    # ===== ADMISSION CONTROL =====
+
+    @abstractmethod
+    def admit_call(self, call_uuid, from_number, rate, burst, max_active, call_ttl):
+        """
+        Take a token from the caller's bucket (rate tokens/second, up to
+        burst) and a slot among at most max_active calls in progress, in one
+        atomic step. rate or max_active of 0 turns that limit off.
+
+        Returns (True, None) if admitted, (False, "caller" | "global") if shed.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def release_call(self, call_uuid):
+        """Free the call's slot among calls in progress."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def admission_stats(self):
+        """Return {"active_calls": n, "shed": {"caller": n, "global": n}}."""
+        raise NotImplementedError
+
+    # ===== GENERIC JSON KEYS =====
+
+    @abstractmethod
+    def set_json(self, key, data, ttl):
+        """Store a JSON-serializable value under key with a TTL in seconds."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_json(self, key):
+        """Return the value stored by set_json, or None if missing/expired."""
+        raise NotImplementedError
+
+    # ===== MENU VERSION =====
+
+    @abstractmethod
+    def get_menu_version(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def bump_menu_version(self):
+        raise NotImplementedError
+
+    # ===== HEALTH CHECK =====
+
+    @abstractmethod
+    def ping(self):
+        raise NotImplementedError
+
+
+class MemorySessionStore(SessionStore):
+    """Keep sessions in a process-local dict with TTL expiry."""
+
+    def __init__(self):
+        self.config = get_config()
+        self._data = {}  # key -> (expires_at or None, value)
+        self._lock = threading.RLock()
+
+    # ===== STORAGE PRIMITIVES =====
+
+    def _get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    def _set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        self._data[key] = (expires_at, value)
+
+    def _purge_expired(self):
+        now = time.monotonic()
+        for key in [k for k, (expires_at, _) in self._data.items() if expires_at is not None and expires_at <= now]:
+            del self._data[key]
+
+    @staticmethod
+    def _session_key(call_uuid):
+        return f"ivr:session:{call_uuid}"
+
+    # ===== SESSION CRUD =====
+
+    def create_session(self, call_uuid, from_number, to_number):
+        """Create a new call session with TTL."""
+        session_data = {
+            "call_uuid": call_uuid,
+            "from_number": from_number,
+            "to_number": to_number,
+            "current_menu_id": "main_menu",
+            "menu_history": ["main_menu"],
+            "user_inputs": [],
+            "start_time": datetime.utcnow().isoformat(),
+            "last_activity": datetime.utcnow().isoformat(),
+            "state": "active",
+        }
+        with self._lock:
+            self._purge_expired()
+            self._set(self._session_key(call_uuid), copy.deepcopy(session_data), self.config.SESSION_TTL)
+
+        logger.info(f"Session created: {call_uuid}")
+        return session_data
+
+    def get_session(self, call_uuid):
+        """Retrieve a session."""
+        with self._lock:
+            session = self._get(self._session_key(call_uuid))
+        if session is None:
+            logger.warning(f"Session not found: {call_uuid}")
+            return None
+        return copy.deepcopy(session)
+
+    def get_session_fields(self, call_uuid, *names):
+        """Fetch only the named fields of a session."""
+        with self._lock:
+            session = self._get(self._session_key(call_uuid))
+            if session is None:
+                return None
+            return {name: copy.deepcopy(session.get(name)) for name in names}
+
+    def update_session(self, call_uuid, updates):
+        """Update an existing session."""
+        with self._lock:
+            key = self._session_key(call_uuid)
+            session = self._get(key)
+            if session is None:
+                return None
+            session.update(copy.deepcopy(updates))
+            session["last_activity"] = datetime.utcnow().isoformat()
+            self._set(key, session, self.config.SESSION_TTL)
+            return copy.deepcopy(session)
+
+    def delete_session(self, call_uuid):
+        """Delete a session (cleanup after call ends)."""
+        with self._lock:
+            return self._data.pop(self._session_key(call_uuid), None) is not None
+
+    # ===== SESSION MANIPULATION =====
+
+    def record_digit(self, call_uuid, menu_id, digit, next_menu_id=None):
+        """Record a digit press and optionally move to next_menu_id."""
+        with self._lock:
+            key = self._session_key(call_uuid)
+            session = self._get(key)
+            if session is None:
+                logger.warning(f"Session not found: {call_uuid}")
+                return None
+            timestamp = datetime.utcnow().isoformat()
+            session["user_inputs"].append({"menu_id": menu_id, "digit": digit, "timestamp": timestamp})
+            if next_menu_id:
+                session["current_menu_id"] = next_menu_id
+                session["menu_history"].append(next_menu_id)
+            session["last_activity"] = timestamp
+            self._set(key, session, self.config.SESSION_TTL)
+            return copy.deepcopy(session)
+
+    def batch(self):
+        return MemorySessionBatch(self)
+
+    # ===== CALL RECORD QUEUE =====
+
+    def _list(self, key):
+        queue = self._get(key)
+        if queue is None:
+            queue = []
+            self._set(key, queue)
+        return queue
+
+    def finalize_session(self, call_uuid, hangup_cause=None, duration=None):
+        with self._lock:
+            self.release_call(call_uuid)
+            key = self._session_key(call_uuid)
+            # _get drops the session if its TTL has passed, as Redis would have
+            session = self._get(key)
+            if session is None:
+                return None
+            del self._data[key]
+            session["state"] = "completed"
+            self._list(PENDING_CALLS_KEY).append({
+                "call_uuid": call_uuid,
+                "session": copy.deepcopy(session),
+                "hangup_cause": hangup_cause,
+                "duration": duration,
+                "ended_at": datetime.utcnow().isoformat(),
+                "attempts": 0,
+            })
+            return session
+
+    def claim_call_records(self, limit):
+        with self._lock:
+            pending = self._list(PENDING_CALLS_KEY)
+            claimed = pending[:limit]
+            del pending[:limit]
+            self._list(PROCESSING_CALLS_KEY).extend(claimed)
+            return copy.deepcopy(claimed)
+
+    def ack_call_records(self):
+        with self._lock:
+            self._data.pop(PROCESSING_CALLS_KEY, None)
+
+    def requeue_call_records(self, records):
+        with self._lock:
+            self._list(PENDING_CALLS_KEY).extend(copy.deepcopy(records))
+
+    def dead_letter_call_records(self, records):
+        with self._lock:
+            self._list(DEAD_CALLS_KEY).extend(copy.deepcopy(records))
+
+    def recover_call_records(self):
+        with self._lock:
+            stranded = self._data.pop(PROCESSING_CALLS_KEY, (None, []))[1]
+            self._list(PENDING_CALLS_KEY)[:0] = stranded
+            return len(stranded)
+
+    def replay_dead_call_records(self):
+        with self._lock:
+            dead = self._data.pop(DEAD_CALLS_KEY, (None, []))[1]
+            for record in dead:
+                record["attempts"] = 0
+            self._list(PENDING_CALLS_KEY).extend(dead)
+            return len(dead)
+
+    def call_queue_lengths(self):
+        with self._lock:
+            return {
+                "pending": len(self._get(PENDING_CALLS_KEY) or []),
+                "processing": len(self._get(PROCESSING_CALLS_KEY) or []),
+                "dead": len(self._get(DEAD_CALLS_KEY) or []),
+            }
+
+    def acquire_lock(self, name, ttl):
+        with self._lock:
+            key = f"ivr:lock:{name}"
+            if self._get(key) is not None:
+                return None
+            token = uuid.uuid4().hex
+            self._set(key, token, ttl)
+            return token
+
+    def extend_lock(self, name, token, ttl):
+        with self._lock:
+            key = f"ivr:lock:{name}"
+            if self._get(key) != token:
+                return False
+            self._set(key, token, ttl)
+            return True
+
+    def release_lock(self, name, token):
+        with self._lock:
+            key = f"ivr:lock:{name}"
+            if self._get(key) == token:
+                del self._data[key]
+
+    # ===== ADMISSION CONTROL =====
+
+    def admit_call(self, call_uuid, from_number, rate, burst, max_active, call_ttl):
+        with self._lock:
+            now = time.monotonic()
+            active = self._get(ACTIVE_CALLS_KEY)
+            if active is None:
+                active = {}
+                self._set(ACTIVE_CALLS_KEY, active)
+            for stale in [call_uuid for call_uuid, admitted_at in active.items() if admitted_at <= now - call_ttl]:
+                del active[stale]
+            if call_uuid in active:
+                return True, None
+
+            tokens = burst
+            bucket_key = caller_bucket_key(from_number)
+            if rate > 0:
+                bucket = self._get(bucket_key)
+                if bucket is not None:
+                    tokens = min(burst, bucket[0] + max(0.0, now - bucket[1]) * rate)
+                if tokens < 1:
+                    return self._shed("caller")
+
+            if max_active > 0 and len(active) >= max_active:
+                return self._shed("global")
+
+            if rate > 0:
+                self._set(bucket_key, (tokens - 1, now), burst / rate + 1)
+            active[call_uuid] = now
+            return True, None
+
+    def _shed(self, reason):
+        shed = self._get(SHED_CALLS_KEY)
+        if shed is None:
+            shed = {}
+            self._set(SHED_CALLS_KEY, shed)
+        shed[reason] = shed.get(reason, 0) + 1
+        return False, reason
+
+    def release_call(self, call_uuid):
+        with self._lock:
+            (self._get(ACTIVE_CALLS_KEY) or {}).pop(call_uuid, None)
+
+    def admission_stats(self):
+        with self._lock:
+            shed = self._get(SHED_CALLS_KEY) or {}
+            return {
+                "active_calls": len(self._get(ACTIVE_CALLS_KEY) or {}),
+                "shed": {"caller": shed.get("caller", 0), "global": shed.get("global", 0)},
+            }
+
+    # ===== GENERIC JSON KEYS =====
+
+    def set_json(self, key, data, ttl):
+        with self._lock:
+            self._set(key, copy.deepcopy(data), ttl)
+
+    def get_json(self, key):
+        with self._lock:
+            return copy.deepcopy(self._get(key))
+
+    # ===== MENU VERSION =====
+
+    def get_menu_version(self):
+        with self._lock:
+            return self._get("ivr:menus:version") or 0
+
+    def bump_menu_version(self):
+        with self._lock:
+            version = (self._get("ivr:menus:version") or 0) + 1
+            self._set("ivr:menus:version", version)
+            return version
+
+    # ===== HEALTH CHECK =====
+
+    def ping(self):
+        return True
+
+
+class BatchResult:
+    """Placeholder for a batched reply; .value is filled in when the batch runs."""
+
+    def __init__(self):
+        self.value = None
+        self.ready = False
+
+
+class MemorySessionBatch:
+    """SessionBatch counterpart for MemorySessionStore: runs queued calls under one lock."""
+
+    def __init__(self, store):
+        self._store = store
+        self._queued = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.execute()
+        else:
+            self._queued = []
+
+    def _queue(self, method, *args):
+        result = BatchResult()
+        self._queued.append((method, args, result))
+        return result
+
+    def get_session(self, call_uuid):
+        return self._queue(self._store.get_session, call_uuid)
+
+    def update_session(self, call_uuid, updates):
+        return self._queue(self._store.update_session, call_uuid, updates)
+
+    def mark_call_completed(self, call_uuid):
+        return self._queue(self._store.mark_call_completed, call_uuid)
+
+    def record_digit(self, call_uuid, menu_id, digit, next_menu_id=None):
+        return self._queue(self._store.record_digit, call_uuid, menu_id, digit, next_menu_id)
+
+    def delete_session(self, call_uuid):
+        return self._queue(self._store.delete_session, call_uuid)
+
+    def release_call(self, call_uuid):
+        return self._queue(self._store.release_call, call_uuid)
+
+    def execute(self):
+        queued, self._queued = self._queued, []
+        with self._store._lock:
+            for method, args, result in queued:
+                result.value = method(*args)
+                result.ready = True
+        return [result.value for _, _, result in queued]
+
+
+# Lazy singleton - created on first use
+_store_instance = None
+
+
+def get_session_store():
+    """Get the session store singleton for the configured SESSION_BACKEND."""
+    global _store_instance
+    if _store_instance is None:
+        backend = get_config().SESSION_BACKEND
+        if backend == "memory":
+            _store_instance = MemorySessionStore()
+        elif backend in ("upstash", "redis"):
+            from services.redis_service import RedisSessionService
+            _store_instance = RedisSessionService(backend)
+        else:
+            raise RuntimeError(f"Unknown SESSION_BACKEND '{backend}'. Use upstash, redis or memory.")
+    return _store_instance
+
+
+def session_batch():
+    """Start a batch on the session store: ``with session_batch() as batch: ...``"""
+    return get_session_store().batch()